@@ -0,0 +1,138 @@
+"""
+Синтетический каталог: категории, производители, линейки и лист товаров в формате импорта
+(колонки как в Google Sheets, значения — строки). Всё детерминировано CatalogSpec: одна и та же
+спецификация даёт те же строки в генераторе (generate.py) и в заглушке Google Sheets прогона (run.py).
+"""
+import random
+import pandas as pd
+
+from itertools import accumulate
+from slugify import slugify
+
+CATEGORY_NAMES = (
+    "Ламинат", "Паркетная доска", "Виниловый пол", "Инженерная доска",
+    "Линолеум", "Ковровая плитка", "Пробковый пол", "Массивная доска",
+)
+BRANDS = (
+    "Kronotex", "Egger", "Quick-Step", "Tarkett", "Alpine Floor", "Classen", "Kaindl", "Pergo",
+    "Barlinek", "Haro", "Floorwood", "Aquafloor", "Fine Floor", "Berry Alloc", "Parador", "Wineo",
+)
+SERIES = ("Classic", "Dynamic", "Exquisit", "Robusto", "Impulse", "Premium", "Nature", "Grand", "Style", "Loft")
+COLORS = ("Дуб", "Орех", "Ясень", "Бук", "Клён", "Вишня", "Сосна", "Венге", "Тик", "Бетон")
+TONES = ("натуральный", "белёный", "дымчатый", "серый", "золотой", "тёмный", "медовый", "песочный")
+COUNTRIES = ("Германия", "Австрия", "Бельгия", "Польша", "Россия", "Китай")
+WORDS = (
+    "влагостойкий", "замковое", "соединение", "тиснение", "в", "регистр", "подходит", "для",
+    "кухни", "и", "прихожей", "износостойкость", "коммерческий", "класс", "тёплый", "пол",
+)
+
+# Лист генерируется блоками со своим генератором случайных чисел: блок не зависит от того,
+# какими пачками его читают, и совпадает при повторной генерации
+SHEET_BLOCK_SIZE = 1000
+# Каждая REVISION_STRIDE-я строка меняет цену в ревизии листа (1% товаров): так прогон
+# импортирует реальные изменения, а чётная ревизия возвращает каталог к исходному
+REVISION_STRIDE = 100
+# Доля популярных товаров (favorite)
+FAVORITE_SHARE = 0.05
+# Линейки неравные: вес линейки i — 1 / (i + LINE_SKEW), как у реальных каталогов с парой больших серий
+LINE_SKEW = 3
+
+
+class CatalogSpec:
+    """categories категорий × producers производителей × lines линеек, products товаров на весь каталог."""
+
+    __slots__ = ("categories", "producers", "lines", "products", "seed")
+
+    def __init__(self, categories: int, producers: int, lines: int, products: int, seed: int):
+        self.categories = categories
+        self.producers = producers
+        self.lines = lines
+        self.products = products
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def add_spec_arguments(parser):
+    parser.add_argument("--products", type=int, default=10000, help="товаров в каталоге (10k–1M)")
+    parser.add_argument("--categories", type=int, default=6, help="категорий")
+    parser.add_argument("--producers", type=int, default=8, help="производителей в категории")
+    parser.add_argument("--lines", type=int, default=10, help="линеек у производителя")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора")
+
+
+def spec_from_args(args) -> CatalogSpec:
+    return CatalogSpec(args.categories, args.producers, args.lines, args.products, args.seed)
+
+
+def _numbered(names: tuple, index: int) -> str:
+    # Имена из списка, после его конца — с номером: все имена уникальны
+    name = names[index % len(names)]
+    return name if index < len(names) else f"{name} {index // len(names) + 1}"
+
+
+def catalog_tree(spec: CatalogSpec) -> list:
+    """[(категория, [(производитель, [линейка, ...]), ...]), ...]; имена уникальны в своей таблице."""
+    tree = []
+    for c in range(spec.categories):
+        category = _numbered(CATEGORY_NAMES, c)
+        producers = []
+        for p in range(spec.producers):
+            # Набор брендов у категорий разный, как в жизни; производитель принадлежит одной категории
+            brand = BRANDS[(c * 3 + p) % len(BRANDS)]
+            if p >= len(BRANDS):
+                brand = f"{brand} {p // len(BRANDS) + 1}"
+            producer = f"{brand} {category}"
+            lines = [f"{producer} {_numbered(SERIES, line)}" for line in range(spec.lines)]
+            producers.append((producer, lines))
+        tree.append((category, producers))
+    return tree
+
+
+def line_names(spec: CatalogSpec) -> list:
+    return [line for _, producers in catalog_tree(spec) for _, lines in producers for line in lines]
+
+
+def _sheet_block(spec: CatalogSpec, block: int, lines: list, cum_weights: list, revision: int) -> pd.DataFrame:
+    rng = random.Random(f"{spec.seed}:{block}")
+    start = block * SHEET_BLOCK_SIZE
+    records = []
+    for index in range(start, min(start + SHEET_BLOCK_SIZE, spec.products)):
+        line = rng.choices(lines, cum_weights=cum_weights)[0]
+        color, tone = rng.choice(COLORS), rng.choice(TONES)
+        article = f"{index + 1:07d}"
+        name = f"{color} {tone} {article}"
+        price = rng.randrange(500, 6000)
+        if revision and index % REVISION_STRIDE == 0:
+            price += revision
+        stem = slugify(f"{line} {article}")
+        records.append({
+            "Наименование": name,
+            "Цена": str(price),
+            "Img": ", ".join(f"{stem}-{i}.webp" for i in range(1, rng.randint(2, 5))),
+            "Img_mini": f"{stem}.webp",
+            "is_favorite": "TRUE" if rng.random() < FAVORITE_SHARE else "FALSE",
+            "product_line": line,
+            "full_name": f"{line} {name}",
+            "Цвет": color,
+            "Класс": str(rng.randint(31, 34)),
+            "Толщина": str(rng.randint(7, 14)),
+            "Фаска": rng.choice(("Да", "Нет")),
+            "Страна": rng.choice(COUNTRIES),
+            "Описание": " ".join(rng.choices(WORDS, k=rng.randint(8, 30))).capitalize(),
+        })
+    return pd.DataFrame(records)
+
+
+def sheet_chunks(spec: CatalogSpec, revision: int = 0):
+    """Лист товаров пачками по SHEET_BLOCK_SIZE строк (как их режет dataframe_chunks)."""
+    lines = line_names(spec)
+    cum_weights = list(accumulate(1 / (i + LINE_SKEW) for i in range(len(lines))))
+    for block in range((spec.products + SHEET_BLOCK_SIZE - 1) // SHEET_BLOCK_SIZE):
+        yield _sheet_block(spec, block, lines, cum_weights, revision)
+
+
+def sheet_dataframe(spec: CatalogSpec, revision: int = 0) -> pd.DataFrame:
+    """Лист целиком — так его отдаёт get_google_sheet."""
+    return pd.concat(sheet_chunks(spec, revision), ignore_index=True)
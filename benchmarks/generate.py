@@ -0,0 +1,151 @@
+"""
+Генератор синтетического каталога для бенчмарков.
+
+Запуск из корня проекта (Postgres и Redis профиля bench: docker compose --profile bench up -d):
+    python benchmarks/generate.py [--products N] [--categories N] [--producers N] [--lines N] [--seed N]
+                                  [--orders N] [--users N] [--reset]
+
+Схема доводится миграциями. Категории, производители и линейки пишутся напрямую, товары — тем же
+кодом, что и импорт из Google Sheets (plan_chunk + apply_import_chunk): у них есть source_hash,
+search_text, счётчики и фасеты листингов, как у импортированных на проде. Заказы и пользователи
+засеваются SQL-ем на стороне базы. Параметры каталога должны совпадать с параметрами run.py.
+--reset  очистить каталог, заказы и пользователей перед генерацией (без него непустая база — ошибка)
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.settings import configure_environment, BENCH_USER_EMAIL, BENCH_USER_PASSWORD
+
+configure_environment()
+
+from slugify import slugify
+from sqlalchemy import select, func, text
+from sqlalchemy.orm import Session
+from database import engine, run_migrations
+from models import Category, Producer, ProductLine, Product, User
+from security import hash_password
+from utils.catalog_import import load_import_state, plan_chunk, apply_import_chunk
+from utils.product_utils import refresh_search_text, refresh_catalog_counts
+from benchmarks.catalog import add_spec_arguments, spec_from_args, catalog_tree, sheet_chunks
+
+RESET_TABLES = (
+    "order_items", "orders", "outbox_messages", "refresh_sessions", "users",
+    "product_images", "products", "product_lines", "producers", "categories",
+    "catalog_counts", "catalog_facets",
+)
+
+# Номера и время заказов — из номера строки, товары (1–4 позиции) — псевдослучайные из всего каталога
+ORDERS_SQL = """
+INSERT INTO orders (customer_phone, source, created_at, total_amount)
+SELECT
+    '+7900' || lpad((g * 7919 % 10000000)::text, 7, '0'),
+    CASE WHEN g % 4 = 0 THEN 'buy_now' ELSE 'cart' END,
+    to_char(timestamp '2026-01-01' + (g * 37 % 525600) * interval '1 minute', 'DD.MM.YYYY HH24:MI'),
+    0
+FROM generate_series(1, :orders) g;
+
+INSERT INTO order_items (order_id, product_id, quantity)
+SELECT o.id, :min_product_id + (o.id * 7919 + i * 104729) % :products, 1 + (o.id + i) % 3
+FROM orders o, generate_series(1, 1 + o.id % 4) i;
+
+UPDATE orders o SET total_amount = t.total, items_json = t.items
+FROM (
+    SELECT
+        oi.order_id, sum(oi.quantity * p.price) AS total,
+        jsonb_agg(jsonb_build_object('full_name', coalesce(p.full_name, p.name), 'quantity', oi.quantity, 'price', p.price)) AS items
+    FROM order_items oi JOIN products p ON p.id = oi.product_id
+    GROUP BY oi.order_id
+) t
+WHERE o.id = t.order_id;
+"""
+
+# Хеш один на всех: bcrypt на каждого пользователя занял бы минуты, а роуты его всё равно не проверяют
+USERS_SQL = """
+INSERT INTO users (name, email, hashed_password, is_admin)
+SELECT 'Покупатель ' || g, 'user' || g || '@bench.example.com', :hashed_password, false
+FROM generate_series(1, :users) g;
+"""
+
+
+def seed_tree(db: Session, spec) -> int:
+    """Категории, производители и линейки. Возвращает число линеек."""
+    lines_total = 0
+    for category_name, producers in catalog_tree(spec):
+        category = Category(name=category_name, slug=slugify(category_name))
+        db.add(category)
+        db.flush()
+        for producer_name, lines in producers:
+            producer = Producer(name=producer_name, slug=slugify(producer_name), category_id=category.id)
+            db.add(producer)
+            db.flush()
+            db.add_all(ProductLine(name=line, slug=slugify(line), producer_id=producer.id) for line in lines)
+            lines_total += len(lines)
+    db.flush()
+    return lines_total
+
+
+def seed_products(db: Session, spec) -> int:
+    """Товары через код импорта, пачками как в run_import_job."""
+    plan = load_import_state(db)
+    progress_step = max(spec.products // 10, 1)
+    next_progress = progress_step
+    for df in sheet_chunks(spec):
+        apply_import_chunk(db, plan, plan_chunk(db, plan, df))
+        if plan.rows_total >= next_progress:
+            print(f"   {plan.rows_total}/{spec.products}")
+            next_progress += progress_step
+    if plan.errors:
+        sys.exit(f"❌ Ошибки в сгенерированном листе: {plan.errors[:5]}")
+
+    refresh_search_text(db)
+    refresh_catalog_counts(db)
+    return plan.rows_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетический каталог, заказы и пользователи для бенчмарков")
+    add_spec_arguments(parser)
+    parser.add_argument("--orders", type=int, default=20000, help="заказов")
+    parser.add_argument("--users", type=int, default=5000, help="пользователей, кроме пользователя прогона")
+    parser.add_argument("--reset", action="store_true", help="очистить таблицы перед генерацией")
+    args = parser.parse_args()
+    spec = spec_from_args(args)
+
+    print(f"База: {engine.url.render_as_string(hide_password=True)}")
+    run_migrations()
+
+    started = time.perf_counter()
+    with Session(engine) as db:
+        if args.reset:
+            db.execute(text(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE"))
+        elif db.scalar(select(Product.id).limit(1)) is not None:
+            sys.exit("❌ В базе уже есть товары: запустите с --reset")
+
+        lines_total = seed_tree(db, spec)
+        print(f"✅ Категорий: {spec.categories}, производителей: {spec.categories * spec.producers}, линеек: {lines_total}")
+
+        products_total = seed_products(db, spec)
+        print(f"✅ Товаров: {products_total} ({time.perf_counter() - started:.1f} с)")
+
+        if args.orders:
+            min_product_id = db.scalar(select(func.min(Product.id)))
+            db.execute(text(ORDERS_SQL), {"orders": args.orders, "min_product_id": min_product_id, "products": products_total})
+        hashed_password = hash_password(BENCH_USER_PASSWORD)
+        db.add(User(name="Bench", email=BENCH_USER_EMAIL, hashed_password=hashed_password, is_admin=False))
+        if args.users:
+            db.execute(text(USERS_SQL), {"users": args.users, "hashed_password": hashed_password})
+        db.commit()
+        print(f"✅ Заказов: {args.orders}, пользователей: {args.users + 1}")
+
+    # Планы первого прогона не должны зависеть от того, успел ли autovacuum
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE"))
+    print(f"✅ Готово за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
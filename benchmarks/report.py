@@ -0,0 +1,134 @@
+"""
+Отчёт прогона: p50/p95/p99 задержки и число запросов к БД на запрос по сценариям,
+сравнение с базовой линией (benchmarks/baseline.json).
+
+Число запросов к БД от машины не зависит и сравнивается строго: любой рост — регрессия.
+Задержка — с допуском tolerance и только с той же конфигурацией прогона (каталог, число
+запросов, режимы кеша): базовую линию стоит записывать на той же машине, где её проверяют.
+"""
+import json
+import math
+import platform
+
+from datetime import datetime, timezone
+
+# Задержка — регрессия, только если выросла и больше чем на tolerance, и больше чем на столько миллисекунд:
+# у роутов в доли миллисекунды относительный шум больше любого разумного допуска
+LATENCY_MIN_DELTA_MS = 2.0
+COMPARED_LATENCIES = ("p50_ms", "p95_ms")
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Перцентиль методом ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class ScenarioResult:
+    """Замеры одного сценария: задержка и число запросов к БД каждого запроса, статусы ответов."""
+
+    def __init__(self, name: str, group: str):
+        self.name = name
+        self.group = group
+        self.latencies = []
+        self.queries = []
+        self.statuses = {}
+        self.errors = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds: float, queries: int, status: int, ok: bool):
+        self.latencies.append(seconds)
+        self.queries.append(queries)
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        self.errors += not ok
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            "group": self.group,
+            "requests": count,
+            "errors": self.errors,
+            "statuses": dict(sorted(self.statuses.items())),
+            "rps": round(count / self.seconds, 1) if self.seconds else 0.0,
+            "mean_ms": round(sum(latencies) / count * 1000, 2) if count else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2) if count else 0.0,
+            "queries_mean": round(sum(self.queries) / count, 2) if count else 0.0,
+            "queries_max": max(self.queries, default=0),
+        }
+
+
+def build_report(config: dict, summaries: dict) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.machine()},
+        "config": config,
+        "scenarios": summaries,
+    }
+
+
+def format_header() -> str:
+    return (
+        f"{'сценарий':<22}{'запросов':>9}{'ошибок':>8}{'rps':>9}"
+        f"{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}{'SQL/запрос':>12}{'SQL max':>9}"
+    )
+
+
+def format_row(name: str, summary: dict) -> str:
+    return (
+        f"{name:<22}{summary['requests']:>9}{summary['errors']:>8}{summary['rps']:>9}"
+        f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['max_ms']:>10}"
+        f"{summary['queries_mean']:>12}{summary['queries_max']:>9}"
+    )
+
+
+def load_report(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_report(path: str, report: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def config_differences(report: dict, baseline: dict) -> list:
+    current, previous = report["config"], baseline["config"]
+    return [
+        f"{key}: {previous.get(key)!r} -> {current.get(key)!r}"
+        for key in sorted(set(current) | set(previous)) if current.get(key) != previous.get(key)
+    ]
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> tuple:
+    """
+    (регрессии, улучшения) — строки для вывода. Задержка сравнивается, только если конфигурация
+    прогона совпадает с базовой; сценарии, которых нет в одном из отчётов, пропускаются.
+    """
+    compare_latency = not config_differences(report, baseline)
+    regressions, improvements = [], []
+    for name, current in report["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+
+        if current["queries_mean"] > previous["queries_mean"]:
+            regressions.append(f"{name}: SQL/запрос {previous['queries_mean']} -> {current['queries_mean']}")
+        elif current["queries_mean"] < previous["queries_mean"]:
+            improvements.append(f"{name}: SQL/запрос {previous['queries_mean']} -> {current['queries_mean']}")
+
+        if not compare_latency:
+            continue
+        for key in COMPARED_LATENCIES:
+            before, after = previous[key], current[key]
+            if after > before * (1 + tolerance) and after - before > LATENCY_MIN_DELTA_MS:
+                regressions.append(f"{name}: {key} {before} -> {after} (x{after / before:.2f})")
+            elif after < before * (1 - tolerance) and before - after > LATENCY_MIN_DELTA_MS:
+                improvements.append(f"{name}: {key} {before} -> {after} (x{after / before:.2f})")
+    return regressions, improvements
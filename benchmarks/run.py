@@ -0,0 +1,285 @@
+"""
+Прогон бенчмарков: роуты routers/products.py, routers/auth.py и routers/order.py против приложения
+в этом же процессе (httpx.ASGITransport, со startup/shutdown приложения), Telegram — локальная заглушка,
+Google Sheets — синтетический лист того же каталога.
+
+Запуск из корня проекта, после benchmarks/generate.py с теми же параметрами каталога:
+    python benchmarks/run.py [--products N ...] [--scenarios имя,группа,шаблон*] [--requests 200]
+                             [--concurrency 8] [--warmup 20] [--import-runs 2] [--output отчёт.json]
+                             [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.25]
+
+По каждому сценарию печатаются p50/p95/p99 и число SQL-запросов на запрос. Если базовая линия есть,
+отчёт сравнивается с ней (см. report.py): код выхода 1 при регрессии или ошибочных ответах.
+--save-baseline  записать отчёт базовой линией (на машине, где её потом проверяют)
+Импорт (upload_google, upload_file) меряется до конца фоновой задачи: ревизии листа чередуются и меняют
+цену у 1% товаров, так что после прогона каталог прежний. Созданные прогоном пользователи и заказы удаляются.
+"""
+import argparse
+import asyncio
+import fnmatch
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.settings import configure_environment, TELEGRAM_STUB_PORT
+
+configure_environment()
+
+import httpx
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event, select, func, delete
+import main
+from database import engine, async_engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from models import Product, ProductLine, Order, OrderItem, OutboxMessage, User, RefreshSession
+from routers import products as products_router
+from utils import cache, catalog_snapshot, password_pool, refresh_sessions
+from utils.import_jobs import IMPORT_LOCK_KEY
+from utils.outbox import MESSAGE_SEPARATOR
+from utils.query_budget import QueryCounter
+from benchmarks.catalog import add_spec_arguments, spec_from_args, sheet_chunks, sheet_dataframe
+from benchmarks.report import (
+    ScenarioResult, build_report, format_header, format_row, load_report, save_report, config_differences, compare,
+)
+from benchmarks.scenarios import SCENARIOS, SHEET_REVISION_RE, load_context
+from benchmarks.telegram_stub import TelegramStub
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+IMPORT_REVISIONS = (0, 1)
+
+# Счётчик SQL текущего запроса прогона. Фоновая задача импорта наследует контекст запроса,
+# поэтому её запросы попадают в тот же счётчик
+_request_counter: ContextVar[Optional[QueryCounter]] = ContextVar("bench_query_counter", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _request_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _count_query)
+
+
+def select_scenarios(patterns: list) -> list:
+    if not patterns:
+        return SCENARIOS
+    return [
+        scenario for scenario in SCENARIOS
+        if any(scenario.group == pattern or fnmatch.fnmatch(scenario.name, pattern) for pattern in patterns)
+    ]
+
+
+def check_catalog(spec):
+    """Прогон осмыслен только на каталоге, который generate.py построил с теми же параметрами."""
+    with engine.connect() as conn:
+        products = conn.scalar(select(func.count(Product.id)))
+        lines = conn.scalar(select(func.count(ProductLine.id)))
+    expected_lines = spec.categories * spec.producers * spec.lines
+    if (products, lines) != (spec.products, expected_lines):
+        sys.exit(
+            f"❌ В базе {products} товаров и {lines} линеек, а параметры прогона — {spec.products} и {expected_lines}: "
+            f"запустите benchmarks/generate.py --reset с теми же параметрами"
+        )
+
+
+def run_marks() -> dict:
+    """Последние id до прогона: всё, что больше, создал прогон."""
+    with engine.connect() as conn:
+        return {
+            "order": conn.scalar(select(func.coalesce(func.max(Order.id), 0))),
+            "outbox": conn.scalar(select(func.coalesce(func.max(OutboxMessage.id), 0))),
+        }
+
+
+def cleanup(ctx, marks: dict):
+    with engine.begin() as conn:
+        conn.execute(delete(OrderItem).where(OrderItem.order_id > marks["order"]))
+        conn.execute(delete(Order).where(Order.id > marks["order"]))
+        conn.execute(delete(OutboxMessage).where(OutboxMessage.id > marks["outbox"]))
+        conn.execute(delete(RefreshSession).where(RefreshSession.user_id == ctx.user_id))
+        conn.execute(delete(User).where(User.email.like(f"bench-{ctx.run_id}-%")))
+
+
+def write_sheet_files(spec, directory: str) -> dict:
+    """CSV листа каждой ревизии для /upload_file."""
+    files = {}
+    for revision in IMPORT_REVISIONS:
+        path = os.path.join(directory, f"catalog-rev{revision}.csv")
+        for index, df in enumerate(sheet_chunks(spec, revision)):
+            df.to_csv(path, mode="a", header=index == 0, index=False)
+        files[revision] = path
+    return files
+
+
+def stub_google_sheets(spec):
+    """get_google_sheet отдаёт синтетический лист ревизии из адреса таблицы, без сети."""
+    sheets = {revision: sheet_dataframe(spec, revision) for revision in IMPORT_REVISIONS}
+    products_router.get_google_sheet = lambda sheet_url: sheets[int(SHEET_REVISION_RE.search(sheet_url).group(1))]
+
+
+async def send(client: httpx.AsyncClient, request: dict, scenario) -> tuple:
+    """(статус, ответ ожидаемый). Тело читается как есть, без распаковки: её делал бы браузер, а не сервер."""
+    if scenario.settle:
+        response = await client.request(**request)
+        ok = response.status_code in scenario.expected and await scenario.settle(client, response)
+        return response.status_code, ok
+    async with client.stream(**request) as response:
+        async for _ in response.aiter_raw():
+            pass
+    return response.status_code, response.status_code in scenario.expected
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario, ctx, args) -> ScenarioResult:
+    rng = random.Random(f"{args.seed}:{scenario.name}")
+    if scenario.settle:
+        warmup, concurrency = 0, 1
+        requests = await scenario.build(ctx, rng, args.import_runs)
+    else:
+        count = min(args.requests, scenario.max_requests or args.requests)
+        warmup, concurrency = min(args.warmup, count), args.concurrency
+        requests = await scenario.build(ctx, rng, warmup + count)
+
+    for request in requests[:warmup]:
+        await send(client, request, scenario)
+
+    result = ScenarioResult(scenario.name, scenario.group)
+    pending = iter(requests[warmup:])
+
+    async def worker():
+        for request in pending:
+            counter = QueryCounter()
+            _request_counter.set(counter)
+            started = time.perf_counter()
+            status, ok = await send(client, request, scenario)
+            result.observe(time.perf_counter() - started, counter.count, status, ok)
+            _request_counter.set(None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+async def run(args, spec, scenarios: list, telegram_stub: TelegramStub) -> dict:
+    summaries = {}
+    await main.app.router.startup()
+    try:
+        ctx = await load_context()
+        marks = run_marks()
+        # Лок импорта мог остаться от прерванного прогона
+        await cache.redis_client.delete(IMPORT_LOCK_KEY)
+
+        with tempfile.TemporaryDirectory(prefix="bench_") as directory:
+            if any(scenario.name == "upload_file" for scenario in scenarios):
+                ctx.sheet_files = write_sheet_files(spec, directory)
+            if any(scenario.name == "upload_google" for scenario in scenarios):
+                stub_google_sheets(spec)
+
+            # Исключение роута — ответ 500 и ошибка сценария, а не конец прогона
+            transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", timeout=None,
+                headers={"Accept-Encoding": args.accept_encoding},
+            ) as client:
+                print(format_header())
+                for scenario in scenarios:
+                    summaries[scenario.name] = (await run_scenario(client, scenario, ctx, args)).summary()
+                    print(format_row(scenario.name, summaries[scenario.name]))
+    finally:
+        await main.app.router.shutdown()
+
+    pending = 0
+    if "order" in summaries:
+        with engine.connect() as conn:
+            pending = conn.scalar(select(func.count(OutboxMessage.id)).where(OutboxMessage.id > marks["outbox"], OutboxMessage.sent_at.is_(None)))
+        print(f"\nЗаглушка Telegram: уведомлений {telegram_stub.messages} в {telegram_stub.requests} сообщениях, не отправлено: {pending}")
+    cleanup(ctx, marks)
+    return summaries
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Бенчмарк роутов каталога, входа и заказов")
+    add_spec_arguments(parser)
+    parser.add_argument("--scenarios", default="", help="через запятую: имена сценариев, группы (products, auth, order, import) или шаблоны")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8, help="одновременных запросов")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов прогрева на сценарий, не входят в замер")
+    parser.add_argument("--import-runs", type=int, default=2, help="импортов на сценарий импорта (округляется до чётного)")
+    parser.add_argument("--accept-encoding", default="br, gzip", help="Accept-Encoding запросов")
+    parser.add_argument("--telegram-latency", type=float, default=50, help="задержка ответа заглушки Telegram, мс")
+    parser.add_argument("--output", help="записать отчёт в JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="базовая линия для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="записать отчёт базовой линией")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p50/p95 (0.25 = 25%%)")
+    args = parser.parse_args()
+    spec = spec_from_args(args)
+
+    scenarios = select_scenarios([pattern.strip() for pattern in args.scenarios.split(",") if pattern.strip()])
+    if not scenarios:
+        sys.exit(f"❌ Нет сценариев по «{args.scenarios}», есть: {', '.join(scenario.name for scenario in SCENARIOS)}")
+
+    # Приложение пишет INFO на каждый старт подсистемы; в отчёте нужны только предупреждения
+    logging.getLogger().setLevel(logging.WARNING)
+    check_catalog(spec)
+
+    telegram_stub = TelegramStub(TELEGRAM_STUB_PORT, args.telegram_latency / 1000, MESSAGE_SEPARATOR)
+    telegram_stub.start()
+    try:
+        summaries = asyncio.run(run(args, spec, scenarios, telegram_stub))
+    finally:
+        telegram_stub.stop()
+
+    report = build_report({
+        "catalog": spec.as_dict(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+        "import_runs": args.import_runs,
+        "accept_encoding": args.accept_encoding,
+        "response_cache": cache.ENABLE_RESPONSE_CACHE,
+        "conditional_get": cache.ENABLE_CONDITIONAL_GET,
+        "catalog_snapshot": catalog_snapshot.ENABLE_CATALOG_SNAPSHOT,
+        "refresh_session_store": refresh_sessions.REFRESH_SESSION_STORE,
+        "bcrypt_rounds": password_pool.BCRYPT_ROUNDS,
+        "password_hash_workers": password_pool.PASSWORD_HASH_WORKERS,
+        "db_pool": f"{DB_POOL_SIZE}+{DB_MAX_OVERFLOW}",
+    }, summaries)
+    if args.output:
+        save_report(args.output, report)
+
+    failed = [name for name, summary in summaries.items() if summary["errors"]]
+    if failed:
+        statuses = ", ".join(f"{name} {summaries[name]['statuses']}" for name in failed)
+        print(f"\n❌ Ошибочные ответы: {statuses}")
+
+    if args.save_baseline:
+        save_report(args.baseline, report)
+        print(f"\n✅ Базовая линия записана: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        baseline = load_report(args.baseline)
+        differences = config_differences(report, baseline)
+        if differences:
+            print(f"\n⚠️ Конфигурация отличается от базовой, задержка не сравнивается: {'; '.join(differences)}")
+        regressions, improvements = compare(report, baseline, args.tolerance)
+        for line in improvements:
+            print(f"⬇️ {line}")
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            failed.append("regressions")
+        else:
+            print(f"\n✅ Регрессий относительно {baseline['created_at']} нет")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
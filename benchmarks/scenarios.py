@@ -0,0 +1,376 @@
+"""
+Сценарии прогона: по одному на каждый роут routers/products.py, routers/auth.py и routers/order.py
+(у листингов — несколько, под разные пути paginate_and_sort_products). Сценарий строит список запросов
+заранее, из засеянной базы и своего генератора случайных чисел: одинаковые параметры прогона дают
+одинаковые запросы. Подготовка (токены, файлы импорта) в замер не входит.
+"""
+import re
+import uuid
+import asyncio
+
+from collections import namedtuple
+from sqlalchemy import select, func
+from database import AsyncSessionLocal
+from models import Category, Producer, ProductLine, Product, User, CatalogCount, CatalogFacet
+from security import create_access_token, create_refresh_token
+from utils import refresh_sessions
+from utils.import_jobs import _update_job
+from utils.product_utils import encode_cursor, PRODUCT_LOOKUP_MAX_IDS
+from benchmarks.settings import BENCH_USER_EMAIL, BENCH_USER_PASSWORD
+
+# Сколько товаров каталога прогон знает по slug-ам и id (равномерно по id)
+PRODUCT_SAMPLE_SIZE = 2000
+LISTING_LIMIT = 12
+LARGE_PAGE_LIMIT = 500
+LOOKUP_IDS = min(10, PRODUCT_LOOKUP_MAX_IDS)
+IMPORT_POLL_INTERVAL = 0.05
+# Ревизия листа — в его адресе: заглушка get_google_sheet отдаёт лист этой ревизии
+SHEET_URL = "https://docs.google.com/spreadsheets/d/bench-rev{revision}/edit"
+SHEET_REVISION_RE = re.compile(r"/d/bench-rev(\d+)")
+
+SampleProduct = namedtuple("SampleProduct", "id name price favorite full_name slug category_slug producer_slug")
+
+
+class BenchContext:
+    """Что сценариям нужно знать о засеянной базе."""
+
+    def __init__(self, products: list, producers: list, category_totals: dict, facets: dict, user_id: int):
+        self.products = products
+        self.producers = producers
+        self.category_totals = category_totals
+        # category_slug -> {характеристика: [значения]}
+        self.facets = facets
+        self.user_id = user_id
+        self.run_id = uuid.uuid4().hex[:8]
+        # Файлы для /upload_file по ревизиям листа, готовит run.py
+        self.sheet_files = {}
+
+    @property
+    def categories(self) -> list:
+        return list(self.category_totals)
+
+    @property
+    def favorites(self) -> list:
+        return [product for product in self.products if product.favorite] or self.products
+
+
+async def load_context() -> BenchContext:
+    async with AsyncSessionLocal() as db:
+        user_id = await db.scalar(select(User.id).where(User.email == BENCH_USER_EMAIL))
+        total = await db.scalar(select(func.count(Product.id)))
+        step = max(total // PRODUCT_SAMPLE_SIZE, 1)
+        products = [
+            SampleProduct(*row) for row in await db.execute(
+                select(
+                    Product.id, Product.name, Product.price, Product.favorite, Product.full_name, Product.slug,
+                    Category.slug, Producer.slug,
+                )
+                .join(ProductLine, Product.product_line_id == ProductLine.id)
+                .join(Producer, ProductLine.producer_id == Producer.id)
+                .join(Category, Producer.category_id == Category.id)
+                .where(Product.id % step == 0)
+                .order_by(Product.id)
+            )
+        ]
+        producers = (await db.execute(
+            select(CatalogCount.category_slug, CatalogCount.producer_slug)
+            .where(CatalogCount.scope == "producer")
+            .order_by(CatalogCount.category_slug, CatalogCount.producer_slug)
+        )).all()
+        category_totals = dict((await db.execute(
+            select(CatalogCount.category_slug, CatalogCount.total)
+            .where(CatalogCount.scope == "category")
+            .order_by(CatalogCount.category_slug)
+        )).all())
+        facets = {}
+        for category_slug, attribute, value in await db.execute(
+            select(CatalogFacet.category_slug, CatalogFacet.attribute, CatalogFacet.value)
+            .where(CatalogFacet.producer_slug == "")
+            .order_by(CatalogFacet.category_slug, CatalogFacet.attribute, CatalogFacet.value)
+        ):
+            facets.setdefault(category_slug, {}).setdefault(attribute, []).append(value)
+
+    if user_id is None or not products:
+        raise RuntimeError("В базе нет синтетического каталога: запустите benchmarks/generate.py")
+    return BenchContext(products, producers, category_totals, facets, user_id)
+
+
+def _get(url: str, **params) -> dict:
+    return {"method": "GET", "url": url, "params": params}
+
+
+def _sort(rng) -> dict:
+    return {"sort_by": rng.choice(("name", "price")), "order": rng.choice(("asc", "desc"))}
+
+
+def _product_url(product: SampleProduct) -> str:
+    return f"/api/products/{product.category_slug}/{product.producer_slug}/{product.slug}"
+
+
+def build_fixed(url: str):
+    async def build(ctx, rng, count):
+        return [_get(url) for _ in range(count)]
+    return build
+
+
+async def build_popular(ctx, rng, count):
+    return [_get("/api/products/popular", page=rng.randint(1, 3), limit=LISTING_LIMIT, **_sort(rng)) for _ in range(count)]
+
+
+async def build_popular_cursor(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        sort = _sort(rng)
+        cursor = encode_cursor(sort["sort_by"], sort["order"], rng.choice(ctx.favorites))
+        requests.append(_get("/api/products/popular", cursor=cursor, limit=LISTING_LIMIT, **sort))
+    return requests
+
+
+async def build_facets(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        category_slug, producer_slug = rng.choice(ctx.producers)
+        if rng.random() < 0.5:
+            requests.append(_get("/api/products/facets", category_slug=category_slug))
+        else:
+            requests.append(_get("/api/products/facets", category_slug=category_slug, producer_slug=producer_slug))
+    return requests
+
+
+async def build_lookup(ctx, rng, count):
+    return [
+        _get("/api/products/lookup", ids=[product.id for product in rng.sample(ctx.products, min(LOOKUP_IDS, len(ctx.products)))])
+        for _ in range(count)
+    ]
+
+
+async def build_search(ctx, rng, count):
+    # Одно-два соседних слова полного названия: цвет, бренд, серия или артикул
+    requests = []
+    while len(requests) < count:
+        words = rng.choice(ctx.products).full_name.split()
+        start = rng.randrange(len(words))
+        query = " ".join(words[start:start + rng.randint(1, 2)])
+        if len(query) >= 2:
+            requests.append(_get("/api/products/search", query=query, limit=10))
+    return requests
+
+
+async def build_category(ctx, rng, count):
+    return [
+        _get(f"/api/products/{rng.choice(ctx.categories)}", page=rng.randint(1, 5), limit=LISTING_LIMIT, **_sort(rng))
+        for _ in range(count)
+    ]
+
+
+async def build_category_deep_page(ctx, rng, count):
+    # Любая страница листинга: OFFSET растёт с номером страницы
+    requests = []
+    for _ in range(count):
+        category_slug = rng.choice(ctx.categories)
+        pages = max((ctx.category_totals[category_slug] + LISTING_LIMIT - 1) // LISTING_LIMIT, 1)
+        requests.append(_get(f"/api/products/{category_slug}", page=rng.randint(1, pages), limit=LISTING_LIMIT, **_sort(rng)))
+    return requests
+
+
+async def build_category_cursor(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        product = rng.choice(ctx.products)
+        sort = _sort(rng)
+        cursor = encode_cursor(sort["sort_by"], sort["order"], product)
+        requests.append(_get(f"/api/products/{product.category_slug}", cursor=cursor, limit=LISTING_LIMIT, **sort))
+    return requests
+
+
+async def build_category_filtered(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        category_slug = rng.choice(ctx.categories)
+        attributes = ctx.facets.get(category_slug, {})
+        attr = [
+            f"{name}:{value}"
+            for name in rng.sample(sorted(attributes), min(rng.randint(1, 2), len(attributes)))
+            for value in rng.sample(attributes[name], min(rng.randint(1, 2), len(attributes[name])))
+        ]
+        requests.append(_get(f"/api/products/{category_slug}", attr=attr, limit=LISTING_LIMIT, **_sort(rng)))
+    return requests
+
+
+async def build_producer(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        category_slug, producer_slug = rng.choice(ctx.producers)
+        requests.append(_get(f"/api/products/{category_slug}/{producer_slug}", page=rng.randint(1, 3), limit=LISTING_LIMIT, **_sort(rng)))
+    return requests
+
+
+async def build_producer_large_page(ctx, rng, count):
+    requests = []
+    for _ in range(count):
+        category_slug, producer_slug = rng.choice(ctx.producers)
+        requests.append(_get(f"/api/products/{category_slug}/{producer_slug}", limit=LARGE_PAGE_LIMIT, **_sort(rng)))
+    return requests
+
+
+async def build_product(ctx, rng, count):
+    return [_get(_product_url(rng.choice(ctx.products))) for _ in range(count)]
+
+
+async def build_related(ctx, rng, count):
+    return [_get(f"{_product_url(rng.choice(ctx.products))}/related") for _ in range(count)]
+
+
+def _import_revisions(count: int) -> list:
+    # Ревизии 1, 0, 1, 0...: каждый импорт меняет одни и те же строки, а после прогона каталог прежний
+    return [(index + 1) % 2 for index in range(count + count % 2)]
+
+
+async def build_upload_google(ctx, rng, count):
+    return [
+        {"method": "POST", "url": "/api/products/upload_google", "params": {"sheet_url": SHEET_URL.format(revision=revision)}}
+        for revision in _import_revisions(count)
+    ]
+
+
+async def build_upload_file(ctx, rng, count):
+    requests = []
+    for revision in _import_revisions(count):
+        with open(ctx.sheet_files[revision], "rb") as f:
+            content = f.read()
+        requests.append({
+            "method": "POST", "url": "/api/products/upload_file",
+            "files": {"file": (f"catalog-rev{revision}.csv", content, "text/csv")},
+        })
+    return requests
+
+
+async def build_import_job_status(ctx, rng, count):
+    job_id = uuid.uuid4().hex
+    await _update_job(
+        job_id, status="done", source="benchmark", dry_run=False,
+        rows_processed=len(ctx.products), inserted=0, updated=0, unchanged=len(ctx.products), deleted=0,
+        errors=[], changes={"inserted": [], "updated": [], "deleted": []},
+    )
+    return [_get(f"/api/products/import_jobs/{job_id}") for _ in range(count)]
+
+
+async def wait_for_import(client, response) -> bool:
+    """Импорт меряется до конца фоновой задачи, а не до ответа 202."""
+    job_url = f"/api/products/import_jobs/{response.json()['job_id']}"
+    while True:
+        job = (await client.get(job_url)).json()
+        if job["status"] in ("done", "failed"):
+            return job["status"] == "done"
+        await asyncio.sleep(IMPORT_POLL_INTERVAL)
+
+
+async def build_register(ctx, rng, count):
+    return [
+        {
+            "method": "POST", "url": "/api/auth/register",
+            "json": {"name": "Bench", "email": f"bench-{ctx.run_id}-{index}@example.com", "password": BENCH_USER_PASSWORD},
+        }
+        for index in range(count)
+    ]
+
+
+async def build_login(ctx, rng, count):
+    return [
+        {"method": "POST", "url": "/api/auth/login", "json": {"email": BENCH_USER_EMAIL, "password": BENCH_USER_PASSWORD}}
+        for _ in range(count)
+    ]
+
+
+async def _refresh_tokens(ctx, count: int) -> list:
+    # Сессии заводятся кодом входа, но без bcrypt: /refresh и /logout меряются отдельно от /login
+    tokens = [create_refresh_token({"sub": BENCH_USER_EMAIL}) for _ in range(count)]
+    async with AsyncSessionLocal() as db:
+        for token in tokens:
+            await refresh_sessions.create_session(db, ctx.user_id, token)
+        await db.commit()
+    return tokens
+
+
+async def build_refresh(ctx, rng, count):
+    return [
+        {"method": "POST", "url": "/api/auth/refresh", "headers": {"Cookie": f"refresh_token={token}"}}
+        for token in await _refresh_tokens(ctx, count)
+    ]
+
+
+async def build_logout(ctx, rng, count):
+    return [
+        {"method": "POST", "url": "/api/auth/logout", "headers": {"Cookie": f"refresh_token={token}"}}
+        for token in await _refresh_tokens(ctx, count)
+    ]
+
+
+async def build_me(ctx, rng, count):
+    token = create_access_token({"sub": BENCH_USER_EMAIL})
+    return [{"method": "GET", "url": "/api/auth/me", "headers": {"Authorization": f"Bearer {token}"}} for _ in range(count)]
+
+
+async def build_order(ctx, rng, count):
+    requests = []
+    for index in range(count):
+        products = rng.sample(ctx.products, min(rng.randint(1, 4), len(ctx.products)))
+        requests.append({
+            "method": "POST", "url": "/api/order/telegram",
+            "json": {
+                "phone": f"+7999{index:07d}",
+                "source": rng.choice(("cart", "buy_now")),
+                "items": [{"id": product.id, "quantity": rng.randint(1, 3)} for product in products],
+            },
+        })
+    return requests
+
+
+class Scenario:
+    """
+    build(ctx, rng, count) — запросы (аргументы httpx.AsyncClient.request);
+    expected — статусы, которые не считаются ошибкой;
+    max_requests — потолок числа запросов для дорогих роутов (bcrypt);
+    settle(client, response) — что ещё входит в замер после ответа; такие сценарии
+    идут по одному запросу, без прогрева, --import-runs раз.
+    """
+
+    __slots__ = ("name", "group", "build", "expected", "max_requests", "settle")
+
+    def __init__(self, name: str, group: str, build, expected=(200,), max_requests=None, settle=None):
+        self.name = name
+        self.group = group
+        self.build = build
+        self.expected = expected
+        self.max_requests = max_requests
+        self.settle = settle
+
+
+# Порядок прогона: чтение каталога, вход, заказы, импорт (он меняет каталог и сбрасывает кеш — в конце)
+SCENARIOS = [
+    Scenario("categories", "products", build_fixed("/api/products/categories")),
+    Scenario("producers", "products", build_fixed("/api/products/producers")),
+    Scenario("product_lines", "products", build_fixed("/api/products/product_lines")),
+    Scenario("popular", "products", build_popular),
+    Scenario("popular_cursor", "products", build_popular_cursor),
+    Scenario("facets", "products", build_facets),
+    Scenario("lookup", "products", build_lookup),
+    Scenario("search", "products", build_search),
+    Scenario("category", "products", build_category),
+    Scenario("category_deep_page", "products", build_category_deep_page),
+    Scenario("category_cursor", "products", build_category_cursor),
+    Scenario("category_filtered", "products", build_category_filtered),
+    Scenario("producer", "products", build_producer),
+    Scenario("producer_large_page", "products", build_producer_large_page),
+    Scenario("product", "products", build_product),
+    Scenario("related", "products", build_related),
+    Scenario("import_job_status", "products", build_import_job_status),
+    Scenario("register", "auth", build_register, max_requests=40),
+    Scenario("login", "auth", build_login, max_requests=40),
+    Scenario("refresh", "auth", build_refresh),
+    Scenario("logout", "auth", build_logout),
+    Scenario("me", "auth", build_me),
+    Scenario("order", "order", build_order),
+    Scenario("upload_google", "import", build_upload_google, expected=(202,), settle=wait_for_import),
+    Scenario("upload_file", "import", build_upload_file, expected=(202,), settle=wait_for_import),
+]
@@ -0,0 +1,50 @@
+"""
+Окружение бенчмарков: отдельные Postgres и Redis (docker compose --profile bench up -d),
+чтобы генератор и прогоны не трогали рабочие данные. Адреса переопределяются переменными BENCH_*.
+
+configure_environment() вызывается до импорта модулей приложения: database.py и utils/* читают
+настройки при импорте.
+"""
+import os
+
+# Подключения всегда берутся из BENCH_* (или значений по умолчанию для контейнеров профиля bench),
+# а не из .env — по ошибке засеять рабочую базу нельзя
+CONNECTION_DEFAULTS = {
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5433",
+    "POSTGRES_USER": "bench",
+    "POSTGRES_PASSWORD": "bench",
+    "POSTGRES_DB": "bench",
+    "REDIS_URL": "redis://localhost:6380",
+}
+
+# Остальное можно переопределить обычными переменными, например ENABLE_RESPONSE_CACHE=true —
+# прогон с кешем ответов. По умолчанию меряются сами роуты: без кеша, снимка каталога и лимитера
+APP_DEFAULTS = {
+    "ENV": "development",
+    "ENABLE_RATE_LIMITER": "false",
+    "ENABLE_RESPONSE_CACHE": "false",
+    "ENABLE_CATALOG_SNAPSHOT": "false",
+    "SECRET_KEY": "bench-secret",
+    "REFRESH_SECRET_KEY": "bench-refresh-secret",
+}
+
+# Уведомления о заказах уходят только в заглушку Bot API (benchmarks/telegram_stub.py), её запускает run.py
+TELEGRAM_STUB_PORT = int(os.getenv("BENCH_TELEGRAM_STUB_PORT", "8081"))
+TELEGRAM_OVERRIDES = {
+    "TELEGRAM_API_URL": f"http://127.0.0.1:{TELEGRAM_STUB_PORT}",
+    "TELEGRAM_BOT_TOKEN": "bench",
+    "TELEGRAM_CHAT_ID": "bench",
+}
+
+# Пользователь, под которым прогон входит в /auth/login
+BENCH_USER_EMAIL = "bench@example.com"
+BENCH_USER_PASSWORD = os.getenv("BENCH_USER_PASSWORD", "bench-password")
+
+
+def configure_environment():
+    for name, default in CONNECTION_DEFAULTS.items():
+        os.environ[name] = os.getenv(f"BENCH_{name}", default)
+    for name, value in APP_DEFAULTS.items():
+        os.environ.setdefault(name, value)
+    os.environ.update(TELEGRAM_OVERRIDES)
@@ -0,0 +1,50 @@
+"""
+Заглушка Telegram Bot API для прогона бенчмарков: отвечает на sendMessage как api.telegram.org,
+с задержкой latency, и считает принятые сообщения. Работает настоящим HTTP-сервером в отдельном
+потоке — диспетчер outbox ходит к ней по TELEGRAM_API_URL тем же кодом, что и в Telegram.
+"""
+import time
+import asyncio
+import threading
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class TelegramStub:
+    """requests — вызовы sendMessage, messages — уведомления в них (до объединения диспетчером)."""
+
+    def __init__(self, port: int, latency: float = 0.05, separator: str = "\n\n"):
+        self.latency = latency
+        # Диспетчер объединяет заказы в одно сообщение: по разделителю считаются исходные
+        self.separator = separator
+        self.requests = 0
+        self.messages = 0
+        app = Starlette(routes=[Route("/bot{token}/sendMessage", self._send_message, methods=["POST"])])
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+        self._thread = None
+
+    async def _send_message(self, request: Request) -> JSONResponse:
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        self.messages += payload["text"].count(self.separator) + 1
+        return JSONResponse({
+            "ok": True,
+            "result": {"message_id": self.requests, "chat": {"id": payload["chat_id"]}, "date": int(time.time()), "text": payload["text"]},
+        })
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.run, name="telegram-stub", daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Заглушка Telegram не запустилась")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
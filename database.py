@@ -1,23 +1,72 @@
 import os 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from dotenv import load_dotenv
+from utils.pool_stats import PoolStats, instrumented_pool_class
 
 load_dotenv()
 
 DATABASE_URL = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}"
-engine = create_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
+# Настройки пула. Итоговый максимум соединений на процесс: DB_POOL_SIZE + DB_MAX_OVERFLOW,
+# умножить на число воркеров uvicorn — должно помещаться в max_connections Postgres
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Синхронный движок — для init_db и скриптов
+engine = create_engine(DATABASE_URL, pool_pre_ping=DB_POOL_PRE_PING, pool_recycle=DB_POOL_RECYCLE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок — для всех запросов API
+pool_stats = PoolStats()
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, pool_stats),
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+pool_stats.attach(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+# Ключ pg_advisory_xact_lock: воркеры uvicorn стартуют одновременно, миграции применяет один из них
+MIGRATIONS_ADVISORY_LOCK_ID = 7_310_002
+
+def run_migrations():
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATIONS_ADVISORY_LOCK_ID})
+        config.attributes["connection"] = conn
+        command.upgrade(config, "head")
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    # Схема ведётся миграциями (migrations/versions), базы без них 0001 доводит до baseline
+    run_migrations()
+
+    # Заполняем поисковый текст для строк, созданных до его появления, и счётчики листингов
+    from utils.product_utils import refresh_search_text, refresh_catalog_counts, has_catalog_counts, has_catalog_facets
+    with SessionLocal() as db:
+        changed = refresh_search_text(db, only_missing=True)
+        if not has_catalog_counts(db) or not has_catalog_facets(db):
+            refresh_catalog_counts(db)
+            changed = True
+        if changed:
+            db.commit()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
@@ -2,20 +2,19 @@ import os
 
 from fastapi import FastAPI, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as redis
-
-from database import init_db
-from routers import products, auth, order 
+from database import init_db, async_engine
+from utils.catalog_snapshot import start_catalog_snapshot, stop_catalog_snapshot
+from utils.outbox import start_outbox_dispatcher, stop_outbox_dispatcher
+from utils.password_pool import start_password_pool, stop_password_pool
+from utils.principal_cache import start_principal_cache, stop_principal_cache
+from utils.image_variants import STATIC_DIR, VARIANTS_DIR, ImmutableStaticFiles
+from utils.compression import CompressionMiddleware, PrecompressedStaticFiles
+from utils.rate_limiter import ENABLE_RATE_LIMITER, rate_limit, start_rate_limiter, stop_rate_limiter
+from routers import products, auth, order, ops
 import logging
 
-ENV = os.getenv('ENV', 'development')
-
-ENABLE_RATE_LIMITER = os.getenv("ENABLE_RATE_LIMITER", "false").lower() == "true"
 SHOW_DOCS = os.getenv("SHOW_DOCS", "true").lower() == "true"
 
 # Настройки документации
@@ -27,34 +26,61 @@ if not SHOW_DOCS:
         "openapi_url": None
     }
 
+# Лимиты по политикам роутов (utils/rate_limiter.py), статика под них не попадает
 if ENABLE_RATE_LIMITER:
     app = FastAPI(
-        dependencies=[Depends(RateLimiter(times=30, seconds=60))],
+        dependencies=[Depends(rate_limit)],
         **docs_kwargs
     )
 else:
     app = FastAPI(**docs_kwargs)
 
+# Фоновая синхронизация локальных счётчиков лимитера с Redis
 @app.on_event("startup")
-async def startup():
-    if ENABLE_RATE_LIMITER:
-        redis_client = redis.from_url("redis://redis:6379", encoding="utf-8", decode_responses=True)
-        await FastAPILimiter.init(redis_client)
+async def rate_limiter_startup():
+    await start_rate_limiter()
 
 # Подключение к базе при запуске
 @app.on_event("startup")
 def startup_event():
     init_db()
 
-ALLOWED_ORIGINS = list(set(os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")))
+# Снимок каталога в памяти (ENABLE_CATALOG_SNAPSHOT), после init_db
+@app.on_event("startup")
+async def catalog_snapshot_startup():
+    await start_catalog_snapshot()
 
-# Раздача статики
-if ENV == 'production':
-    static_path = '/var/www/static'
-else:
-    static_path = os.path.join(os.path.dirname(__file__), 'static')
+# Фоновая отправка уведомлений о заказах из outbox_messages
+@app.on_event("startup")
+async def outbox_dispatcher_startup():
+    await start_outbox_dispatcher()
+
+# Процессы для bcrypt (PASSWORD_HASH_WORKERS)
+@app.on_event("startup")
+def password_pool_startup():
+    start_password_pool()
+
+# Сброс кеша пользователей между воркерами (ENABLE_PRINCIPAL_REDIS_CACHE)
+@app.on_event("startup")
+async def principal_cache_startup():
+    await start_principal_cache()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_rate_limiter()
+    await stop_principal_cache()
+    stop_password_pool()
+    await stop_outbox_dispatcher()
+    await stop_catalog_snapshot()
+    await async_engine.dispose()
 
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+ALLOWED_ORIGINS = list(set(os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")))
+
+# Раздача статики. Производные картинок (имена с хешем содержимого) — отдельно, с Cache-Control: immutable;
+# монтируются раньше /static, иначе их перехватит общий mount
+app.mount("/static/uploads/v", ImmutableStaticFiles(directory=VARIANTS_DIR, check_dir=False), name="image_variants")
+# Текстовая статика — из заранее сжатых копий (scripts/precompress_static.py)
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
 
 # CORS для Nuxt 3
 app.add_middleware(
@@ -65,15 +91,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# br/gzip для ответов API с ограничением CPU на ответ (COMPRESSION_CPU_BUDGET_MS)
+app.add_middleware(CompressionMiddleware)
+
 # Подключение роутов
 app.include_router(products.router, prefix="/api")
 app.include_router(auth.router, prefix="/api")
 app.include_router(order.router, prefix="/api")
-
-# Пинг для проверки БД
-@app.get("/ping_db")
-def ping_db():
-    return {"message": "Database connection successful!"}
+# Служебные эндпоинты — без /api, только для администраторов
+app.include_router(ops.router)
 
 # Логгирование
 logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,151 @@
+"""baseline: схема, которую раньше создавал init_db через create_all
+
+Ревизия идемпотентна: на базах, созданных до миграций, создаёт только недостающее
+(таблицы, колонки, добавленные ALTER-ами в init_db, и GIN-индексы), поэтому stamp не нужен.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def create_table(name: str, *columns) -> None:
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+
+def id_column() -> sa.Column:
+    return sa.Column("id", sa.Integer(), primary_key=True)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    create_table(
+        "users",
+        id_column(),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False, unique=True),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("refresh_token", sa.String(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=True),
+    )
+    create_table(
+        "categories",
+        id_column(),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("slug", sa.String(), nullable=True),
+    )
+    create_table(
+        "producers",
+        id_column(),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("slug", sa.String(), nullable=True),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id"), nullable=False),
+    )
+    create_table(
+        "product_lines",
+        id_column(),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("slug", sa.String(), nullable=True),
+        sa.Column("producer_id", sa.Integer(), sa.ForeignKey("producers.id"), nullable=False),
+    )
+    create_table(
+        "products",
+        id_column(),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("full_name", sa.String(), nullable=True),
+        sa.Column("slug", sa.String(), nullable=True),
+        sa.Column("product_line_id", sa.Integer(), sa.ForeignKey("product_lines.id"), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("img_mini", postgresql.JSONB(), nullable=True),
+        sa.Column("rating", sa.Float(), nullable=True),
+        sa.Column("favorite", sa.Boolean(), nullable=True),
+        sa.Column("details", postgresql.JSONB(), nullable=True),
+    )
+    # Колонки, которые init_db добавлял ALTER-ами в уже существующую таблицу
+    op.execute("""
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_text VARCHAR;
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('simple', coalesce(search_text, ''))) STORED;
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS source_hash VARCHAR(64);
+    """)
+    create_table(
+        "product_images",
+        id_column(),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("image_url", sa.String(), nullable=False),
+    )
+    create_table(
+        "catalog_counts",
+        sa.Column("scope", sa.String(), primary_key=True),
+        sa.Column("category_slug", sa.String(), primary_key=True),
+        sa.Column("producer_slug", sa.String(), primary_key=True),
+        sa.Column("total", sa.Integer(), nullable=False),
+    )
+    op.execute("""
+        ALTER TABLE catalog_counts ADD COLUMN IF NOT EXISTS price_min FLOAT;
+        ALTER TABLE catalog_counts ADD COLUMN IF NOT EXISTS price_max FLOAT;
+    """)
+    create_table(
+        "catalog_facets",
+        sa.Column("category_slug", sa.String(), primary_key=True),
+        sa.Column("producer_slug", sa.String(), primary_key=True),
+        sa.Column("attribute", sa.String(), primary_key=True),
+        sa.Column("value", sa.String(), primary_key=True),
+        sa.Column("total", sa.Integer(), nullable=False),
+    )
+    create_table(
+        "orders",
+        id_column(),
+        sa.Column("customer_phone", sa.String(), nullable=False),
+        sa.Column("source", sa.String(), nullable=False),
+        sa.Column("created_at", sa.String(), nullable=False),
+        sa.Column("total_amount", sa.Float(), nullable=False),
+        sa.Column("items_json", postgresql.JSONB(), nullable=True),
+    )
+    create_table(
+        "order_items",
+        id_column(),
+        sa.Column("order_id", sa.Integer(), sa.ForeignKey("orders.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+    )
+
+    # Индексы из index=True и __table_args__ моделей
+    for table in ("users", "categories", "producers", "product_lines", "products", "product_images", "orders", "order_items"):
+        op.create_index(f"ix_{table}_id", table, ["id"], if_not_exists=True)
+    for table in ("categories", "producers", "product_lines", "products"):
+        op.create_index(f"ix_{table}_slug", table, ["slug"], unique=True, if_not_exists=True)
+    op.create_index(
+        "ix_products_search_text_trgm", "products", ["search_text"],
+        postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}, if_not_exists=True,
+    )
+    op.create_index(
+        "ix_products_search_vector", "products", ["search_vector"],
+        postgresql_using="gin", if_not_exists=True,
+    )
+    op.create_index(
+        "ix_products_details", "products", ["details"],
+        postgresql_using="gin", postgresql_ops={"details": "jsonb_path_ops"}, if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    for table in (
+        "order_items", "orders", "catalog_facets", "catalog_counts",
+        "product_images", "products", "product_lines", "producers", "categories", "users",
+    ):
+        op.drop_table(table)
@@ -0,0 +1,57 @@
+"""индексы под фильтры и сортировки листингов, связанных товаров, заказов и refresh-токенов
+
+Проверка, что запросы их используют: python scripts/check_indexes.py
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Листинги категории/производителя: товары линеек, ORDER BY name|price, id.
+    # Ведущая колонка product_line_id обслуживает и связанные товары (WHERE product_line_id = ...)
+    op.create_index("ix_products_line_name", "products", ["product_line_id", "name", "id"], if_not_exists=True)
+    op.create_index("ix_products_line_price", "products", ["product_line_id", "price", "id"], if_not_exists=True)
+    # Популярные: WHERE favorite ORDER BY name|price, id — частичные, в индексе только избранное
+    op.create_index(
+        "ix_products_favorite_name", "products", ["name", "id"],
+        postgresql_where=sa.text("favorite"), if_not_exists=True,
+    )
+    op.create_index(
+        "ix_products_favorite_price", "products", ["price", "id"],
+        postgresql_where=sa.text("favorite"), if_not_exists=True,
+    )
+    # Внешние ключи, по которым идут JOIN-ы и selectinload
+    op.create_index("ix_producers_category_id", "producers", ["category_id"], if_not_exists=True)
+    op.create_index("ix_product_lines_producer_id", "product_lines", ["producer_id"], if_not_exists=True)
+    op.create_index("ix_product_images_product_id", "product_images", ["product_id"], if_not_exists=True)
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"], if_not_exists=True)
+    # logout ищет пользователя по refresh-токену; у вышедших он NULL и в индекс не попадает
+    op.create_index(
+        "ix_users_refresh_token", "users", ["refresh_token"],
+        postgresql_where=sa.text("refresh_token IS NOT NULL"), if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_refresh_token", table_name="users")
+    op.drop_index("ix_order_items_order_id", table_name="order_items")
+    op.drop_index("ix_product_images_product_id", table_name="product_images")
+    op.drop_index("ix_product_lines_producer_id", table_name="product_lines")
+    op.drop_index("ix_producers_category_id", table_name="producers")
+    op.drop_index("ix_products_favorite_price", table_name="products")
+    op.drop_index("ix_products_favorite_name", table_name="products")
+    op.drop_index("ix_products_line_price", table_name="products")
+    op.drop_index("ix_products_line_name", table_name="products")
@@ -0,0 +1,49 @@
+"""refresh_sessions вместо users.refresh_token: несколько устройств, поиск по sha256 токена
+
+Действующие токены переносятся в refresh_sessions, чтобы никого не разлогинило.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "refresh_sessions",
+        sa.Column("digest", sa.String(64), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_refresh_sessions_user_id", "refresh_sessions", ["user_id"])
+    # Срок старого токена не хранился — даём полный REFRESH_TOKEN_EXPIRE_DAYS (7 дней), JWT всё равно проверяет exp
+    op.execute("""
+        INSERT INTO refresh_sessions (digest, user_id, expires_at)
+        SELECT encode(sha256(convert_to(refresh_token, 'UTF8')), 'hex'), id, now() + interval '7 days'
+        FROM users WHERE refresh_token IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+    op.drop_index("ix_users_refresh_token", table_name="users")
+    op.drop_column("users", "refresh_token")
+
+
+def downgrade() -> None:
+    op.add_column("users", sa.Column("refresh_token", sa.String(), nullable=True))
+    op.create_index(
+        "ix_users_refresh_token", "users", ["refresh_token"],
+        postgresql_where=sa.text("refresh_token IS NOT NULL"),
+    )
+    op.drop_index("ix_refresh_sessions_user_id", table_name="refresh_sessions")
+    op.drop_table("refresh_sessions")
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Computed, Index, DateTime, text, func
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from database import Base
 
 class User(Base):
@@ -10,9 +10,18 @@ class User(Base):
     name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     hashed_password = Column(String, nullable=False)
-    refresh_token = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
 
+# Refresh-сессии, когда Redis недоступен или REFRESH_SESSION_STORE=postgres (см. utils/refresh_sessions.py).
+# Ключ — sha256 токена, сам токен не хранится
+class RefreshSession(Base):
+    __tablename__ = "refresh_sessions"
+
+    digest = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
 class Category(Base):
     __tablename__ = "categories"
 
@@ -28,7 +37,7 @@ class Producer(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, unique=True)
     slug = Column(String, unique=True, index=True) 
-    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
 
     category = relationship("Category", back_populates="producers")
     product_lines = relationship("ProductLine", back_populates="producer")
@@ -39,7 +48,7 @@ class ProductLine(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, unique=True)
     slug = Column(String, unique=True, index=True)
-    producer_id = Column(Integer, ForeignKey("producers.id"), nullable=False)
+    producer_id = Column(Integer, ForeignKey("producers.id"), nullable=False, index=True)
 
     producer = relationship("Producer", back_populates="product_lines")
     products = relationship("Product", back_populates="product_line")
@@ -48,7 +57,7 @@ class ProductImage(Base):
     __tablename__ = "product_images"
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
     image_url = Column(String, nullable=False)
 
     product = relationship("Product", back_populates="images")
@@ -66,10 +75,62 @@ class Product(Base):
     rating = Column(Float, default=0.0)
     favorite = Column(Boolean, default=False)
     details = Column(JSONB, nullable=True)
+    # full_name + линейка + производитель + их транслитерация (см. build_search_text).
+    # deferred: нужны только в WHERE/ORDER BY поиска, в ответы не попадают
+    search_text = deferred(Column(String, nullable=True))
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(search_text, ''))", persisted=True)
+    ))
+    # sha256 исходной строки таблицы (см. catalog_import.row_hash): импорт переписывает только строки с другим хешем
+    source_hash = deferred(Column(String(64), nullable=True))
 
     product_line = relationship("ProductLine", back_populates="products")
     images = relationship("ProductImage", back_populates="product", cascade="all, delete-orphan")
 
+    # Схема меняется миграциями (migrations/versions), индексы здесь — для --autogenerate
+    __table_args__ = (
+        # Листинги: товары линеек категории/производителя, ORDER BY name|price, id; связанные товары
+        Index("ix_products_line_name", "product_line_id", "name", "id"),
+        Index("ix_products_line_price", "product_line_id", "price", "id"),
+        # Популярные: WHERE favorite ORDER BY name|price, id
+        Index("ix_products_favorite_name", "name", "id", postgresql_where=text("favorite")),
+        Index("ix_products_favorite_price", "price", "id", postgresql_where=text("favorite")),
+        Index(
+            "ix_products_search_text_trgm", "search_text",
+            postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"}
+        ),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        # details @> '{"Цвет": "Дуб"}' для фильтров листингов
+        Index(
+            "ix_products_details", "details",
+            postgresql_using="gin", postgresql_ops={"details": "jsonb_path_ops"}
+        ),
+    )
+
+# Число товаров в листингах, пересчитывается импортом (refresh_catalog_counts).
+# scope: category — по category_slug, producer — по паре category_slug/producer_slug, favorite — популярные
+class CatalogCount(Base):
+    __tablename__ = "catalog_counts"
+
+    scope = Column(String, primary_key=True)
+    category_slug = Column(String, primary_key=True, default="")
+    producer_slug = Column(String, primary_key=True, default="")
+    total = Column(Integer, nullable=False, default=0)
+    price_min = Column(Float, nullable=True)
+    price_max = Column(Float, nullable=True)
+
+# Сколько товаров категории (producer_slug = '') или производителя имеют значение характеристики.
+# Пересчитывается вместе с catalog_counts
+class CatalogFacet(Base):
+    __tablename__ = "catalog_facets"
+
+    category_slug = Column(String, primary_key=True)
+    producer_slug = Column(String, primary_key=True, default="")
+    attribute = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -86,9 +147,29 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
 
     order = relationship("Order", back_populates="items")
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
+
+# Исходящие уведомления (transactional outbox): пишутся в одной транзакции с заказом,
+# отправляет их фоновый диспетчер (utils/outbox.py)
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Не раньше этого времени: сдвигается бэкоффом после ошибки и retry_after от Telegram
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Диспетчер выбирает только неотправленные, в порядке очереди
+        Index("ix_outbox_messages_pending", "available_at", "id", postgresql_where=text("sent_at IS NULL")),
+    )
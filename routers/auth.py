@@ -1,21 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 import os
 
 import schemas, models, security
 from security import get_current_user
+from utils import password_pool, refresh_sessions
+from utils.principal_cache import principal_cache
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 IS_PROD = os.getenv("ENV") == "production"
 
 @router.post("/register")
-def register(request: schemas.RegisterRequest, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.email == request.email).first()
+async def register(request: schemas.RegisterRequest, db: AsyncSession = Depends(get_db)):
+    existing_user = await db.scalar(select(models.User).where(models.User.email == request.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = security.hash_password(request.password)
+    # bcrypt нагружает CPU — считаем в отдельных процессах, не занимая потоки воркера
+    hashed_password = await password_pool.hash_password(request.password)
     new_user = models.User(
         name=request.name,
         email=request.email,
@@ -23,8 +27,8 @@ def register(request: schemas.RegisterRequest, db: Session = Depends(get_db)):
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
 
     return {
         "message": "User registered successfully",
@@ -32,17 +36,24 @@ def register(request: schemas.RegisterRequest, db: Session = Depends(get_db)):
     }
 
 @router.post("/login", response_model=schemas.TokenResponse)
-def login(request: schemas.LoginRequest, response: Response, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == request.email).first()
+async def login(request: schemas.LoginRequest, response: Response, db: AsyncSession = Depends(get_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == request.email))
 
-    if not user or not security.verify_password(request.password, user.hashed_password):
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid email or password")
+    verified, new_hash = await password_pool.verify_password(request.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(status_code=400, detail="Invalid email or password")
+    if new_hash:
+        # Изменилась BCRYPT_ROUNDS — сохраняем хеш с новой стоимостью
+        user.hashed_password = new_hash
 
     access_token = security.create_access_token({"sub": user.email})
     refresh_token = security.create_refresh_token({"sub": user.email})
 
-    user.refresh_token = refresh_token
-    db.commit()
+    # Сессия на устройство: вход с нового устройства не выкидывает остальные, users при этом не пишется
+    await refresh_sessions.create_session(db, user.id, refresh_token)
+    await db.commit()
 
     response.set_cookie(
         key="refresh_token",
@@ -59,7 +70,7 @@ def login(request: schemas.LoginRequest, response: Response, db: Session = Depen
     }
 
 @router.post("/refresh", response_model=schemas.TokenResponse)
-def refresh(request: Request, response: Response, db: Session = Depends(get_db)):
+async def refresh(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
         raise HTTPException(status_code=401, detail="No refresh token in cookies")
@@ -68,19 +79,27 @@ def refresh(request: Request, response: Response, db: Session = Depends(get_db))
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    user = db.query(models.User).filter(models.User.email == payload["sub"]).first()
-    if not user or user.refresh_token != refresh_token:
-        if user:
-            user.refresh_token = None
-            db.commit()
+    # Ротация: старая сессия забирается атомарно, так что повторно (или параллельно) предъявленный токен не пройдёт
+    user_id = await refresh_sessions.take_session(db, refresh_token)
+    if user_id is None:
+        await db.commit()
         response.delete_cookie("refresh_token")
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
+    user = await principal_cache.get(payload["sub"])
+    if user is None or user.id != user_id:
+        user = await db.get(models.User, user_id)
+        if not user or user.email != payload["sub"]:
+            await db.commit()
+            response.delete_cookie("refresh_token")
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        await principal_cache.put(user)
+
     new_access_token = security.create_access_token({"sub": payload["sub"]})
     new_refresh_token = security.create_refresh_token({"sub": payload["sub"]})
 
-    user.refresh_token = new_refresh_token
-    db.commit()
+    await refresh_sessions.create_session(db, user_id, new_refresh_token)
+    await db.commit()
 
     response.set_cookie(
         key="refresh_token",
@@ -96,20 +115,19 @@ def refresh(request: Request, response: Response, db: Session = Depends(get_db))
     }
 
 @router.post("/logout")
-def logout(request: Request, response: Response, db: Session = Depends(get_db)):
+async def logout(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     refresh_token = request.cookies.get("refresh_token")
 
     if refresh_token:
-        user = db.query(models.User).filter(models.User.refresh_token == refresh_token).first()
-        if user:
-            user.refresh_token = None 
-            db.commit()
+        # Завершается только сессия этого устройства
+        await refresh_sessions.take_session(db, refresh_token)
+        await db.commit()
 
     response.delete_cookie("refresh_token")
     return {"message": "Logged out"}
 
 @router.get("/me", response_model=schemas.UserResponse)
-def get_current_user_info(user=Depends(get_current_user)):
+async def get_current_user_info(user=Depends(get_current_user)):
     return {
         "email": user.email,
         "name": user.name,
@@ -0,0 +1,59 @@
+import time
+import logging
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from database import async_engine, pool_stats
+from security import get_current_admin
+from utils.password_pool import password_stats
+from utils.principal_cache import principal_cache
+from utils.rate_limiter import rate_limiter_stats
+from utils.compression import compression_stats
+
+logger = logging.getLogger(__name__)
+
+# Служебные эндпоинты: внутреннее состояние воркера — только администраторам
+router = APIRouter(tags=["Ops"], dependencies=[Depends(get_current_admin)])
+
+# Пинг для проверки БД
+@router.get("/ping_db")
+async def ping_db():
+    start = time.perf_counter()
+    try:
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception:
+        # Подробности — только в лог: текст ошибки драйвера раскрывает адреса и настройки БД
+        logger.exception("Проверка БД не прошла")
+        return JSONResponse(status_code=503, content={"message": "Database connection failed"})
+
+    return {
+        "message": "Database connection successful!",
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+# Состояние пула соединений API
+@router.get("/db_pool_stats")
+def db_pool_stats():
+    return pool_stats.snapshot(async_engine.sync_engine.pool)
+
+# Пул хеширования паролей: очередь, отказы, длительность bcrypt
+@router.get("/password_hash_stats")
+def password_hash_stats():
+    return password_stats.snapshot()
+
+# Кеш пользователей get_current_user: попадания, промахи, сбросы
+@router.get("/principal_cache_stats")
+def principal_cache_stats():
+    return principal_cache.snapshot()
+
+# Лимитер: решения по политикам, отказы, задержка Redis
+@router.get("/rate_limiter_stats")
+def rate_limiter_stats_endpoint():
+    return rate_limiter_stats.snapshot()
+
+# Сжатие ответов: объёмы, степень сжатия, пропуски по бюджету CPU
+@router.get("/compression_stats")
+def compression_stats_endpoint():
+    return compression_stats.snapshot()
@@ -1,31 +1,37 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from schemas import TelegramOrderRequest
 from datetime import datetime
 from pytz import timezone
 from database import get_db
 from models import Order, OrderItem
-import httpx
-import os
-
-from fastapi_limiter.depends import RateLimiter
+from utils.outbox import enqueue_telegram_message, notify_outbox
+from utils.product_utils import lookup_products, PRODUCT_LOOKUP_MAX_IDS
 
+# Лимит заказов — политика "order" в utils/rate_limiter.py
 router = APIRouter(prefix="/order", tags=["Order"])
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-ENABLE_RATE_LIMITER = os.getenv("ENABLE_RATE_LIMITER", "false").lower() == "true"
-
-dependencies = [Depends(RateLimiter(times=3, seconds=60))] if ENABLE_RATE_LIMITER else []
-
-@router.post("/telegram", dependencies=dependencies)
+@router.post("/telegram")
 async def send_telegram_order(
     data: TelegramOrderRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not data.items:
         raise HTTPException(status_code=400, detail="Пустой заказ")
 
+    # Одинаковые товары складываем; цены и названия — из каталога, а не от клиента
+    quantities = {}
+    for item in data.items:
+        quantities[item.id] = quantities.get(item.id, 0) + item.quantity
+    if len(quantities) > PRODUCT_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail="Слишком много товаров в заказе")
+
+    products = await lookup_products(db, list(quantities))
+    unavailable = [product_id for product_id in quantities if product_id not in products]
+    if unavailable:
+        raise HTTPException(status_code=409, detail=f"Товары больше не продаются: {unavailable}")
+
     order_time = datetime.now(timezone("Europe/Moscow")).strftime("%d.%m.%Y %H:%M")
     source_text = "Купить сейчас" if data.source == "buy_now" else "Корзина"
 
@@ -34,19 +40,21 @@ async def send_telegram_order(
     summary_string = ""
     total_amount = 0
 
-    for item in data.items:
-        item_total = item.quantity * item.price
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        full_name = product.full_name or product.name
+        item_total = quantity * product.price
         total_amount += item_total
 
         items_json.append({
-            "full_name": item.full_name,
-            "quantity": item.quantity,
-            "price": item.price,
+            "full_name": full_name,
+            "quantity": quantity,
+            "price": product.price,
         })
 
         summary_string += (
-            f"📦 *{item.full_name}*\n"
-            f"💵 Кол-во: {item.quantity}, Цена: {item.price} ₽, Сумма: {item_total} ₽\n\n"
+            f"📦 *{full_name}*\n"
+            f"💵 Кол-во: {quantity}, Цена: {product.price} ₽, Сумма: {item_total} ₽\n\n"
         )
 
     # Сохраняем заказ
@@ -58,18 +66,16 @@ async def send_telegram_order(
         total_amount=total_amount
     )
     db.add(order)
-    db.flush()
-
-    for item in data.items:
-        db.add(OrderItem(
-            order_id=order.id,
-            product_id=item.id,
-            quantity=item.quantity,
-        ))
+    await db.flush()
 
-    db.commit()
+    # Все позиции одним INSERT ... VALUES
+    await db.execute(insert(OrderItem).values([
+        {"order_id": order.id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ]))
 
-    # Отправка Telegram-сообщения
+    # Уведомление пишется в outbox в той же транзакции, что и заказ: отправит фоновый диспетчер,
+    # ответ не ждёт Telegram и не падает из-за него
     message = (
         f"📌 *Новый заказ №{order.id}* ({source_text})\n\n"
         f"📞 Клиент: `{data.phone}`\n"
@@ -77,20 +83,9 @@ async def send_telegram_order(
         f"{summary_string}"
         f"💰 *Итого:* {total_amount} ₽"
     )
+    enqueue_telegram_message(db, message)
 
-    send_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            send_url,
-            json={
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message,
-                "parse_mode": "Markdown"
-            }
-        )
-
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Не удалось отправить заказ в Telegram")
+    await db.commit()
+    notify_outbox()
 
-    return {"success": True, "order_id": order.id}
+    return {"success": True, "order_id": order.id, "total_amount": total_amount}
@@ -1,317 +1,214 @@
 import gspread
-import pandas as pd
 import models, schemas
-from models import Product, ProductLine, ProductImage, Producer, Category
+from models import Product, ProductLine, Producer, Category
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from database import get_db
 from typing import List, Optional
-from slugify import slugify
-from math import ceil
-from utils.product_utils import add_absolute_img_urls, paginate_and_sort_products
+from utils.product_utils import (
+    add_absolute_img_urls, paginate_and_sort_products, with_catalog_path,
+    select_product_previews, select_search_products, paginated_products_response,
+    ProductFilters, product_filters, get_catalog_facets,
+    lookup_products, product_lookup_item, PRODUCT_LOOKUP_MAX_IDS,
+)
+from utils.import_jobs import (
+    enqueue_import, get_import_job, dataframe_chunks, save_upload_to_disk, IMPORT_CHUNK_SIZE
+)
+from utils.catalog_import import FileChunks, sheet_frame
+from utils.query_budget import query_budget
+from utils.cache import CachedRoute, cache_response
+from utils.catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+from functools import partial
+import os
 import re
 
 # Создаём router для продуктов
-router = APIRouter(prefix="/products", tags=["Products"])
+router = APIRouter(prefix="/products", tags=["Products"], route_class=CachedRoute)
 
 SERVICE_ACCOUNT_FILE = "service_account.json"
+IMPORT_FILE_EXTENSIONS = {".csv", ".xlsx"}
 
 def get_google_sheet(sheet_url: str):
     try:
         sheet_id = re.search(r"/d/([a-zA-Z0-9-_]+)", sheet_url).group(1)  # Извлекаем sheet_id из URL
         sheet = gspread.service_account(SERVICE_ACCOUNT_FILE).open_by_key(sheet_id).sheet1
-        df = pd.DataFrame(sheet.get_all_values())
-        df.columns = df.iloc[0]  # Устанавливаем заголовки
-        return df[1:]  # Возвращаем данные без первой строки
+        header, *rows = sheet.get_all_values()  # Первая строка — заголовки
+        return sheet_frame(header, rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка Google Sheets API: {str(e)}")
 
-# Эндпоинт загрузки продуктов из Google Sheets
-@router.post("/upload_google")
-async def upload_products_google(sheet_url: str, db: Session = Depends(get_db)):
-    try:
-        df = get_google_sheet(sheet_url)
-
-        # Всё что не относится к деталям
-        base_columns = {
-            "Наименование", "Цена", "Img", "Img_mini", "is_favorite", "product_line", 'slug', "full_name"
-        }
+# Эндпоинт загрузки продуктов из Google Sheets: ставит фоновый импорт и сразу возвращает id задачи
+@router.post("/upload_google", status_code=202)
+async def upload_products_google(
+    sheet_url: str,
+    dry_run: bool = Query(False, description="Только посчитать изменения, ничего не записывая"),
+):
+    job_id = await enqueue_import(
+        "google_sheet", dataframe_chunks(partial(get_google_sheet, sheet_url)), dry_run=dry_run
+    )
+    return {"job_id": job_id, "status": "queued"}
 
-        existing_products = db.query(Product).all()
-        existing_products_dict = {p.name: p for p in existing_products}
-
-        products_to_add = []
-        products_to_update = []
-        images_to_add = []
-        sheet_product_names = set(df["Наименование"])
-        seen_slugs = set()
-
-        for _, row in df.iterrows():
-            product_name = str(row["Наименование"]).strip()
-
-            # Если есть повторы, добавляем индекс
-            base_slug = slugify(product_name)
-            new_slug = base_slug
-            counter = 1
-            while new_slug in seen_slugs:
-                new_slug = f"{base_slug}-{counter}"
-                counter += 1
-            seen_slugs.add(new_slug)
-
-            # Получаем или создаём линейку
-            product_line_name = row["product_line"].strip()
-            product_line = db.query(ProductLine).filter(
-                ProductLine.name.ilike(product_line_name)
-            ).first()
-
-            if not product_line:
-                product_line = ProductLine(
-                    name=product_line_name,
-                    slug=slugify(product_line_name)
-                )
-                db.add(product_line)
-                db.flush()
-            elif not product_line.slug:
-                product_line.slug = slugify(product_line.name)
-                db.add(product_line)
-                db.flush()
-
-            details = {
-                key: row[key]
-                for key in df.columns
-                if key not in base_columns and pd.notna(row[key])
-            }
-
-            if "Описание" in row and pd.notna(row["Описание"]):
-                details["Описание"] = str(row["Описание"]).strip()
-
-            images = row.get("Img", "").split(",")
-            images = [img.strip() for img in images if img.strip()]
-
-            img_mini_raw = row.get("Img_mini", "")
-            img_mini = [img.strip() for img in img_mini_raw.split(",") if img.strip()]
-            if not img_mini:
-                img_mini = None
-
-            # Проверка существующего продукта
-            existing_product = next(
-                (
-                    p for p in existing_products
-                    if p.name.strip().lower() == product_name.lower()
-                ),
-                None
-            )
-
-            if existing_product:
-                updated = False
-
-                new_price = float(row["Цена"])
-                new_favorite = (
-                    str(row["is_favorite"]).strip().lower() in ["true", "TRUE"]
-                )
-
-                if existing_product.price != new_price:
-                    existing_product.price = new_price
-                    updated = True
-
-                if existing_product.favorite != new_favorite:
-                    existing_product.favorite = new_favorite
-                    updated = True
-
-                if existing_product.details != details:
-                    existing_product.details = details
-                    updated = True
-
-                if existing_product.img_mini != img_mini:
-                    existing_product.img_mini = img_mini
-                    updated = True
-
-                # Обновляем slug только если ИМЯ изменилось
-                if existing_product.name.strip().lower() != product_name.lower():
-                    base_slug = slugify(product_name)
-                    new_slug = base_slug
-                    counter = 1
-                    while new_slug in seen_slugs:
-                        new_slug = f"{base_slug}-{counter}"
-                        counter += 1
-                    seen_slugs.add(new_slug)
-
-                    existing_product.slug = new_slug
-                    updated = True
-
-                if updated:
-                    products_to_update.append(existing_product)
-
-                # Обновляем изображения, если изменились
-                existing_image_urls = {img.image_url for img in existing_product.images}
-                if set(images) != existing_image_urls:
-                    db.query(ProductImage).filter(
-                        ProductImage.product_id == existing_product.id
-                    ).delete()
-                    for img in images:
-                        images_to_add.append(
-                            ProductImage(product_id=existing_product.id, image_url=img)
-                        )
-
-            else:
-                product = Product(
-                    name=product_name,
-                    slug=new_slug,
-                    price=float(row["Цена"]),
-                    product_line_id=product_line.id,
-                    favorite=(
-                        str(row["is_favorite"]).strip().lower() in ["true", "TRUE"]
-                    ),
-                    details=details,
-                    img_mini=img_mini,
-                    rating=0.0,
-                    full_name=row.get("full_name") 
-                )
-
-                products_to_add.append(product)
-
-                for img in images:
-                    images_to_add.append(
-                        ProductImage(product=product, image_url=img)
-                    )
-
-        # Удаляем отсутствующие в таблице продукты
-        products_to_delete = [
-            p for p in existing_products
-            if p.name.strip().lower() not in {
-                n.strip().lower() for n in sheet_product_names
-            }
-        ]
-
-        for product in products_to_delete:
-            db.delete(product)
-
-        db.bulk_save_objects(products_to_update)
-        db.add_all(products_to_add)
-        db.add_all(images_to_add)
-        db.commit()
-
-        return {
-            "message": (
-                f"{len(products_to_add)} новых продуктов добавлено, "
-                f"{len(products_to_update)} обновлено, {len(products_to_delete)} удалено!"
-            )
-        }
+# Эндпоинт загрузки продуктов из CSV/XLSX: файл пишется на диск потоком и читается пачками
+@router.post("/upload_file", status_code=202)
+async def upload_products_file(
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Только посчитать изменения, ничего не записывая"),
+):
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in IMPORT_FILE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Поддерживаются только файлы .csv и .xlsx")
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Ошибка обработки данных: {str(e)}")
+    path = await save_upload_to_disk(file, suffix)
+    chunks = FileChunks(path, IMPORT_CHUNK_SIZE)
+    try:
+        job_id = await enqueue_import(f"file:{file.filename}", chunks, dry_run=dry_run)
+    except Exception:
+        chunks.close()
+        raise
+
+    return {"job_id": job_id, "status": "queued"}
+
+# Статус фонового импорта
+@router.get("/import_jobs/{job_id}")
+async def get_import_job_status(job_id: str):
+    job = await get_import_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача импорта не найдена")
+    return job
+
+@router.get("/categories", dependencies=[Depends(query_budget(1))], response_model=List[schemas.CategoryResponse])
+@cache_response()
+async def get_categories(
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+):
+    if snapshot:
+        return list(snapshot.categories)
 
-@router.get("/categories", response_model=List[schemas.CategoryResponse])
-def get_categories(db: Session = Depends(get_db)):
-    categories = db.query(models.Category).all()
+    categories = (await db.execute(select(models.Category))).scalars().all()
     return categories
 
-@router.get("/producers", response_model=List[schemas.ProducerResponse])
-def get_producers(db: Session = Depends(get_db)):
-    producers = db.query(models.Producer).all()
+@router.get("/producers", dependencies=[Depends(query_budget(1))], response_model=List[schemas.ProducerResponse])
+@cache_response()
+async def get_producers(
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+):
+    if snapshot:
+        return list(snapshot.producers)
+
+    producers = (await db.execute(select(models.Producer))).scalars().all()
     return producers
 
-@router.get("/product_lines", response_model=List[schemas.ProductLineResponse])
-def get_product_lines(db: Session = Depends(get_db)):
-    product_lines = db.query(models.ProductLine).all()
+@router.get("/product_lines", dependencies=[Depends(query_budget(1))], response_model=List[schemas.ProductLineResponse])
+@cache_response()
+async def get_product_lines(
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+):
+    if snapshot:
+        return list(snapshot.product_lines)
+
+    product_lines = (await db.execute(select(models.ProductLine))).scalars().all()
     return product_lines
 
-@router.get("/popular", response_model=schemas.PaginatedProducts)
-def get_popular_products(
+@router.get("/popular", dependencies=[Depends(query_budget(2))], response_model=schemas.PaginatedProducts)
+@cache_response()
+async def get_popular_products(
     request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
     sort_by: str = Query("name", pattern="^(price|name)$"),
     order: str = Query("asc", pattern="^(asc|desc)$"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Курсор keyset-пагинации, пустая строка — первая страница"),
+    with_total: bool = Query(False, description="Считать total в режиме курсора"),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+    filters: ProductFilters = Depends(product_filters),
 ):
-    query = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(Product.favorite == True)
-    )
+    query = select_product_previews().where(Product.favorite == True)
 
-    products, total, pages = paginate_and_sort_products(query, page, limit, sort_by, order)
-
-    add_absolute_img_urls(products)
+    products, total, pages, next_cursor = await paginate_and_sort_products(
+        db, query, page, limit, sort_by, order, cursor, with_total,
+        count_key=("favorite",), snapshot=snapshot, filters=filters
+    )
 
-    for product in products:
-        category_slug = product.product_line.producer.category.slug
-        producer_slug = product.product_line.producer.slug
-        product.self = f"/{category_slug}/{producer_slug}/{product.slug}"
+    return paginated_products_response(products, total, page, limit, pages, next_cursor)
 
-    return {
-        "items": products,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": pages
-    }
+# Значения характеристик и диапазон цен для фильтров категории или производителя.
+# Считаются при импорте (catalog_facets), здесь только читаются
+@router.get("/facets", dependencies=[Depends(query_budget(2))], response_model=schemas.FacetsResponse)
+@cache_response()
+async def get_facets(
+    category_slug: str,
+    producer_slug: str = "",
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+):
+    if snapshot:
+        return snapshot.facets(category_slug, producer_slug)
+    return await get_catalog_facets(db, category_slug, producer_slug)
+
+# Актуальные цена, название и наличие товаров корзины одним запросом (вместо запроса на каждый товар).
+# Элементы по возрастанию id без повторов: ключ кеша не зависит от порядка параметров
+@router.get("/lookup", dependencies=[Depends(query_budget(1))], response_model=schemas.ProductLookupResponse)
+@cache_response()
+async def get_products_lookup(
+    ids: List[int] = Query(..., min_length=1, max_length=PRODUCT_LOOKUP_MAX_IDS),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+):
+    ids = sorted(set(ids))
+    products = snapshot.lookup_products(ids) if snapshot else await lookup_products(db, ids)
+    return {"items": [product_lookup_item(product_id, products.get(product_id)) for product_id in ids]}
 
-@router.get("/search", response_model=List[schemas.ProductSearchItem])
-def search_products_raw(
+@router.get("/search", dependencies=[Depends(query_budget(1))], response_model=List[schemas.ProductSearchItem])
+async def search_products_raw(
     query: str = Query(..., min_length=2, description="Поисковый запрос"),
     limit: int = Query(10, ge=1, le=50),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    q = query.strip()
-
-    products = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(Product.full_name.ilike(f"%{q}%"))
-        .limit(limit)
-        .all()
-    )
-
-    for product in products:
-        category_slug = product.product_line.producer.category.slug
-        producer_slug = product.product_line.producer.slug
-        product.self = f"/{category_slug}/{producer_slug}/{product.slug}"
+    products = (await db.execute(select_search_products(query, limit))).scalars().all()
 
-    return products
+    return [
+        {
+            "id": product.id,
+            # search_text находит товар и по линейке с производителем, а full_name импорт может оставить пустым
+            "full_name": product.full_name or product.name,
+            "self": f"/{product.product_line.producer.category.slug}/{product.product_line.producer.slug}/{product.slug}",
+        }
+        for product in products
+    ]
 
-@router.get("/{category_slug}", response_model=schemas.PaginatedProducts)
-def get_products_by_category_slug(
+@router.get("/{category_slug}", dependencies=[Depends(query_budget(2))], response_model=schemas.PaginatedProducts)
+@cache_response()
+async def get_products_by_category_slug(
     request: Request,
     category_slug: str,
     page: int = Query(1, ge=1),
     limit: int = Query(12, ge=1, le=100),
     sort_by: str = Query("name", pattern="^(price|name)$"),
     order: str = Query("asc", pattern="^(asc|desc)$"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Курсор keyset-пагинации, пустая строка — первая страница"),
+    with_total: bool = Query(False, description="Считать total в режиме курсора"),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+    filters: ProductFilters = Depends(product_filters),
 ):
-    query = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(Category.slug == category_slug)
-    )
-
-    products, total, pages = paginate_and_sort_products(query, page, limit, sort_by, order)
-
-    add_absolute_img_urls(products)
+    query = select_product_previews().where(Category.slug == category_slug)
 
-    for product in products:
-        producer_slug = product.product_line.producer.slug
-        product.self = f"/{category_slug}/{producer_slug}/{product.slug}"
+    products, total, pages, next_cursor = await paginate_and_sort_products(
+        db, query, page, limit, sort_by, order, cursor, with_total,
+        count_key=("category", category_slug), snapshot=snapshot, filters=filters
+    )
 
-    return {
-        "items": products,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": pages
-    }
+    return paginated_products_response(products, total, page, limit, pages, next_cursor)
 
-@router.get("/{category_slug}/{producer_slug}", response_model=schemas.PaginatedProducts)
-def get_products_by_producer_slug(
+@router.get("/{category_slug}/{producer_slug}", dependencies=[Depends(query_budget(2))], response_model=schemas.PaginatedProducts)
+@cache_response()
+async def get_products_by_producer_slug(
     request: Request,
     category_slug: str,
     producer_slug: str,
@@ -319,54 +216,55 @@ def get_products_by_producer_slug(
     limit: int = Query(12, ge=1, le=10000),
     sort_by: str = Query("name", pattern="^(price|name)$"),
     order: str = Query("asc", pattern="^(asc|desc)$"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Курсор keyset-пагинации, пустая строка — первая страница"),
+    with_total: bool = Query(False, description="Считать total в режиме курсора"),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
+    filters: ProductFilters = Depends(product_filters),
 ):
-    query = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(
-            Producer.slug == producer_slug,
-            Category.slug == category_slug
-        )
+    query = select_product_previews().where(
+        Producer.slug == producer_slug,
+        Category.slug == category_slug
     )
 
-    products, total, pages = paginate_and_sort_products(query, page, limit, sort_by, order)
-
-    add_absolute_img_urls(products)
-
-    for product in products:
-        product.self = f"/{category_slug}/{producer_slug}/{product.slug}"
+    products, total, pages, next_cursor = await paginate_and_sort_products(
+        db, query, page, limit, sort_by, order, cursor, with_total,
+        count_key=("producer", category_slug, producer_slug), snapshot=snapshot, filters=filters
+    )
 
-    return {
-        "items": products,
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "pages": pages
-    }
+    return paginated_products_response(products, total, page, limit, pages, next_cursor)
 
-@router.get("/{category_slug}/{producer_slug}/{product_slug}", response_model=schemas.ProductResponse)
-def get_product_by_slug(
+@router.get("/{category_slug}/{producer_slug}/{product_slug}", dependencies=[Depends(query_budget(2))], response_model=schemas.ProductResponse)
+@cache_response()
+async def get_product_by_slug(
     category_slug: str,
     producer_slug: str,
     product_slug: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
 ):
-    product = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(
+    if snapshot:
+        product = snapshot.product_detail(category_slug, producer_slug, product_slug)
+        if not product:
+            raise HTTPException(status_code=404, detail="Продукт не найден")
+        return product
+
+    product = (await db.execute(
+        with_catalog_path(
+            select(Product)
+            .join(ProductLine)
+            .join(Producer)
+            .join(Category)
+        )
+        .options(selectinload(Product.images))
+        .where(
             Product.slug == product_slug,
             Producer.slug == producer_slug,
             Category.slug == category_slug
         )
-        .first()
-    )
+        .limit(1)
+    )).scalars().first()
 
     if not product:
         raise HTTPException(status_code=404, detail="Продукт не найден")
@@ -395,38 +293,54 @@ def get_product_by_slug(
 
     return product
 
-@router.get("/{category_slug}/{producer_slug}/{product_slug}/related")
-def get_related_products(
+@router.get("/{category_slug}/{producer_slug}/{product_slug}/related", dependencies=[Depends(query_budget(2))])
+@cache_response()
+async def get_related_products(
     category_slug: str,
     producer_slug: str,
     product_slug: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot),
 ):
-    product = (
-        db.query(Product)
-        .join(ProductLine)
-        .join(Producer)
-        .join(Category)
-        .filter(
+    if snapshot:
+        related = snapshot.related_products(category_slug, producer_slug, product_slug)
+        if not related:
+            raise HTTPException(status_code=404, detail="Продукт не найден")
+        return related
+
+    product = (await db.execute(
+        with_catalog_path(
+            select(Product)
+            .join(ProductLine)
+            .join(Producer)
+            .join(Category)
+        )
+        .where(
             Product.slug == product_slug,
             Producer.slug == producer_slug,
             Category.slug == category_slug,
         )
-        .first()
-    )
+        .limit(1)
+    )).scalars().first()
 
     if not product:
         raise HTTPException(status_code=404, detail="Продукт не найден")
 
-    related_products = (
-        db.query(Product)
-        .filter(
+    related_products = (await db.execute(
+        with_catalog_path(
+            select(Product)
+            .join(ProductLine)
+            .join(Producer)
+            .join(Category)
+        )
+        .where(
             Product.product_line_id == product.product_line_id,
             Product.id != product.id
         )
+        # Тот же порядок, что у снимка каталога (products_by_line)
+        .order_by(Product.id)
         .limit(10)
-        .all()
-    )
+    )).scalars().all()
 
     add_absolute_img_urls(related_products)
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, HttpUrl
+from pydantic import BaseModel, EmailStr, HttpUrl, Field
 from typing import List, Optional, Dict, TYPE_CHECKING, Literal
 
 class UserResponse(BaseModel):
@@ -79,9 +79,21 @@ class ProductBase(BaseModel):
 class ProductCreate(ProductBase):
     pass
 
+# Производные картинки для <picture>: <source type srcset> на каждый формат и запасной src
+class ImageSource(BaseModel):
+    type: str  # image/avif, image/webp
+    srcset: str  # "url 320w, url 640w"
+
+class ImageVariants(BaseModel):
+    src: str
+    width: int
+    height: int
+    sources: List[ImageSource]
+
 class ProductImageResponse(BaseModel):
     id: int
     image_url: str
+    variants: Optional[ImageVariants] = None  # None, пока scripts/build_image_variants.py не обработал картинку
 
     class Config:
         from_attributes = True
@@ -93,6 +105,7 @@ class BreadcrumbItem(BaseModel):
 class ProductResponse(ProductBase):
     id: int
     images: List[ProductImageResponse] = []
+    img_mini_variants: Optional[List[Optional[ImageVariants]]] = None  # по порядку img_mini
     self: Optional[str] = None
     full_name: Optional[str] = None 
     breadcrumbs: List[BreadcrumbItem] = []
@@ -108,6 +121,7 @@ class ProductPreview(BaseModel):
     favorite: bool
     product_line_id: int
     img_mini: Optional[List[str]] = None
+    img_mini_variants: Optional[List[Optional[ImageVariants]]] = None
     self: Optional[str] = None
 
     class Config:
@@ -115,10 +129,25 @@ class ProductPreview(BaseModel):
 
 class PaginatedProducts(BaseModel):
     items: List[ProductPreview]
-    total: int
+    total: Optional[int] = None  # В режиме курсора считается только по with_total=true
     page: int
     limit: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+class Facet(BaseModel):
+    name: str
+    values: List[FacetValue]
+
+class FacetsResponse(BaseModel):
+    total: int
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    attributes: List[Facet] = []
 
 class ProductSearchItem(BaseModel):
     id: int
@@ -130,15 +159,30 @@ class ProductSearchItem(BaseModel):
 
 class CartProduct(BaseModel):
     id: int
-    full_name: str
-    quantity: int
-    price: float
+    quantity: int = Field(gt=0)
+    # Цена и название берутся из каталога на сервере; поля оставлены для совместимости со старыми клиентами
+    full_name: Optional[str] = None
+    price: Optional[float] = None
 
 class TelegramOrderRequest(BaseModel):
     phone: str
     source: Literal["buy_now", "cart"]
     items: List[CartProduct]
 
+class ProductLookupItem(BaseModel):
+    id: int
+    # False — товара больше нет в каталоге, остальные поля тогда не заполняются
+    available: bool
+    name: Optional[str] = None
+    full_name: Optional[str] = None
+    price: Optional[float] = None
+    img_mini: Optional[List[str]] = None
+    img_mini_variants: Optional[List[Optional[ImageVariants]]] = None
+    self: Optional[str] = None
+
+class ProductLookupResponse(BaseModel):
+    items: List[ProductLookupItem]
+
 
 
 if TYPE_CHECKING:
@@ -0,0 +1,92 @@
+"""
+Сравнение сериализации листинга: ORM-объекты + response_model (как было)
+против строк из select_product_previews + orjson.
+
+Запуск из корня проекта: python scripts/bench_serialization.py [кол-во товаров] [повторы]
+БД не нужна: строки и объекты собираются в памяти, замеряется только путь от результата запроса до байтов ответа.
+"""
+import os
+import sys
+import time
+
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+import schemas
+from models import Product, ProductLine, Producer, Category
+from utils.product_utils import add_absolute_img_urls, paginated_products_response
+
+PreviewRow = namedtuple(
+    "PreviewRow",
+    "id name slug price favorite product_line_id img_mini category_slug producer_slug",
+)
+
+
+def make_rows(count: int) -> list:
+    return [
+        PreviewRow(
+            id=i, name=f"Ламинат {i}", slug=f"laminat-{i}", price=1000.0 + i * 0.5, favorite=i % 3 == 0,
+            product_line_id=i % 50 + 1, img_mini=[f"{i}-1.webp", f"{i}-2.webp"] if i % 7 else None,
+            category_slug="laminat", producer_slug="kronotex",
+        )
+        for i in range(count)
+    ]
+
+
+def orm_response(rows: list) -> bytes:
+    # То, что раньше делал роут: ORM-объекты, абсолютные URL, self, затем валидация и json.dumps в FastAPI
+    category = Category(slug="laminat")
+    producer = Producer(slug="kronotex", category=category)
+    line = ProductLine(producer=producer)
+    products = []
+    for row in rows:
+        product = Product(
+            id=row.id, name=row.name, slug=row.slug, price=row.price, favorite=row.favorite,
+            product_line_id=row.product_line_id, img_mini=row.img_mini,
+        )
+        product.product_line = line
+        products.append(product)
+
+    add_absolute_img_urls(products)
+    for product in products:
+        product.self = f"/{product.product_line.producer.category.slug}/{product.product_line.producer.slug}/{product.slug}"
+
+    content = {"items": products, "total": len(rows), "page": 1, "limit": len(rows), "pages": 1, "next_cursor": None}
+    adapter = TypeAdapter(schemas.PaginatedProducts)
+    return JSONResponse(adapter.dump_python(adapter.validate_python(content), mode="json")).body
+
+
+def row_response(rows: list) -> bytes:
+    return paginated_products_response(rows, len(rows), 1, len(rows), 1, None).body
+
+
+def measure(func, rows: list, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rows = make_rows(count)
+
+    if orm_response(rows) != row_response(rows):
+        sys.exit("❌ Ответы различаются")
+
+    orm_time = measure(orm_response, rows, repeats)
+    row_time = measure(row_response, rows, repeats)
+    print(f"Товаров: {count}, лучший из {repeats} прогонов")
+    print(f"ORM + response_model: {orm_time * 1000:8.1f} мс  {orm_time / count * 1e6:6.2f} мкс/товар")
+    print(f"строки + orjson:      {row_time * 1000:8.1f} мс  {row_time / count * 1e6:6.2f} мкс/товар")
+    print(f"Ускорение: x{orm_time / row_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
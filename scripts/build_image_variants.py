@@ -0,0 +1,185 @@
+"""
+Производные картинок товаров: уменьшенные AVIF/WebP под ширины фронтенда (IMAGE_WIDTHS_*).
+
+Запуск из корня проекта: python scripts/build_image_variants.py [--force] [--prune] [--workers N]
+Исходники — static/uploads (галерея) и static/uploads/minify (карточки), результат — static/uploads/v
+и манифест v/manifest.json, по которому API отдаёт srcset. Имена файлов содержат хеш содержимого,
+поэтому раздаются с Cache-Control: immutable.
+
+Картинки, чей sha256 не изменился с прошлого запуска, пропускаются. После изменений
+поднимается версия каталога — закешированные ответы API пересобираются уже с новыми URL.
+--force  пересобрать всё
+--prune  удалить файлы, на которые манифест больше не ссылается (старые URL могут ещё жить
+         в кеше браузеров и CDN — чистить стоит не сразу после пересборки)
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image, ImageOps
+from utils.image_variants import (
+    UPLOADS_DIR, VARIANTS_DIR, MANIFEST_PATH, MINI_PREFIX, IMAGE_WIDTHS, IMAGE_FORMATS, IMAGE_QUALITY,
+    image_kind, settings_fingerprint, load_manifest,
+)
+
+SOURCE_EXTENSIONS = (".webp", ".jpg", ".jpeg", ".png", ".avif")
+HASH_LENGTH = 12
+
+
+def find_sources() -> list:
+    """Пути исходников относительно uploads: файлы галереи и minify/<файл>."""
+    sources = []
+    for prefix in ("", MINI_PREFIX):
+        directory = os.path.join(UPLOADS_DIR, prefix)
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.lower().endswith(SOURCE_EXTENSIONS):
+                sources.append(prefix + entry.name)
+    return sorted(sources)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def target_widths(source_width: int, widths: tuple) -> list:
+    # Ширины уже исходника не растягиваем; вместо них — сам исходник в полную ширину
+    fitting = [width for width in widths if width < source_width]
+    if len(fitting) < len(widths):
+        fitting.append(source_width)
+    return fitting
+
+
+def _write_once(name: str, data: bytes):
+    # Одинаковое имя — одинаковое содержимое: существующий файл не трогаем
+    path = os.path.join(VARIANTS_DIR, name)
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_variants(source: str, source_hash: str) -> dict:
+    """Выполняется в процессе пула: все ширины и форматы одного исходника, запись в манифест."""
+    with Image.open(os.path.join(UPLOADS_DIR, source)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = {fmt: [] for fmt in IMAGE_FORMATS}
+    for width in target_widths(image.width, IMAGE_WIDTHS[image_kind(source)]):
+        resized = image if width == image.width else image.resize(
+            (width, max(round(image.height * width / image.width), 1)), Image.Resampling.LANCZOS
+        )
+        for fmt in IMAGE_FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=IMAGE_QUALITY[fmt])
+            data = buffer.getvalue()
+            name = f"{stem}-{width}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.{fmt}"
+            _write_once(name, data)
+            variants[fmt].append([width, name])
+
+    return {"hash": source_hash, "width": image.width, "height": image.height, "variants": variants}
+
+
+def is_fresh(entry: dict, source_hash: str) -> bool:
+    return (
+        entry is not None
+        and entry["hash"] == source_hash
+        and all(
+            os.path.exists(os.path.join(VARIANTS_DIR, name))
+            for files in entry["variants"].values() for _, name in files
+        )
+    )
+
+
+def write_manifest(manifest: dict):
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def prune(manifest: dict) -> int:
+    referenced = {name for entry in manifest["images"].values() for files in entry["variants"].values() for _, name in files}
+    removed = 0
+    for entry in os.scandir(VARIANTS_DIR):
+        if entry.is_file() and entry.path != MANIFEST_PATH and entry.name not in referenced:
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка AVIF/WebP производных картинок товаров")
+    parser.add_argument("--force", action="store_true", help="пересобрать все картинки")
+    parser.add_argument("--prune", action="store_true", help="удалить файлы, которых нет в манифесте")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов в пуле")
+    args = parser.parse_args()
+
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    previous = load_manifest()
+    settings = settings_fingerprint()
+    force = args.force or previous["settings"] != settings
+
+    sources = find_sources()
+    images, pending = {}, {}
+    for source in sources:
+        source_hash = file_digest(os.path.join(UPLOADS_DIR, source))
+        entry = previous["images"].get(source)
+        if not force and is_fresh(entry, source_hash):
+            images[source] = entry
+        else:
+            pending[source] = source_hash
+
+    failed = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(render_variants, source, source_hash): source for source, source_hash in pending.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                source = futures[future]
+                try:
+                    images[source] = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {source}: {e}")
+                    # Прежние производные лучше, чем никаких
+                    if source in previous["images"]:
+                        images[source] = previous["images"][source]
+                if done % 100 == 0:
+                    print(f"   {done}/{len(pending)}")
+
+    manifest = {"settings": settings, "images": images}
+    changed = manifest != previous
+    if changed:
+        write_manifest(manifest)
+    print(f"✅ Исходников: {len(sources)}, собрано: {len(pending) - failed}, без изменений: {len(sources) - len(pending)}, ошибок: {failed}")
+    if args.prune:
+        print(f"🧹 Удалено неиспользуемых файлов: {prune(manifest)}")
+
+    if changed:
+        # Ответы каталога в Redis и ETag-и клиентов содержат URL картинок
+        from utils.cache import bump_catalog_version
+        asyncio.run(bump_catalog_version())
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
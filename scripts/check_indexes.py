@@ -0,0 +1,273 @@
+"""
+Проверка, что горячие запросы API идут по индексам (EXPLAIN на засеянных данных).
+
+Запуск из корня проекта: python scripts/check_indexes.py [товаров на линейку]
+Нужна БД с применёнными миграциями (alembic upgrade head). Данные засеваются в транзакции,
+после ANALYZE для каждого запроса снимается EXPLAIN (FORMAT JSON), затем транзакция откатывается —
+база остаётся как была. Код выхода 1, если хоть один запрос не использует ожидаемый индекс.
+
+Листинги берутся из paginate_and_sort_products (записываются запросы, которые он отправил бы в БД),
+поиск — из select_search_products, остальное повторяет запросы роутеров.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from database import engine
+from models import Product, ProductLine, Producer, Category, ProductImage, OrderItem, RefreshSession, CatalogFacet
+from utils.product_utils import (
+    select_product_previews, select_search_products, paginate_and_sort_products, encode_cursor,
+    with_catalog_path, refresh_catalog_counts, ProductFilters,
+)
+
+PREFIX = "explain-check"
+CATEGORIES = 12
+PRODUCERS_PER_CATEGORY = 10
+LINES_PER_PRODUCER = 5
+
+SEED_SQL = """
+INSERT INTO categories (name, slug)
+SELECT '{prefix} ' || g, '{prefix}-' || g FROM generate_series(1, :categories) g;
+
+INSERT INTO producers (name, slug, category_id)
+SELECT c.slug || '-' || g, c.slug || '-' || g, c.id
+FROM categories c, generate_series(1, :producers) g WHERE c.slug LIKE '{prefix}-%';
+
+INSERT INTO product_lines (name, slug, producer_id)
+SELECT p.slug || '-' || g, p.slug || '-' || g, p.id
+FROM producers p, generate_series(1, :lines) g WHERE p.slug LIKE '{prefix}-%';
+
+INSERT INTO products (name, full_name, slug, product_line_id, price, img_mini, rating, favorite, details, search_text)
+SELECT
+    'Товар ' || l.id || '-' || g, 'Ламинат ' || l.slug || ' ' || g, l.slug || '-' || g, l.id,
+    500 + (l.id * 7919 + g * 104729) % 5000, '["1.webp"]', 0, g % 20 = 0,
+    jsonb_build_object(
+        'Цвет', (ARRAY['Дуб', 'Орех', 'Ясень', 'Бук', 'Клён'])[1 + g % 5],
+        'Класс', (31 + g % 3)::text,
+        'Толщина', (7 + (l.id + g) % 6)::text
+    ),
+    'ламинат ' || l.slug || ' ' || g
+FROM product_lines l, generate_series(1, :products) g WHERE l.slug LIKE '{prefix}-%';
+
+INSERT INTO product_images (product_id, image_url)
+SELECT p.id, p.slug || '-' || g || '.webp'
+FROM products p, generate_series(1, 3) g WHERE p.slug LIKE '{prefix}-%';
+
+INSERT INTO users (name, email, hashed_password, is_admin)
+SELECT 'user', '{prefix}-' || g || '@example.com', 'x', false
+FROM generate_series(1, :users) g;
+
+INSERT INTO refresh_sessions (digest, user_id, expires_at)
+SELECT encode(sha256(convert_to(u.id || '-' || g, 'UTF8')), 'hex'), u.id, now() + interval '7 days'
+FROM users u, generate_series(1, 2) g WHERE u.email LIKE '{prefix}-%' AND u.id % 4 = 0;
+
+INSERT INTO orders (customer_phone, source, created_at, total_amount)
+SELECT '{prefix}', 'cart', '2026-01-01T00:00:00', 0 FROM generate_series(1, :orders);
+
+INSERT INTO order_items (order_id, product_id, quantity)
+SELECT o.id, p.id, 1
+FROM orders o
+JOIN LATERAL (SELECT id FROM products WHERE slug LIKE '{prefix}-%' ORDER BY id LIMIT 3) p ON true
+WHERE o.customer_phone = '{prefix}';
+""".format(prefix=PREFIX)
+
+ANALYZED_TABLES = (
+    "categories", "producers", "product_lines", "products", "product_images",
+    "users", "refresh_sessions", "orders", "order_items", "catalog_counts", "catalog_facets",
+)
+
+
+class RecordingSession:
+    """Вместо AsyncSession: запоминает запросы и отвечает пустыми результатами."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return _EmptyResult()
+
+    async def scalar(self, statement):
+        self.statements.append(statement)
+        return 0
+
+
+class _EmptyResult:
+    def all(self):
+        return []
+
+
+def listing_statements(query, sort_by="name", order="asc", cursor=None, count_key=None, filters=None) -> list:
+    db = RecordingSession()
+    asyncio.run(paginate_and_sort_products(
+        db, query, page=2, limit=12, sort_by=sort_by, order=order, cursor=cursor,
+        count_key=count_key, filters=filters,
+    ))
+    return db.statements
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN поверх любого запроса: параметры привязываются как обычно (JSONB в том числе)."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def explain(conn, statement) -> dict:
+    return conn.execute(Explain(statement)).scalar()[0]["Plan"]
+
+
+def used_indexes(plan: dict) -> set:
+    found = set()
+    if "Index Name" in plan:
+        found.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found |= used_indexes(child)
+    return found
+
+
+def plan_summary(plan: dict, depth: int = 0) -> list:
+    line = "  " * depth + plan["Node Type"]
+    if "Index Name" in plan:
+        line += f" using {plan['Index Name']}"
+    elif "Relation Name" in plan:
+        line += f" on {plan['Relation Name']}"
+    lines = [line]
+    for child in plan.get("Plans", []):
+        lines += plan_summary(child, depth + 1)
+    return lines
+
+
+def hot_queries(conn) -> list:
+    """(название, запрос, допустимые индексы): запрос проходит, если план использует хотя бы один из них."""
+    category_slug = f"{PREFIX}-2"
+    producer_slug = f"{PREFIX}-2-3"
+    product = conn.execute(
+        select(Product.id, Product.slug, Product.name, Product.price, Product.product_line_id)
+        .where(Product.slug.like(f"{producer_slug}-%"))
+        .order_by(Product.id)
+        .limit(1)
+    ).one()
+    session_digest = conn.scalar(select(RefreshSession.digest).order_by(RefreshSession.created_at.desc()).limit(1))
+    order_id = conn.scalar(text("SELECT max(id) FROM orders WHERE customer_phone = :prefix"), {"prefix": PREFIX})
+
+    by_line = {"ix_products_line_name", "ix_products_line_price"}
+    category = select_product_previews().where(Category.slug == category_slug)
+    producer = select_product_previews().where(Category.slug == category_slug, Producer.slug == producer_slug)
+    popular = select_product_previews().where(Product.favorite == True)
+    filters = ProductFilters(attributes={"Цвет": {"Орех"}, "Класс": {"33"}})
+
+    queries = []
+
+    def listing(name, query, expected, **kwargs):
+        statements = listing_statements(query, **kwargs)
+        queries.append((name, statements[-1], expected))
+        return statements
+
+    # Главный запрос листинга — последний; перед ним total: из catalog_counts (пара строк, индекс не нужен) или COUNT(*)
+    # Категория и производитель: товары их линеек по product_line_id, сортировка уже по выбранным строкам
+    listing("category: name asc", category, by_line, count_key=("category", category_slug))
+    listing("category: price desc", category, by_line, sort_by="price", order="desc")
+    listing(
+        "category: keyset", category, by_line,
+        cursor=encode_cursor("name", "asc", product), count_key=("category", category_slug),
+    )
+    listing("producer: name asc", producer, by_line)
+    listing("producer: price asc", producer, by_line, sort_by="price")
+    listing("popular: name asc", popular, {"ix_products_favorite_name"})
+    listing("popular: price desc", popular, {"ix_products_favorite_price"}, sort_by="price", order="desc")
+    listing("popular: keyset", popular, {"ix_products_favorite_name"}, cursor=encode_cursor("name", "asc", product))
+    statements = listing("category: attribute filters", category, {"ix_products_details"} | by_line, filters=filters)
+    queries.append(("category: filtered COUNT(*)", statements[0], {"ix_products_details"} | by_line))
+
+    queries += [
+        (
+            "facets", select(CatalogFacet)
+            .where(CatalogFacet.category_slug == category_slug, CatalogFacet.producer_slug == "")
+            .order_by(CatalogFacet.attribute, CatalogFacet.total.desc(), CatalogFacet.value),
+            {"catalog_facets_pkey"},
+        ),
+        (
+            "product detail", with_catalog_path(select(Product).join(ProductLine).join(Producer).join(Category))
+            .where(Product.slug == product.slug, Producer.slug == producer_slug, Category.slug == category_slug)
+            .limit(1),
+            {"ix_products_slug"},
+        ),
+        (
+            "product detail: images (selectinload)",
+            select(ProductImage).where(ProductImage.product_id.in_([product.id])),
+            {"ix_product_images_product_id"},
+        ),
+        (
+            "related products", with_catalog_path(select(Product).join(ProductLine).join(Producer).join(Category))
+            .where(Product.product_line_id == product.product_line_id, Product.id != product.id)
+            .order_by(Product.id)
+            .limit(10),
+            by_line,
+        ),
+        ("search", select_search_products("ламинат 2-3", 10), {"ix_products_search_text_trgm"}),
+        (
+            # Postgres-хранилище refresh-сессий (REFRESH_SESSION_STORE=postgres или Redis недоступен)
+            "refresh: session by digest",
+            delete(RefreshSession)
+            .where(RefreshSession.digest == session_digest, RefreshSession.expires_at > func.now())
+            .returning(RefreshSession.user_id),
+            {"refresh_sessions_pkey"},
+        ),
+        ("order items", select(OrderItem).where(OrderItem.order_id == order_id), {"ix_order_items_order_id"}),
+    ]
+    return queries
+
+
+def main():
+    products_per_line = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    failed = 0
+
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            conn.execute(text(SEED_SQL), {
+                "categories": CATEGORIES, "producers": PRODUCERS_PER_CATEGORY, "lines": LINES_PER_PRODUCER,
+                "products": products_per_line, "users": 20000, "orders": 5000,
+            })
+            with Session(bind=conn) as db:
+                refresh_catalog_counts(db)
+                db.flush()
+            for table in ANALYZED_TABLES:
+                conn.execute(text(f"ANALYZE {table}"))
+
+            total = conn.scalar(select(text("count(*)")).select_from(Product))
+            print(f"Товаров в базе с засевом: {total}\n")
+
+            for name, statement, expected in hot_queries(conn):
+                plan = explain(conn, statement)
+                used = used_indexes(plan)
+                ok = bool(used & expected)
+                failed += not ok
+                print(f"{'✅' if ok else '❌'} {name}: {', '.join(sorted(used)) or 'без индексов'}")
+                if not ok:
+                    print(f"   ожидался один из: {', '.join(sorted(expected))}")
+                    print("\n".join("   " + line for line in plan_summary(plan)))
+        finally:
+            transaction.rollback()
+
+    if failed:
+        sys.exit(f"\n❌ Запросов без ожидаемого индекса: {failed}")
+    print("\n✅ Все запросы используют индексы")
+
+
+if __name__ == "__main__":
+    main()
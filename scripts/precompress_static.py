@@ -0,0 +1,141 @@
+"""
+Сжатые копии статики для PrecompressedStaticFiles: рядом с файлом кладутся <файл>.br и <файл>.gz.
+
+Запуск при деплое (docker-compose делает это перед стартом uvicorn): python scripts/precompress_static.py [--workers N]
+Сжимаются только текстовые форматы (COMPRESSIBLE_EXTENSIONS); картинки уже сжаты.
+Копия пересоздаётся, если исходник новее; копии без исходника удаляются; копия, которая
+не меньше исходника хотя бы на MIN_SAVING, не сохраняется — файл отдаётся как есть, а решение
+записывается в SKIPPED_PATH, чтобы следующий запуск не сжимал неизменившийся файл заново.
+Сжатие максимальное (brotli 11, gzip 9): оно делается один раз, а не на каждый запрос.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brotli
+from concurrent.futures import ProcessPoolExecutor
+from utils.compression import COMPRESSIBLE_EXTENSIONS, PRECOMPRESSED_SUFFIXES
+from utils.image_variants import STATIC_DIR
+
+MIN_SAVING = 0.05
+# {"min_saving": ..., "files": {путь относительно STATIC_DIR: {кодировка: st_mtime_ns исходника}}} —
+# копии, которые не стоило сохранять. Другой MIN_SAVING — решения пересматриваются.
+# Лежит вне STATIC_DIR: всё, что там, раздаётся публично под /static
+PRECOMPRESS_CACHE_DIR = os.getenv(
+    "PRECOMPRESS_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+)
+SKIPPED_PATH = os.path.join(PRECOMPRESS_CACHE_DIR, "precompress-skipped.json")
+
+COMPRESSORS = {
+    "br": lambda data: brotli.compress(data, quality=11),
+    "gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+}
+
+
+def find_files() -> tuple:
+    """(исходники для сжатия, сжатые копии без исходника)."""
+    sources, orphans = [], []
+    suffixes = tuple(PRECOMPRESSED_SUFFIXES.values())
+    for root, _, files in os.walk(STATIC_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(suffixes):
+                source = os.path.splitext(path)[0]
+                if not os.path.exists(source):
+                    orphans.append(path)
+            elif name.endswith(COMPRESSIBLE_EXTENSIONS):
+                sources.append(path)
+    return sorted(sources), orphans
+
+
+def load_skipped() -> dict:
+    try:
+        with open(SKIPPED_PATH, encoding="utf-8") as f:
+            skipped = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return skipped["files"] if skipped.get("min_saving") == MIN_SAVING else {}
+
+
+def save_skipped(files: dict):
+    os.makedirs(PRECOMPRESS_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{SKIPPED_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"min_saving": MIN_SAVING, "files": files}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, SKIPPED_PATH)
+
+
+def precompress(path: str, skipped: dict) -> tuple:
+    """
+    Выполняется в процессе пула. skipped — {кодировка: st_mtime_ns} из прошлых запусков.
+    Возвращает (записано копий, удалено копий, несохранённые копии в том же виде).
+    """
+    source_stat = os.stat(path)
+    data = None
+    written = removed = 0
+    not_worth = {}
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+        sibling = path + suffix
+        try:
+            if os.stat(sibling).st_mtime >= source_stat.st_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        if skipped.get(encoding) == source_stat.st_mtime_ns:
+            not_worth[encoding] = source_stat.st_mtime_ns
+            continue
+
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        compressed = COMPRESSORS[encoding](data)
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            not_worth[encoding] = source_stat.st_mtime_ns
+            if os.path.exists(sibling):
+                os.remove(sibling)
+                removed += 1
+            continue
+
+        tmp_path = f"{sibling}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        # mtime копии = mtime исходника: по нему PrecompressedStaticFiles и следующий запуск видят, что копия свежая
+        os.utime(tmp_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_path, sibling)
+        written += 1
+    return written, removed, not_worth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сжатые копии (.br, .gz) текстовой статики")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="процессов в пуле")
+    args = parser.parse_args()
+
+    sources, orphans = find_files()
+    for orphan in orphans:
+        os.remove(orphan)
+
+    skipped = load_skipped()
+    relative = [os.path.relpath(path, STATIC_DIR) for path in sources]
+    written = removed = 0
+    # Записи удалённых исходников отпадают сами: сохраняются только результаты этого запуска
+    not_worth = {}
+    if sources:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = pool.map(precompress, sources, [skipped.get(name, {}) for name in relative], chunksize=16)
+            for name, (file_written, file_removed, file_not_worth) in zip(relative, results):
+                written += file_written
+                removed += file_removed
+                if file_not_worth:
+                    not_worth[name] = file_not_worth
+    if not_worth != skipped:
+        save_skipped(not_worth)
+    print(f"✅ Файлов: {len(sources)}, сжатых копий записано: {written}, удалено: {removed + len(orphans)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,24 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from dotenv import load_dotenv
 import os
+import uuid
 import models
+from utils.password_pool import crypt_context
+from utils.principal_cache import principal_cache
 
 load_dotenv()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-# Конфигурация для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Конфигурация для хеширования паролей (стоимость — BCRYPT_ROUNDS).
+# Роуты считают bcrypt в пуле процессов utils.password_pool, синхронные функции ниже — для скриптов
+pwd_context = crypt_context()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY")
@@ -38,11 +42,12 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode.update({"exp": expire, "iat": now})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-# Генерация JWT-токена refresh
+# Генерация JWT-токена refresh. jti делает токен уникальным: по нему (через sha256) ищется сессия,
+# а два входа с разных устройств в одну секунду иначе дали бы одинаковые токены
 def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
 
 # Декодирование токена
@@ -53,14 +58,26 @@ def verify_token(token: str, secret_key: str):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")  # Токен недействителен
 
-# Функция для получения текущего пользователя по access_token
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Функция для получения текущего пользователя по access_token.
+# Возвращает Principal (id, email, name, is_admin) из кеша; в БД идёт только при промахе —
+# сессия get_db без запросов соединение из пула не берёт
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     payload = verify_token(token, SECRET_KEY)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid or expired access token")
 
-    user = db.query(models.User).filter(models.User.email == payload["sub"]).first()
+    principal = await principal_cache.get(payload["sub"])
+    if principal is not None:
+        return principal
+
+    user = await db.scalar(select(models.User).where(models.User.email == payload["sub"]))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
+    return await principal_cache.put(user)
+
+# Только для администраторов: служебные эндпоинты (routers/ops.py)
+async def get_current_admin(user=Depends(get_current_user)):
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
     return user
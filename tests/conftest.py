@@ -0,0 +1,95 @@
+"""
+Тесты идут против настоящих Postgres и Redis профиля bench (docker compose --profile bench up -d),
+в отдельной базе TEST_POSTGRES_DB (по умолчанию bench_test): каталог бенчмарков не трогается.
+Без Postgres тесты пропускаются.
+
+Запуск из корня проекта:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Адреса — те же BENCH_*, что у бенчмарков, база — своя
+os.environ["BENCH_POSTGRES_DB"] = os.getenv("TEST_POSTGRES_DB", "bench_test")
+os.environ.setdefault("ENABLE_OUTBOX_DISPATCHER", "false")
+
+from benchmarks.settings import configure_environment
+
+configure_environment()
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+import main
+from database import engine, run_migrations
+from models import Product, ProductLine, Producer, Category
+from benchmarks.catalog import CatalogSpec
+from benchmarks.generate import RESET_TABLES, seed_tree, seed_products
+
+# Небольшой каталог: у производителя несколько линеек, у товаров картинки и характеристики
+TEST_SPEC = CatalogSpec(categories=2, producers=3, lines=3, products=300, seed=1)
+
+
+def ensure_database():
+    maintenance = create_engine(engine.url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    try:
+        with maintenance.connect() as conn:
+            exists = conn.scalar(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": engine.url.database})
+            if not exists:
+                conn.execute(text(f'CREATE DATABASE "{engine.url.database}"'))
+    except OperationalError as e:
+        pytest.skip(f"Postgres недоступен ({engine.url.render_as_string(hide_password=True)}): {e.orig}")
+    finally:
+        maintenance.dispose()
+
+
+@pytest.fixture(scope="session")
+def catalog() -> dict:
+    """Засеивает базу и возвращает данные для адресов: slug-и товара с картинками, его id и т.п."""
+    ensure_database()
+    run_migrations()
+    with Session(engine) as db:
+        db.execute(text(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE"))
+        seed_tree(db, TEST_SPEC)
+        seed_products(db, TEST_SPEC)
+
+        row = db.execute(
+            select(Product.id, Product.slug, Product.details, Product.product_line_id, ProductLine.name, Producer.slug, Category.slug)
+            .join(ProductLine, Product.product_line_id == ProductLine.id)
+            .join(Producer, ProductLine.producer_id == Producer.id)
+            .join(Category, Producer.category_id == Category.id)
+            .where(Product.images.any())
+            .order_by(Product.id)
+            .limit(1)
+        ).one()
+        product_id, product_slug, details, line_id, line_name, producer_slug, category_slug = row
+
+        # Импорт может оставить full_name пустым, а поиск находит товар и по линейке
+        db.execute(
+            update(Product)
+            .where(Product.product_line_id == line_id, Product.id != product_id)
+            .values(full_name=None)
+        )
+        db.commit()
+
+        ids = db.scalars(select(Product.id).order_by(Product.id).limit(5)).all()
+
+    return {
+        "category": category_slug,
+        "producer": producer_slug,
+        "product": product_slug,
+        "line": line_name,
+        "color": details["Цвет"],
+        "ids": "&".join(f"ids={product_id}" for product_id in ids),
+    }
+
+
+@pytest.fixture(scope="session")
+def client(catalog):
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,104 @@
+"""
+Каждый роут с query_budget(n) вызывается на засеянном каталоге, и число запросов к БД
+(get_query_count) сверяется с заявленным бюджетом: N+1 в листингах и карточке товара ловится здесь,
+а не по логам. Новый роут с бюджетом без адреса в ROUTE_CASES роняет test_every_budgeted_route_is_covered.
+"""
+import pytest
+
+from fastapi.routing import APIRoute
+import main
+from utils.query_budget import get_query_count
+
+PRODUCT = "/api/products/{category}/{producer}/{product}"
+
+# Путь роута -> адреса (подставляются значения фикстуры catalog): страницы, сортировки, курсор, фильтры
+ROUTE_CASES = {
+    "/api/products/categories": ["/api/products/categories"],
+    "/api/products/producers": ["/api/products/producers"],
+    "/api/products/product_lines": ["/api/products/product_lines"],
+    "/api/products/popular": [
+        "/api/products/popular",
+        "/api/products/popular?page=2&limit=5&sort_by=price&order=desc",
+        "/api/products/popular?cursor=",
+        "/api/products/popular?cursor=&with_total=true",
+    ],
+    "/api/products/facets": [
+        "/api/products/facets?category_slug={category}",
+        "/api/products/facets?category_slug={category}&producer_slug={producer}",
+    ],
+    "/api/products/lookup": ["/api/products/lookup?{ids}"],
+    "/api/products/search": [
+        "/api/products/search?query={color}",
+        "/api/products/search?query={line}&limit=50",
+    ],
+    "/api/products/{category_slug}": [
+        "/api/products/{category}",
+        "/api/products/{category}?page=3&sort_by=price&order=desc",
+        "/api/products/{category}?cursor=",
+        "/api/products/{category}?price_min=1000&attr=Цвет:{color}",
+    ],
+    "/api/products/{category_slug}/{producer_slug}": [
+        "/api/products/{category}/{producer}",
+        "/api/products/{category}/{producer}?limit=1000",
+        "/api/products/{category}/{producer}?cursor=&sort_by=price",
+        "/api/products/{category}/{producer}?attr=Цвет:{color}",
+    ],
+    "/api/products/{category_slug}/{producer_slug}/{product_slug}": [PRODUCT],
+    "/api/products/{category_slug}/{producer_slug}/{product_slug}/related": [PRODUCT + "/related"],
+}
+
+
+def budgeted_routes() -> dict:
+    """{путь: зависимость query_budget} по роутам приложения."""
+    routes = {}
+    for route in main.app.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        for dependant in route.dependant.dependencies:
+            if hasattr(dependant.call, "max_queries"):
+                routes[route.path] = dependant.call
+    return routes
+
+
+def recording(dependency, observed: list):
+    """Та же зависимость, но перед выходом записывает число запросов и сами запросы."""
+    async def wrapper():
+        budget = dependency()
+        counter = await anext(budget)
+        try:
+            yield counter
+        finally:
+            observed.append((get_query_count(), list(counter.statements)))
+            await anext(budget, None)
+
+    return wrapper
+
+
+@pytest.fixture
+def observed():
+    observed = []
+    overrides = {dependency: recording(dependency, observed) for dependency in budgeted_routes().values()}
+    main.app.dependency_overrides.update(overrides)
+    yield observed
+    for dependency in overrides:
+        main.app.dependency_overrides.pop(dependency, None)
+
+
+def test_every_budgeted_route_is_covered():
+    assert set(budgeted_routes()) == set(ROUTE_CASES)
+
+
+@pytest.mark.parametrize("path", ROUTE_CASES)
+def test_route_within_query_budget(client, catalog, observed, path):
+    max_queries = budgeted_routes()[path].max_queries
+    for template in ROUTE_CASES[path]:
+        url = template.format(**catalog)
+        observed.clear()
+        response = client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code} {response.text[:300]}"
+        assert response.json(), f"{url}: пустой ответ, на засеянном каталоге бюджет не проверяется"
+
+        [(count, statements)] = observed
+        assert 0 < count <= max_queries, (
+            f"{url}: {count} запросов к БД при бюджете {max_queries}\n" + "\n---\n".join(statements)
+        )
@@ -0,0 +1,175 @@
+import os
+import time
+import hashlib
+import logging
+
+from email.utils import formatdate, parsedate_to_datetime
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+ENABLE_RESPONSE_CACHE = os.getenv("ENABLE_RESPONSE_CACHE", "false").lower() == "true"
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "300"))
+# ETag/Last-Modified и 304 для кешируемых роутов; работает и без ENABLE_RESPONSE_CACHE.
+# Выключено по умолчанию, как и кеш ответов: каждый кешируемый GET — лишний round trip в Redis
+ENABLE_CONDITIONAL_GET = os.getenv("ENABLE_CONDITIONAL_GET", "false").lower() == "true"
+# Заголовки Cache-Control для браузера и CDN
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", "60"))
+CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("CACHE_STALE_WHILE_REVALIDATE", "600"))
+
+CATALOG_VERSION_KEY = "catalog:version"
+CATALOG_UPDATED_AT_KEY = "catalog:updated_at"
+# Канал, в который публикуется новая версия каталога (см. utils/catalog_snapshot.py)
+CATALOG_UPDATES_CHANNEL = "catalog:updates"
+CACHE_KEY_PREFIX = "cache:"
+
+# Клиент без decode_responses: в кеше лежат готовые байты JSON
+redis_client = redis.from_url(REDIS_URL)
+
+# Версия каталога, время её смены и закешированный ответ за один round trip.
+# Ключ ответа строится внутри скрипта, т.к. зависит от текущей версии; ARGV[3] = '0' — тело не нужно
+_GET_CACHED_SCRIPT = redis_client.register_script("""
+local version = redis.call('GET', KEYS[1]) or '0'
+local updated_at = redis.call('GET', KEYS[2]) or ''
+local cached = false
+if ARGV[3] == '1' then
+    cached = redis.call('GET', ARGV[1] .. version .. ':' .. ARGV[2])
+end
+return {version, updated_at, cached}
+""")
+
+
+def cache_response(ttl: int = CACHE_DEFAULT_TTL):
+    """
+    Помечает эндпоинт как кешируемый. Работает только в роутерах с route_class=CachedRoute.
+    Декоратор ставится под @router.get(...).
+    """
+    def decorator(func):
+        func.cache_ttl = ttl
+        return func
+    return decorator
+
+
+def build_cache_path(request: Request) -> str:
+    # Нормализуем: одинаковые параметры в разном порядке дают один ключ
+    params = sorted(request.query_params.multi_items())
+    query = "&".join(f"{k}={v}" for k, v in params)
+    return f"{request.url.path}?{query}"
+
+
+def build_etag(version: str, path: str) -> str:
+    # Сильный ETag: тело ответа однозначно определяется версией каталога и параметрами роута
+    return '"' + hashlib.sha256(f"{version}:{path}".encode()).hexdigest()[:32] + '"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, updated_at: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    # If-Modified-Since учитывается, только если нет If-None-Match
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and updated_at:
+        try:
+            return int(float(updated_at)) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def build_validator_headers(version: str, updated_at: str, path: str) -> dict:
+    headers = {
+        "ETag": build_etag(version, path),
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE}, stale-while-revalidate={CACHE_STALE_WHILE_REVALIDATE}",
+    }
+    if updated_at:
+        headers["Last-Modified"] = formatdate(float(updated_at), usegmt=True)
+    return headers
+
+
+async def bump_catalog_version() -> None:
+    """
+    Инвалидирует все закешированные ответы каталога (старые ключи дожидаются TTL) и ETag-и клиентов,
+    и оповещает воркеры о новой версии через CATALOG_UPDATES_CHANNEL.
+    """
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(CATALOG_VERSION_KEY)
+            pipe.set(CATALOG_UPDATED_AT_KEY, int(time.time()))
+            version, _ = await pipe.execute()
+        await redis_client.publish(CATALOG_UPDATES_CHANNEL, version)
+    except RedisError as e:
+        logger.warning(f"Не удалось обновить версию каталога: {e}")
+
+
+class CachedRoute(APIRoute):
+    """
+    GET-роут, который отдаёт сериализованный ответ из Redis, не трогая БД.
+    Ключ: cache:<версия каталога>:<path>?<отсортированные query-параметры>.
+    Если ETag клиента совпал с текущим, отвечает 304 до вызова обработчика.
+    При недоступности Redis запрос обрабатывается как обычно, без ETag.
+    """
+
+    def get_route_handler(self):
+        original_handler = super().get_route_handler()
+        ttl = getattr(self.endpoint, "cache_ttl", None)
+
+        if not (ENABLE_RESPONSE_CACHE or ENABLE_CONDITIONAL_GET) or ttl is None:
+            return original_handler
+
+        async def cached_handler(request: Request) -> Response:
+            if request.method != "GET":
+                return await original_handler(request)
+
+            path = build_cache_path(request)
+            try:
+                version, updated_at, cached = await _GET_CACHED_SCRIPT(
+                    keys=[CATALOG_VERSION_KEY, CATALOG_UPDATED_AT_KEY],
+                    args=[CACHE_KEY_PREFIX, path, "1" if ENABLE_RESPONSE_CACHE else "0"],
+                )
+            except RedisError as e:
+                logger.warning(f"Кеш недоступен: {e}")
+                return await original_handler(request)
+
+            version, updated_at = version.decode(), updated_at.decode()
+            # Снимок каталога старше этой версии не должен попасть в кеш под ней
+            request.state.catalog_version = int(version)
+            headers = build_validator_headers(version, updated_at, path) if ENABLE_CONDITIONAL_GET else {}
+
+            if ENABLE_CONDITIONAL_GET and is_not_modified(request, headers["ETag"], updated_at):
+                return Response(status_code=304, headers=headers)
+
+            if cached:
+                return Response(
+                    content=cached, media_type="application/json", headers={**headers, "X-Cache": "HIT"}
+                )
+
+            response = await original_handler(request)
+
+            if response.status_code == 200:
+                response.headers.update(headers)
+                if ENABLE_RESPONSE_CACHE:
+                    key = f"{CACHE_KEY_PREFIX}{version}:{path}"
+                    try:
+                        await redis_client.set(key, response.body, ex=ttl)
+                    except RedisError as e:
+                        logger.warning(f"Не удалось записать в кеш: {e}")
+                    response.headers["X-Cache"] = "MISS"
+
+            return response
+
+        return cached_handler
@@ -0,0 +1,411 @@
+import os
+import csv
+import json
+import hashlib
+import pandas as pd
+
+from itertools import islice
+from openpyxl import load_workbook
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from slugify import slugify
+from models import Product, ProductLine, ProductImage
+from utils.product_utils import refresh_search_text, refresh_catalog_counts
+
+# Всё что не относится к деталям
+BASE_COLUMNS = {
+    "Наименование", "Цена", "Img", "Img_mini", "is_favorite", "product_line", "slug", "full_name"
+}
+
+# Размер пачки для INSERT ... VALUES и IN (...), чтобы не упереться в лимит параметров asyncpg (32767)
+INSERT_BATCH_SIZE = 1000
+
+# Поля строки таблицы, из которых считается source_hash; все они пишутся upsert-ом в apply_import_chunk
+HASHED_FIELDS = ("name", "price", "favorite", "line_name", "images", "img_mini", "full_name", "details")
+# Сколько имён на каждый вид изменений попадает в сводку импорта
+CHANGES_SUMMARY_LIMIT = 100
+
+
+def _split_images(value) -> list:
+    if not isinstance(value, str):
+        return []
+    return [img.strip() for img in value.split(",") if img.strip()]
+
+
+def _column(df: pd.DataFrame, name: str, default="") -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index)
+
+
+def row_hash(row: dict) -> str:
+    """Хеш содержимого строки таблицы: совпал с сохранённым — продукт не трогаем."""
+    payload = json.dumps([row[field] for field in HASHED_FIELDS], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def prepare_sheet_rows(df: pd.DataFrame, first_row: int = 2) -> tuple:
+    """
+    Разбирает таблицу (или её пачку) колонками целиком.
+    Возвращает (строки-словари в порядке листа, ошибки по строкам с некорректной ценой).
+    first_row — номер первой строки пачки в листе (заголовок — строка 1).
+    Строки без единого заполненного значения (пустая строка CSV, хвост листа XLSX) пропускаются,
+    у остальных номер — как в листе.
+    """
+    filled = ~df.fillna("").astype(str).apply(lambda column: column.str.strip()).eq("").all(axis=1)
+    sheet_rows = [row for row, is_filled in enumerate(filled, start=first_row) if is_filled]
+    df = df[filled.to_numpy()]
+
+    names = df["Наименование"].astype(str).str.strip()
+    prices = pd.to_numeric(df["Цена"], errors="coerce")
+    favorites = df["is_favorite"].astype(str).str.strip().str.lower() == "true"
+    line_names = df["product_line"].astype(str).str.strip()
+    images = _column(df, "Img").map(_split_images)
+    img_mini = _column(df, "Img_mini").map(lambda value: _split_images(value) or None)
+    full_names = _column(df, "full_name", None)
+
+    detail_columns = [c for c in df.columns if c not in BASE_COLUMNS]
+    details = [
+        {key: value for key, value in record.items() if pd.notna(value)}
+        for record in df[detail_columns].to_dict("records")
+    ]
+    for item in details:
+        if "Описание" in item:
+            item["Описание"] = str(item["Описание"]).strip()
+
+    rows, errors = [], []
+    columns = zip(names, prices, favorites, line_names, images, img_mini, full_names, details)
+    for sheet_row, (name, price, favorite, line_name, row_images, row_img_mini, full_name, row_details) in zip(sheet_rows, columns):
+        row = {
+            "sheet_row": sheet_row,
+            "name": name,
+            "key": name.lower(),
+            "price": float(price),
+            "favorite": bool(favorite),
+            "line_name": line_name,
+            "images": row_images,
+            "img_mini": row_img_mini,
+            "full_name": full_name,
+            "details": row_details,
+        }
+        row["hash"] = row_hash(row)
+        if pd.isna(price):
+            errors.append({"row": sheet_row, "name": name, "error": "Некорректная цена"})
+        rows.append(row)
+
+    return rows, errors
+
+
+def _batches(rows: list, size: int = INSERT_BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _unique_slug(name: str, seen_slugs: set) -> str:
+    # Если есть повторы, добавляем индекс
+    base_slug = slugify(name)
+    new_slug = base_slug
+    counter = 1
+    while new_slug in seen_slugs:
+        new_slug = f"{base_slug}-{counter}"
+        counter += 1
+    seen_slugs.add(new_slug)
+    return new_slug
+
+
+def _product_values(row: dict, slug: str, line_ids: dict) -> dict:
+    return {
+        "name": row["name"],
+        "slug": slug,
+        "price": row["price"],
+        "product_line_id": line_ids[row["line_name"].lower()],
+        "favorite": row["favorite"],
+        "details": row["details"],
+        "img_mini": row["img_mini"],
+        "rating": 0.0,
+        "full_name": row["full_name"],
+        "source_hash": row["hash"],
+    }
+
+
+def resolve_product_lines(db: Session, line_names: set) -> dict:
+    """Возвращает {lower(name): id} для найденных линеек, дописывая недостающие slug-и одним UPDATE."""
+    lines = db.execute(
+        select(ProductLine.id, ProductLine.name, ProductLine.slug)
+        .where(func.lower(ProductLine.name).in_({name.lower() for name in line_names}))
+    ).all()
+
+    missing_slugs = [{"id": line_id, "slug": slugify(name)} for line_id, name, slug in lines if not slug]
+    if missing_slugs:
+        db.execute(update(ProductLine), missing_slugs)
+
+    return {name.lower(): line_id for line_id, name, _ in lines}
+
+
+class ImportPlan:
+    """
+    Состояние импорта: снимок каталога из БД и всё, что уже прочитано из таблицы.
+    Таблица подаётся пачками (plan_chunk + apply_import_chunk), удаление — в конце,
+    когда известны все строки. Так импорт не держит весь файл в памяти,
+    а фоновая задача может сообщать прогресс между пачками.
+    В режиме dry_run изменения только считаются и попадают в changes, в БД ничего не пишется.
+    """
+
+    def __init__(self, existing: dict, dry_run: bool = False):
+        self.existing = existing
+        self.dry_run = dry_run
+        self.line_ids = {}
+        self.errors = []
+        self.rows_total = 0
+        # Прочитано строк листа вместе с пустыми — для номеров строк в ошибках
+        self.sheet_rows = 0
+        self.sheet_keys = set()
+        # Новые slug-и не должны совпасть ни с одним существующим, в том числе с удаляемыми в конце
+        self.seen_slugs = {product["slug"] for product in existing.values()}
+        self.upserted_slugs = set()
+        # id добавленных и изменённых продуктов и число удалённых: по ним finish_import решает, что пересчитывать
+        self.changed_ids = set()
+        self.deleted = 0
+        # Сводка изменений: имена продуктов, не больше CHANGES_SUMMARY_LIMIT на вид
+        self.changes = {"inserted": [], "updated": [], "deleted": []}
+
+    def record_change(self, kind: str, name: str):
+        if len(self.changes[kind]) < CHANGES_SUMMARY_LIMIT:
+            self.changes[kind].append(name)
+
+
+def load_import_state(db: Session, dry_run: bool = False) -> ImportPlan:
+    # Для сверки достаточно хеша: цены, детали и картинки из БД не читаем
+    existing = {
+        name.strip().lower(): {"id": product_id, "name": name, "slug": slug, "hash": source_hash}
+        for product_id, name, slug, source_hash in db.execute(
+            select(Product.id, Product.name, Product.slug, Product.source_hash)
+        )
+    }
+    return ImportPlan(existing, dry_run)
+
+
+def plan_chunk(db: Session, plan: ImportPlan, df: pd.DataFrame) -> list:
+    """Разбирает пачку строк таблицы и помечает невалидные. Возвращает строки для apply_import_chunk."""
+    rows, errors = prepare_sheet_rows(df, first_row=plan.sheet_rows + 2)
+    plan.sheet_rows += len(df)
+    plan.rows_total += len(rows)
+    plan.sheet_keys.update(row["key"] for row in rows)
+
+    unknown_lines = {row["line_name"] for row in rows if row["line_name"].lower() not in plan.line_ids}
+    if unknown_lines:
+        plan.line_ids.update(resolve_product_lines(db, unknown_lines))
+
+    # У линейки обязателен производитель, а в таблице его нет — создать её здесь нельзя.
+    # Такие строки пропускаются, но их продукты не удаляются
+    error_rows = {error["row"] for error in errors}
+    for row in rows:
+        if row["line_name"].lower() not in plan.line_ids and row["sheet_row"] not in error_rows:
+            errors.append({"row": row["sheet_row"], "name": row["name"], "error": f"Неизвестная линейка: {row['line_name']}"})
+            error_rows.add(row["sheet_row"])
+        row["valid"] = row["sheet_row"] not in error_rows
+
+    plan.errors.extend(sorted(errors, key=lambda error: error["row"]))
+    return rows
+
+
+def apply_import_deletes(db: Session, plan: ImportPlan) -> int:
+    """Удаляет продукты, которых не оказалось в таблице. Вызывается после всех пачек."""
+    to_delete = []
+    for key, product in plan.existing.items():
+        if key not in plan.sheet_keys:
+            to_delete.append(product["id"])
+            plan.record_change("deleted", product["name"])
+
+    plan.deleted = len(to_delete)
+    if not plan.dry_run:
+        for batch in _batches(to_delete):
+            db.execute(delete(Product).where(Product.id.in_(batch)))
+    return len(to_delete)
+
+
+def apply_import_chunk(db: Session, plan: ImportPlan, rows: list) -> dict:
+    """
+    Сверяет пачку строк с планом по source_hash и пишет только изменившиеся:
+    upsert продуктов и полная замена их картинок. Строки с тем же хешем пропускаются.
+    """
+    upserts = {}  # slug -> строка для INSERT ... ON CONFLICT (slug)
+    images_by_slug = {}
+    images_to_replace = set()  # id существующих продуктов, чьи картинки переписываются
+    product_ids = {}
+    inserted = updated = unchanged = 0
+
+    for row in rows:
+        if not row["valid"]:
+            continue
+
+        current = plan.existing.get(row["key"])
+
+        if current:
+            # Повтор уже записанной строки тоже перезаписывает продукт — побеждает последняя
+            repeated = current["slug"] in plan.upserted_slugs or current["slug"] in upserts
+            if current["hash"] != row["hash"] or repeated:
+                if not repeated:
+                    updated += 1
+                    plan.record_change("updated", row["name"])
+                upserts[current["slug"]] = _product_values(row, current["slug"], plan.line_ids)
+                product_ids[current["slug"]] = current["id"]
+                images_to_replace.add(current["id"])
+                images_by_slug[current["slug"]] = row["images"]
+            else:
+                unchanged += 1
+        else:
+            slug = _unique_slug(row["name"], plan.seen_slugs)
+            upserts[slug] = _product_values(row, slug, plan.line_ids)
+            images_by_slug[slug] = row["images"]
+            inserted += 1
+            plan.record_change("inserted", row["name"])
+
+    plan.upserted_slugs.update(upserts)
+    counts = {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+    if plan.dry_run:
+        return counts
+
+    # Существующие продукты конфликтуют по slug и обновляют все поля из таблицы, что входят в source_hash:
+    # иначе изменение попало бы в хеш, но не в БД, и следующие синхронизации его пропускали бы.
+    # slug и rating не меняются
+    for batch in _batches(list(upserts.values())):
+        stmt = insert(Product).values(batch)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.slug],
+            set_={
+                "name": stmt.excluded.name,
+                "full_name": stmt.excluded.full_name,
+                "product_line_id": stmt.excluded.product_line_id,
+                "price": stmt.excluded.price,
+                "favorite": stmt.excluded.favorite,
+                "details": stmt.excluded.details,
+                "img_mini": stmt.excluded.img_mini,
+                "source_hash": stmt.excluded.source_hash,
+            },
+        ).returning(Product.id, Product.slug)
+        product_ids.update({slug: product_id for product_id, slug in db.execute(stmt)})
+    plan.changed_ids.update(product_ids.values())
+
+    for batch in _batches(list(images_to_replace)):
+        db.execute(delete(ProductImage).where(ProductImage.product_id.in_(batch)))
+
+    images_to_add = [
+        {"product_id": product_ids[slug], "image_url": image_url}
+        for slug, images in images_by_slug.items()
+        for image_url in images
+    ]
+    for batch in _batches(images_to_add):
+        db.execute(insert(ProductImage).values(batch))
+
+    return counts
+
+
+def finish_import(db: Session, plan: ImportPlan) -> bool:
+    """
+    Пересчитывает после импорта search_text изменённых продуктов и агрегаты листингов.
+    Если таблица ничего не поменяла, не делает ничего и возвращает False —
+    тогда и версию каталога сбрасывать не нужно.
+    """
+    if not plan.changed_ids and not plan.deleted:
+        return False
+    refresh_search_text(db, product_ids=plan.changed_ids)
+    refresh_catalog_counts(db)
+    return True
+
+
+def import_products_dataframe(db: Session, df: pd.DataFrame, dry_run: bool = False) -> dict:
+    """
+    Импорт целиком за один вызов: сверяет таблицу с БД в памяти и пишет изменения
+    фиксированным числом пакетных запросов, без commit.
+    С dry_run только возвращает сводку изменений.
+    Из async-кода вызывается через AsyncSession.run_sync.
+    """
+    plan = load_import_state(db, dry_run)
+    counts = apply_import_chunk(db, plan, plan_chunk(db, plan, df))
+    deleted = apply_import_deletes(db, plan)
+    if not dry_run:
+        finish_import(db, plan)
+
+    return {
+        "added": counts["inserted"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "deleted": deleted,
+        "errors": plan.errors,
+        "changes": plan.changes,
+    }
+
+
+def sheet_frame(header: list, rows: list) -> pd.DataFrame:
+    """
+    DataFrame листа, одинаковый для CSV, XLSX и Google Sheets, чтобы одни и те же данные давали один хеш.
+    Колонки с пустым заголовком и повторы заголовка (побеждает первая) отбрасываются — иначе они попали бы
+    в details. Короткие строки дополняются "", как пустые ячейки отдают XLSX и Google Sheets,
+    ячейки правее заголовка отбрасываются.
+    """
+    columns = {}
+    for index, name in enumerate(header):
+        name = "" if name is None else str(name)
+        if name.strip() and name not in columns:
+            columns[name] = index
+    data = [[row[index] if index < len(row) else "" for index in columns.values()] for row in rows]
+    return pd.DataFrame(data, columns=list(columns))
+
+
+def iter_csv_chunks(path: str, chunk_size: int):
+    """Построчно читает CSV и отдаёт DataFrame-ы по chunk_size строк."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        while True:
+            # Пустая строка файла приходит как []: sheet_frame дополнит её, номера строк сохранятся,
+            # а саму строку отсеет prepare_sheet_rows
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            yield sheet_frame(header, rows)
+
+
+def iter_xlsx_chunks(path: str, chunk_size: int):
+    """Читает первый лист XLSX в read-only режиме и отдаёт DataFrame-ы по chunk_size строк."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        values = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(values, None)
+        if not header:
+            return
+        while True:
+            # Значения приводим к строкам, как их отдаёт Google Sheets
+            rows = [
+                ["" if value is None else str(value) for value in row]
+                for row in islice(values, chunk_size)
+            ]
+            if not rows:
+                break
+            yield sheet_frame(header, rows)
+    finally:
+        workbook.close()
+
+
+class FileChunks:
+    """Итератор пачек из загруженного CSV/XLSX. close() удаляет файл, даже если чтение не начиналось."""
+
+    def __init__(self, path: str, chunk_size: int):
+        self.path = path
+        reader = iter_xlsx_chunks if path.lower().endswith(".xlsx") else iter_csv_chunks
+        self._chunks = reader(path, chunk_size)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> pd.DataFrame:
+        return next(self._chunks)
+
+    def close(self):
+        self._chunks.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
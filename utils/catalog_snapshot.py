@@ -0,0 +1,356 @@
+import os
+import asyncio
+import logging
+
+from bisect import bisect_right
+from collections import Counter
+from math import ceil
+from typing import Optional
+from fastapi import Request
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Product, ProductLine, ProductImage, Producer, Category
+from utils.cache import redis_client, CATALOG_VERSION_KEY, CATALOG_UPDATES_CHANNEL
+from utils.product_utils import (
+    FACET_EXCLUDED_ATTRIBUTES, encode_cursor, decode_cursor, build_facets, img_mini_urls, img_mini_variants, image_entry,
+)
+
+logger = logging.getLogger(__name__)
+
+# Чтение каталога из памяти воркера вместо запросов к БД
+ENABLE_CATALOG_SNAPSHOT = os.getenv("ENABLE_CATALOG_SNAPSHOT", "false").lower() == "true"
+SNAPSHOT_RETRY_DELAY = 5
+
+
+class ProductEntry:
+    """Товар в снимке. Поля с теми же именами, что у строк select_product_previews, — подходит для product_preview."""
+
+    __slots__ = (
+        "id", "name", "full_name", "slug", "price", "favorite", "rating", "details", "img_mini",
+        "product_line_id", "category_slug", "producer_slug", "images", "name_rank", "price_rank",
+    )
+
+    def __init__(self, row, category_slug: str, producer_slug: str, name_rank: int):
+        (
+            self.id, self.name, self.full_name, self.slug, self.price, self.favorite,
+            self.rating, self.details, self.img_mini, self.product_line_id,
+        ) = row
+        self.category_slug = category_slug
+        self.producer_slug = producer_slug
+        self.images = ()
+        self.name_rank = name_rank
+        self.price_rank = 0
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога одной версии. Не меняется после сборки —
+    при обновлении собирается новый и подменяется ссылка в модуле.
+
+    listings — упорядоченные кортежи товаров по ключу листинга (тот же, что count_key
+    в paginate_and_sort_products) и (sort_by, order). Порядок по имени берётся
+    из ORDER BY name, id в БД, чтобы совпадать с collation Postgres.
+    """
+
+    __slots__ = (
+        "version", "categories", "producers", "product_lines",
+        "categories_by_id", "producers_by_id", "lines_by_id", "nested_lines",
+        "products_by_id", "products_by_path", "products_by_line", "listings", "facets_cache",
+    )
+
+    def __init__(self, version: int, categories: list, producers: list, product_lines: list, products: list):
+        self.version = version
+        self.categories = tuple(categories)
+        self.producers = tuple(producers)
+        self.product_lines = tuple(product_lines)
+        self.categories_by_id = {category["id"]: category for category in categories}
+        self.producers_by_id = {producer["id"]: producer for producer in producers}
+        self.lines_by_id = {line["id"]: line for line in product_lines}
+
+        # product_line -> producer -> category в том виде, в каком их отдаёт /related
+        self.nested_lines = {}
+        for line in product_lines:
+            producer = self.producers_by_id[line["producer_id"]]
+            self.nested_lines[line["id"]] = {
+                **line,
+                "producer": {**producer, "category": self.categories_by_id[producer["category_id"]]},
+            }
+
+        for price_rank, product in enumerate(sorted(products, key=lambda p: (p.price, p.id))):
+            product.price_rank = price_rank
+
+        self.products_by_id = {product.id: product for product in products}
+        self.products_by_path = {
+            (product.category_slug, product.producer_slug, product.slug): product for product in products
+        }
+
+        by_line = {}
+        groups = {("favorite",): []}
+        for product in sorted(products, key=lambda p: p.id):
+            by_line.setdefault(product.product_line_id, []).append(product)
+            groups.setdefault(("category", product.category_slug), []).append(product)
+            groups.setdefault(("producer", product.category_slug, product.producer_slug), []).append(product)
+            if product.favorite:
+                groups[("favorite",)].append(product)
+        self.products_by_line = {line_id: tuple(items) for line_id, items in by_line.items()}
+
+        self.listings = {}
+        for key, items in groups.items():
+            orderings = {}
+            for sort_by in ("name", "price"):
+                ascending = tuple(sorted(items, key=lambda p: getattr(p, f"{sort_by}_rank")))
+                orderings[(sort_by, "asc")] = ascending
+                orderings[(sort_by, "desc")] = ascending[::-1]
+            self.listings[key] = orderings
+
+        # Фасеты считаются при первом запросе и живут, пока жив снимок этой версии
+        self.facets_cache = {}
+
+    def paginate(
+        self, key: tuple, page: int, limit: int, sort_by: str, order: str,
+        cursor: Optional[str], with_total: bool, predicate=None,
+    ) -> Optional[tuple]:
+        """
+        То же, что paginate_and_sort_products, но по снимку. count_key -> key,
+        predicate — ProductFilters.matches.
+        None — курсор указывает на товар, которого нет в снимке: листинг нужно взять из БД.
+        """
+        items = self.listings.get(key, {}).get((sort_by, order), ())
+        if predicate is not None:
+            items = tuple(filter(predicate, items))
+
+        if cursor is None:
+            total = len(items)
+            pages = ceil(total / limit)
+            products = items[(page - 1) * limit:page * limit]
+            next_cursor = (
+                encode_cursor(sort_by, order, products[-1])
+                if products and page < pages else None
+            )
+            return products, total, pages, next_cursor
+
+        total = pages = None
+        if with_total:
+            total = len(items)
+            pages = ceil(total / limit)
+
+        start = 0
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort_by, order)
+            last = self.products_by_id.get(last_id)
+            if last is None or getattr(last, sort_by) != value or (predicate is not None and not predicate(last)):
+                return None
+            rank = getattr(last, f"{sort_by}_rank")
+            if order == "desc":
+                start = bisect_right(items, -rank, key=lambda p: -getattr(p, f"{sort_by}_rank"))
+            else:
+                start = bisect_right(items, rank, key=lambda p: getattr(p, f"{sort_by}_rank"))
+
+        products = items[start:start + limit]
+        next_cursor = encode_cursor(sort_by, order, products[-1]) if len(items) > start + limit else None
+        return products, total, pages, next_cursor
+
+    def facets(self, category_slug: str, producer_slug: str = "") -> dict:
+        key = ("producer", category_slug, producer_slug) if producer_slug else ("category", category_slug)
+        facets = self.facets_cache.get(key)
+        if facets is None:
+            items = self.listings.get(key, {}).get(("price", "asc"), ())
+            counter = Counter(
+                (name, value)
+                for product in items
+                for name, value in (product.details or {}).items()
+                if name not in FACET_EXCLUDED_ATTRIBUTES
+            )
+            values = sorted(
+                ((name, str(value), count) for (name, value), count in counter.items()),
+                key=lambda item: (item[0], -item[2], item[1]),
+            )
+            facets = build_facets(
+                len(items), items[0].price if items else None, items[-1].price if items else None, values
+            )
+            self.facets_cache[key] = facets
+        return facets
+
+    def lookup_products(self, ids: list) -> dict:
+        """То же, что product_utils.lookup_products, из памяти."""
+        products = self.products_by_id
+        return {product_id: products[product_id] for product_id in ids if product_id in products}
+
+    def product_detail(self, category_slug: str, producer_slug: str, product_slug: str) -> Optional[dict]:
+        product = self.products_by_path.get((category_slug, producer_slug, product_slug))
+        if product is None:
+            return None
+
+        line = self.lines_by_id[product.product_line_id]
+        producer = self.producers_by_id[line["producer_id"]]
+        category = self.categories_by_id[producer["category_id"]]
+        path = f"/{category_slug}/{producer_slug}/{product_slug}"
+        return {
+            "name": product.name,
+            "slug": product.slug,
+            "price": product.price,
+            "product_line_id": product.product_line_id,
+            "favorite": product.favorite,
+            "details": product.details,
+            "img_mini": img_mini_urls(product.img_mini),
+            "id": product.id,
+            "images": [image_entry(image_id, image_url) for image_id, image_url in product.images],
+            "img_mini_variants": img_mini_variants(product.img_mini),
+            "self": path,
+            "full_name": product.full_name,
+            "breadcrumbs": [
+                {"label": category["name"], "to": f"/{category['slug']}"},
+                {"label": producer["name"], "to": f"/{category['slug']}/{producer['slug']}"},
+                {"label": f"{line['name']} {product.name}", "to": path},
+            ],
+        }
+
+    def related_products(self, category_slug: str, producer_slug: str, product_slug: str) -> Optional[dict]:
+        product = self.products_by_path.get((category_slug, producer_slug, product_slug))
+        if product is None:
+            return None
+
+        nested_line = self.nested_lines[product.product_line_id]
+        related = [p for p in self.products_by_line[product.product_line_id] if p.id != product.id][:10]
+        return {
+            "collection_name": nested_line["name"],
+            "items": [
+                {
+                    "id": p.id,
+                    "name": p.name,
+                    "full_name": p.full_name,
+                    "slug": p.slug,
+                    "product_line_id": p.product_line_id,
+                    "price": p.price,
+                    "img_mini": img_mini_urls(p.img_mini),
+                    "img_mini_variants": img_mini_variants(p.img_mini),
+                    "rating": p.rating,
+                    "favorite": p.favorite,
+                    "details": p.details,
+                    "product_line": nested_line,
+                    "self": f"/{p.category_slug}/{p.producer_slug}/{p.slug}",
+                }
+                for p in related
+            ],
+        }
+
+
+async def load_catalog_snapshot(version: int) -> CatalogSnapshot:
+    """Читает весь каталог пятью запросами и собирает снимок."""
+    async with AsyncSessionLocal() as db:
+        categories = [
+            {"id": id, "name": name, "slug": slug}
+            for id, name, slug in await db.execute(select(Category.id, Category.name, Category.slug))
+        ]
+        producers = [
+            {"id": id, "name": name, "slug": slug, "category_id": category_id}
+            for id, name, slug, category_id in await db.execute(
+                select(Producer.id, Producer.name, Producer.slug, Producer.category_id)
+            )
+        ]
+        product_lines = [
+            {"id": id, "name": name, "slug": slug, "producer_id": producer_id}
+            for id, name, slug, producer_id in await db.execute(
+                select(ProductLine.id, ProductLine.name, ProductLine.slug, ProductLine.producer_id)
+            )
+        ]
+
+        category_slugs = {category["id"]: category["slug"] for category in categories}
+        producer_paths = {
+            producer["id"]: (category_slugs[producer["category_id"]], producer["slug"]) for producer in producers
+        }
+        line_paths = {line["id"]: producer_paths[line["producer_id"]] for line in product_lines}
+
+        rows = await db.execute(
+            select(
+                Product.id, Product.name, Product.full_name, Product.slug, Product.price, Product.favorite,
+                Product.rating, Product.details, Product.img_mini, Product.product_line_id,
+            ).order_by(Product.name, Product.id)
+        )
+        products = [
+            ProductEntry(tuple(row), *line_paths[row.product_line_id], name_rank=rank)
+            for rank, row in enumerate(rows)
+        ]
+
+        images = {}
+        for image_id, product_id, image_url in await db.execute(
+            select(ProductImage.id, ProductImage.product_id, ProductImage.image_url).order_by(ProductImage.id)
+        ):
+            images.setdefault(product_id, []).append((image_id, image_url))
+        for product in products:
+            product.images = tuple(images.get(product.id, ()))
+
+    return CatalogSnapshot(version, categories, producers, product_lines, products)
+
+
+_snapshot: Optional[CatalogSnapshot] = None
+_reload_lock = asyncio.Lock()
+_listener_task: Optional[asyncio.Task] = None
+
+
+async def _get_catalog_version() -> int:
+    version = await redis_client.get(CATALOG_VERSION_KEY)
+    return int(version) if version else 0
+
+
+async def reload_catalog_snapshot(version: Optional[int] = None):
+    """Собирает снимок заново, если он старше version (по умолчанию — текущей версии в Redis)."""
+    global _snapshot
+    async with _reload_lock:
+        if version is None:
+            version = await _get_catalog_version()
+        if _snapshot is not None and _snapshot.version >= version:
+            return
+        snapshot = await load_catalog_snapshot(version)
+        # Подмена одной ссылкой: запросы дочитывают старый снимок, новые берут новый
+        _snapshot = snapshot
+        logger.info(f"Снимок каталога версии {version}: {len(snapshot.products_by_id)} товаров")
+
+
+async def _listen_for_updates():
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(CATALOG_UPDATES_CHANNEL)
+                # Обновления, пропущенные до подписки (или пока Redis был недоступен)
+                await reload_catalog_snapshot()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await reload_catalog_snapshot(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Синхронизация снимка каталога прервана: {e}")
+            await asyncio.sleep(SNAPSHOT_RETRY_DELAY)
+
+
+async def start_catalog_snapshot():
+    """Загружает снимок и подписывается на обновления. Без снимка роуты работают через БД."""
+    global _listener_task
+    if not ENABLE_CATALOG_SNAPSHOT:
+        return
+    try:
+        await reload_catalog_snapshot()
+    except (RedisError, OSError) as e:
+        logger.warning(f"Версия каталога недоступна, снимок соберётся после подключения к Redis: {e}")
+    _listener_task = asyncio.create_task(_listen_for_updates())
+
+
+async def stop_catalog_snapshot():
+    if _listener_task is not None:
+        _listener_task.cancel()
+
+
+async def get_catalog_snapshot(request: Request) -> Optional[CatalogSnapshot]:
+    """
+    Зависимость для роутов: текущий снимок или None (снимок выключен, не загружен
+    или отстаёт от версии, под которой CachedRoute закеширует ответ).
+    async — чтобы FastAPI не отправлял её в threadpool: ввода-вывода здесь нет.
+    """
+    snapshot = _snapshot
+    if snapshot is None:
+        return None
+    if snapshot.version < getattr(request.state, "catalog_version", 0):
+        return None
+    return snapshot
@@ -0,0 +1,223 @@
+import os
+import gzip
+import time
+import threading
+import mimetypes
+
+import brotli
+import anyio
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+# Ответы меньше этого размера не сжимаем: выигрыш меньше накладных расходов
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Сколько CPU можно потратить на сжатие одного ответа: по размеру выбирается самый сильный уровень,
+# который укладывается в бюджет; если не укладывается даже самый быстрый — ответ уходит несжатым
+COMPRESSION_CPU_BUDGET_MS = float(os.getenv("COMPRESSION_CPU_BUDGET_MS", "25"))
+# Крупные ответы сжимаются в пуле потоков (zlib и brotli отпускают GIL), чтобы не держать event loop
+COMPRESSION_THREAD_MIN_SIZE = 256 * 1024
+# Статика раздаётся из заранее сжатых файлов (scripts/precompress_static.py), на лету не сжимается
+COMPRESSION_EXCLUDED_PREFIXES = ("/static",)
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml", "application/xml")
+COMPRESSIBLE_EXTENSIONS = (".html", ".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".xml", ".webmanifest")
+
+# Уровни от сильного к быстрому и их пропускная способность на JSON листинга, МБ/с (замерено на 2.5 МБ)
+COMPRESSION_LEVELS = {
+    "br": ((5, 50), (4, 100), (3, 170), (1, 450)),
+    "gzip": ((6, 95), (4, 120), (1, 200)),
+}
+# Порядок предпочтения при равном q в Accept-Encoding
+ENCODINGS = ("br", "gzip")
+# Расширения заранее сжатых копий статики
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def accepted_encodings(accept_encoding: str) -> list:
+    """Кодировки из ENCODINGS, которые принимает клиент, в порядке предпочтения (q, затем ENCODINGS)."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip()] = q
+    wildcard = weights.get("*", 0.0)
+    ranked = [(weights.get(encoding, wildcard), encoding) for encoding in ENCODINGS]
+    return [encoding for q, encoding in sorted(ranked, key=lambda item: -item[0]) if q > 0]
+
+
+def choose_level(encoding: str, size: int) -> Optional[int]:
+    """Самый сильный уровень, который сожмёт size байт за COMPRESSION_CPU_BUDGET_MS."""
+    for level, throughput in COMPRESSION_LEVELS[encoding]:
+        if size / (throughput * 1000) <= COMPRESSION_CPU_BUDGET_MS:
+            return level
+    return None
+
+
+def compress(encoding: str, body: bytes, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionStats:
+    """Счётчики сжатия ответов API воркера."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.encodings = {encoding: {"count": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0} for encoding in ENCODINGS}
+        self.over_budget = 0
+        self.not_smaller = 0
+
+    def observe(self, encoding: str, bytes_in: int, bytes_out: int, seconds: float):
+        with self._lock:
+            stats = self.encodings[encoding]
+            stats["count"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["seconds"] += seconds
+
+    def _incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "min_size": COMPRESSION_MIN_SIZE,
+                "cpu_budget_ms": COMPRESSION_CPU_BUDGET_MS,
+                "encodings": {
+                    encoding: {
+                        **stats,
+                        "seconds": round(stats["seconds"], 6),
+                        "ratio": round(stats["bytes_in"] / stats["bytes_out"], 2) if stats["bytes_out"] else 0.0,
+                    }
+                    for encoding, stats in self.encodings.items()
+                },
+                "over_budget": self.over_budget,
+                "not_smaller": self.not_smaller,
+            }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов API в br или gzip по Accept-Encoding. Сжимается тело целиком (JSONResponse,
+    ORJSONResponse, ответы из кеша), потоковые ответы проходят как есть. Сильный ETag сжатого
+    ответа становится слабым: байты отличаются, а If-None-Match в utils/cache.py сравнивается слабо.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(COMPRESSION_EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Заголовки отправляются вместе с первым куском тела, когда ясно, сжимать ли
+                start_message = message
+                return
+            if message["type"] == "http.response.body" and start_message is not None:
+                start, start_message = start_message, None
+                await self._send_first_body(start, message, encodings, send)
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _send_first_body(self, start: dict, message: dict, encodings: list, send):
+        headers = MutableHeaders(raw=start["headers"])
+        if (
+            message.get("more_body")
+            or "content-encoding" in headers
+            or not is_compressible(headers.get("content-type", ""))
+        ):
+            await send(start)
+            await send(message)
+            return
+
+        # Представление зависит от Accept-Encoding — кеши должны это знать, даже если этот ответ не сжат
+        headers.add_vary_header("Accept-Encoding")
+        body = message["body"]
+        compressed = None
+        if encodings and len(body) >= COMPRESSION_MIN_SIZE:
+            encoding = encodings[0]
+            level = choose_level(encoding, len(body))
+            if level is None:
+                compression_stats._incr("over_budget")
+            else:
+                started = time.perf_counter()
+                if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+                    compressed = await anyio.to_thread.run_sync(compress, encoding, body, level)
+                else:
+                    compressed = compress(encoding, body, level)
+                compression_stats.observe(encoding, len(body), len(compressed), time.perf_counter() - started)
+                if len(compressed) >= len(body):
+                    compression_stats._incr("not_smaller")
+                    compressed = None
+
+        if compressed is not None:
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            message = {**message, "body": compressed}
+        await send(start)
+        await send(message)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, который отдаёт соседний <файл>.br / <файл>.gz, если клиент его принимает
+    и копия не старше исходника. Content-Length, ETag и Last-Modified — от отдаваемой копии,
+    Content-Type — от исходника.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        if not str(full_path).endswith(COMPRESSIBLE_EXTENSIONS):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        for encoding in accepted_encodings(request_headers.get("accept-encoding", "")):
+            sibling = f"{full_path}{PRECOMPRESSED_SUFFIXES[encoding]}"
+            try:
+                sibling_stat = os.stat(sibling)
+            except FileNotFoundError:
+                continue
+            if sibling_stat.st_mtime < stat_result.st_mtime:
+                continue  # исходник обновили после сжатия
+            response = FileResponse(
+                sibling, status_code=status_code, stat_result=sibling_stat,
+                media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain",
+            )
+            response.headers["Content-Encoding"] = encoding
+            response.headers.add_vary_header("Accept-Encoding")
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
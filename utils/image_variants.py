@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from typing import Optional
+from fastapi.staticfiles import StaticFiles
+
+logger = logging.getLogger(__name__)
+
+ENV = os.getenv("ENV", "development")
+
+# Корень статики: её раздаёт main.py, сюда же пишет scripts/build_image_variants.py
+if ENV == "production":
+    STATIC_DIR = "/var/www/static"
+else:
+    STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+# Исходники: uploads/<файл> — галерея товара (images), uploads/minify/<файл> — карточки листингов (img_mini)
+UPLOADS_DIR = os.path.join(STATIC_DIR, "uploads")
+MINI_PREFIX = "minify/"
+# Производные с хешем содержимого в имени: <имя>-<ширина>.<хеш>.<формат>
+VARIANTS_DIR = os.path.join(UPLOADS_DIR, "v")
+MANIFEST_NAME = "manifest.json"
+MANIFEST_PATH = os.path.join(VARIANTS_DIR, MANIFEST_NAME)
+
+
+def _widths(name: str, default: str) -> tuple:
+    return tuple(sorted(int(width) for width in os.getenv(name, default).split(",") if width.strip()))
+
+
+# Ширины, которые запрашивает фронтенд; больше исходника не растягиваем
+IMAGE_WIDTHS = {
+    "mini": _widths("IMAGE_WIDTHS_MINI", "160,320,480"),
+    "full": _widths("IMAGE_WIDTHS_FULL", "480,800,1200,1600"),
+}
+# Порядок <source> в <picture>: браузер берёт первый поддерживаемый
+IMAGE_FORMATS = ("avif", "webp")
+IMAGE_QUALITY = {
+    "avif": int(os.getenv("IMAGE_QUALITY_AVIF", "55")),
+    "webp": int(os.getenv("IMAGE_QUALITY_WEBP", "80")),
+}
+VARIANT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Как часто воркер проверяет, не пересобран ли манифест
+IMAGE_MANIFEST_CHECK_INTERVAL = float(os.getenv("IMAGE_MANIFEST_CHECK_INTERVAL", "5"))
+
+
+def image_kind(source: str) -> str:
+    return "mini" if source.startswith(MINI_PREFIX) else "full"
+
+
+def settings_fingerprint() -> str:
+    """Меняется вместе с ширинами и качеством — тогда все производные пересобираются."""
+    settings = {"widths": IMAGE_WIDTHS, "formats": IMAGE_FORMATS, "quality": IMAGE_QUALITY}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    """
+    {"settings": ..., "images": {источник: {"hash", "width", "height", "variants": {формат: [[ширина, файл], ...]}}}},
+    источник — путь относительно uploads (как в URL), hash — sha256 исходного файла.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"settings": None, "images": {}}
+
+
+class ImageManifest:
+    """
+    Производные картинок для ответов API: готовые к srcset записи по имени исходника.
+    Перечитывает манифест, когда его пересобрали, — не чаще IMAGE_MANIFEST_CHECK_INTERVAL.
+    """
+
+    def __init__(self, path: str, base_url: str):
+        self.path = path
+        self.base_url = base_url
+        self._entries = {}
+        self._mtime = None
+        self._checked_at = float("-inf")
+
+    def get(self, source: str) -> Optional[dict]:
+        now = time.monotonic()
+        if now - self._checked_at >= IMAGE_MANIFEST_CHECK_INTERVAL:
+            self._checked_at = now
+            self._reload_if_changed()
+        return self._entries.get(source)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        try:
+            images = load_manifest(self.path)["images"] if mtime is not None else {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Манифест картинок не прочитан: {e}")
+            return
+        # Словари собираются один раз: ответы API ссылаются на них без копирования
+        self._entries = {
+            source: self._entry(image) for source, image in images.items() if any(image["variants"].values())
+        }
+        self._mtime = mtime
+
+    def _entry(self, image: dict) -> dict:
+        sources = [
+            {
+                "type": f"image/{fmt}",
+                "srcset": ", ".join(f"{self.base_url}{name} {width}w" for width, name in image["variants"][fmt]),
+            }
+            for fmt in IMAGE_FORMATS if image["variants"].get(fmt)
+        ]
+        # Запасной src для браузеров без <picture> — самый широкий вариант в наиболее совместимом формате
+        fallback = next(image["variants"][fmt] for fmt in reversed(IMAGE_FORMATS) if image["variants"].get(fmt))
+        return {
+            "src": f"{self.base_url}{fallback[-1][1]}",
+            "width": image["width"],
+            "height": image["height"],
+            "sources": sources,
+        }
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Раздача производных: имя меняется вместе с содержимым, поэтому файл кешируется навсегда."""
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if os.path.basename(full_path) != MANIFEST_NAME:
+            response.headers["Cache-Control"] = VARIANT_CACHE_CONTROL
+        return response
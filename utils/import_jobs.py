@@ -0,0 +1,200 @@
+import os
+import json
+import uuid
+import tempfile
+import asyncio
+import logging
+
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from utils.cache import redis_client, bump_catalog_version
+from utils.catalog_import import load_import_state, plan_chunk, apply_import_chunk, apply_import_deletes, finish_import
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_LOCK_TTL = int(os.getenv("IMPORT_LOCK_TTL", "600"))
+IMPORT_JOB_TTL = 60 * 60 * 24
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+IMPORT_LOCK_KEY = "import:lock"
+IMPORT_JOB_KEY = "import:job:"
+# Ключ advisory-блокировки Postgres: страховка на случай, если Redis-лок истёк посреди импорта
+IMPORT_ADVISORY_LOCK_ID = 7_310_001
+
+# Снимаем лок, только если он всё ещё наш
+_RELEASE_LOCK_SCRIPT = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
+
+# Ссылки на запущенные задачи, чтобы их не собрал GC
+_running_tasks = set()
+
+
+async def _update_job(job_id: str, **fields):
+    mapping = {
+        key: json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else str(value)
+        for key, value in fields.items()
+    }
+    key = f"{IMPORT_JOB_KEY}{job_id}"
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, IMPORT_JOB_TTL)
+        await pipe.execute()
+
+
+async def get_import_job(job_id: str) -> Optional[dict]:
+    raw = await redis_client.hgetall(f"{IMPORT_JOB_KEY}{job_id}")
+    if not raw:
+        return None
+
+    job = {key.decode(): value.decode() for key, value in raw.items()}
+    for key in ("rows_processed", "inserted", "updated", "unchanged", "deleted"):
+        if key in job:
+            job[key] = int(job[key])
+    job["dry_run"] = job.get("dry_run") == "True"
+    job["errors"] = json.loads(job.get("errors", "[]"))
+    job["changes"] = json.loads(job.get("changes", "{}"))
+    return job
+
+
+def dataframe_chunks(load_dataframe: Callable, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator:
+    """Режет целиком загруженную таблицу (Google Sheets) на пачки для run_import_job."""
+    df = load_dataframe()
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+async def save_upload_to_disk(file: UploadFile, suffix: str) -> str:
+    """Копирует тело загрузки во временный файл блоками по UPLOAD_BUFFER_SIZE и возвращает путь."""
+    fd, path = tempfile.mkstemp(prefix="import_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while data := await file.read(UPLOAD_BUFFER_SIZE):
+                f.write(data)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+async def enqueue_import(source: str, chunks: Iterator, dry_run: bool = False) -> str:
+    """
+    Ставит импорт в очередь и возвращает id задачи.
+    chunks — ленивый итератор DataFrame-ов; блокирующее чтение выполняется в threadpool внутри задачи.
+    dry_run — только посчитать изменения (сводка в поле changes задачи), без записи в БД.
+    """
+    job_id = uuid.uuid4().hex
+    try:
+        acquired = await redis_client.set(IMPORT_LOCK_KEY, job_id, nx=True, ex=IMPORT_LOCK_TTL)
+        if not acquired:
+            running = await redis_client.get(IMPORT_LOCK_KEY)
+            raise HTTPException(
+                status_code=409,
+                detail=f"Импорт уже выполняется: {running.decode() if running else 'неизвестная задача'}"
+            )
+
+        await _update_job(
+            job_id,
+            status="queued", source=source, dry_run=dry_run, created_at=datetime.utcnow().isoformat(),
+            rows_processed=0, inserted=0, updated=0, unchanged=0, deleted=0, errors=[], changes={},
+        )
+    except RedisError as e:
+        raise HTTPException(status_code=503, detail=f"Очередь импорта недоступна: {e}")
+
+    task = asyncio.create_task(run_import_job(job_id, chunks, dry_run))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return job_id
+
+
+def _lock_catalog(db: Session):
+    if not db.scalar(text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": IMPORT_ADVISORY_LOCK_ID}):
+        raise RuntimeError("Другой импорт уже держит блокировку каталога")
+
+
+def _import_chunk(db: Session, plan, df) -> dict:
+    return apply_import_chunk(db, plan, plan_chunk(db, plan, df))
+
+
+def _commit_import(db: Session, plan) -> bool:
+    changed = finish_import(db, plan)
+    db.commit()
+    return changed
+
+
+async def run_import_job(job_id: str, chunks: Iterator, dry_run: bool = False):
+    """
+    Выполняет импорт пачками в одной транзакции, обновляя прогресс после каждой пачки.
+    В режиме dry_run транзакция откатывается, а версия каталога не меняется.
+    Синхронизация без изменений тоже не трогает ни агрегаты, ни версию каталога: кеш ответов остаётся.
+    Разбор пачек, хеши, slug-и и пересчёт агрегатов — CPU и синхронная сессия, поэтому всё это
+    идёт в threadpool; в event loop остаются только обращения к Redis, и воркер продолжает отвечать.
+    """
+    try:
+        await _update_job(job_id, status="running", started_at=datetime.utcnow().isoformat())
+
+        # Сессия используется строго последовательно, каждый шаг — в каком-то потоке threadpool
+        db = SessionLocal()
+        try:
+            try:
+                await run_in_threadpool(_lock_catalog, db)
+                plan = await run_in_threadpool(load_import_state, db, dry_run)
+                changed = False
+                inserted = updated = unchanged = 0
+
+                while (df := await run_in_threadpool(next, chunks, None)) is not None:
+                    counts = await run_in_threadpool(_import_chunk, db, plan, df)
+                    inserted += counts["inserted"]
+                    updated += counts["updated"]
+                    unchanged += counts["unchanged"]
+
+                    await _update_job(
+                        job_id, rows_processed=plan.rows_total, inserted=inserted, updated=updated,
+                        unchanged=unchanged, errors=plan.errors, changes=plan.changes,
+                    )
+                    await redis_client.expire(IMPORT_LOCK_KEY, IMPORT_LOCK_TTL)
+
+                deleted = await run_in_threadpool(apply_import_deletes, db, plan)
+                await _update_job(job_id, deleted=deleted, changes=plan.changes)
+
+                if dry_run:
+                    await run_in_threadpool(db.rollback)
+                else:
+                    changed = await run_in_threadpool(_commit_import, db, plan)
+            except BaseException:
+                await run_in_threadpool(db.rollback)
+                raise
+        finally:
+            await run_in_threadpool(db.close)
+
+        # Сбрасываем кеш ответов каталога, только если каталог изменился
+        if changed:
+            await bump_catalog_version()
+        await _update_job(job_id, status="done", finished_at=datetime.utcnow().isoformat())
+
+    except (Exception, asyncio.CancelledError) as e:
+        logger.exception(f"Импорт {job_id} завершился ошибкой")
+        try:
+            await _update_job(job_id, status="failed", error=str(e) or type(e).__name__, finished_at=datetime.utcnow().isoformat())
+        except RedisError:
+            pass
+        if isinstance(e, asyncio.CancelledError):
+            raise
+    finally:
+        # Закрываем источник, чтобы он убрал за собой временные файлы
+        if hasattr(chunks, "close"):
+            chunks.close()
+        try:
+            await _RELEASE_LOCK_SCRIPT(keys=[IMPORT_LOCK_KEY], args=[job_id])
+        except RedisError as e:
+            logger.warning(f"Не удалось снять блокировку импорта: {e}")
@@ -0,0 +1,262 @@
+import os
+import asyncio
+import logging
+import time
+
+from contextlib import suppress
+from datetime import timedelta
+from typing import Optional
+import httpx
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine
+from models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# Свой Bot API сервер или заглушка бенчмарков (benchmarks/telegram_stub.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+# В группу Telegram пропускает около 20 сообщений в минуту, чаще отвечает 429 с retry_after
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "3"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_KIND = "telegram"
+# Разделитель заказов, объединённых в одно сообщение
+MESSAGE_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+ENABLE_OUTBOX_DISPATCHER = os.getenv("ENABLE_OUTBOX_DISPATCHER", "true").lower() == "true"
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_BASE = 5
+OUTBOX_BACKOFF_MAX = 60 * 60
+# Ключ advisory-блокировки уровня сессии: её держит диспетчер, пока жив, поэтому отправляет
+# один воркер и интервалы чатов и пауза после 429 в его памяти — общие для всех
+OUTBOX_ADVISORY_LOCK_ID = 7_310_003
+
+
+class OutboxSendError(Exception):
+    """
+    retry_after — Telegram попросил подождать (429), попытка не засчитывается;
+    permanent — запрос отклонён (400), повтор не поможет.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, permanent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+_wakeup = asyncio.Event()
+_dispatcher_task: Optional[asyncio.Task] = None
+# chat_id -> time.monotonic(), раньше которого в чат не пишем
+_next_send_at = {}
+# После 429 бот молчит целиком
+_paused_until = 0.0
+# Сообщения, на которых объединённая отправка получила 400: шлём по одному, чтобы найти виновное
+_send_separately = set()
+
+
+def enqueue_telegram_message(db: AsyncSession, message: str, chat_id: Optional[str] = None):
+    """Добавляет сообщение в outbox; уйдёт в Telegram после коммита транзакции вызывающего."""
+    db.add(OutboxMessage(
+        kind=TELEGRAM_KIND,
+        payload={"chat_id": chat_id or TELEGRAM_CHAT_ID, "text": message, "parse_mode": "Markdown"},
+    ))
+
+
+def notify_outbox():
+    """Будит диспетчер этого воркера сразу после коммита, не дожидаясь OUTBOX_POLL_INTERVAL."""
+    _wakeup.set()
+
+
+def merge_messages(messages: list) -> list:
+    """
+    Объединяет сообщения одного чата в пачки, каждая — одно сообщение Telegram
+    не длиннее TELEGRAM_MESSAGE_LIMIT. Порядок пачек — порядок первых сообщений.
+    """
+    batches = []
+    open_batches = {}
+    for message in messages:
+        key = (message.payload["chat_id"], message.payload.get("parse_mode"))
+        batch = open_batches.get(key)
+        if (
+            batch is not None
+            and message.id not in _send_separately
+            and batch[0].id not in _send_separately
+            and len(merged_text(batch + [message])) <= TELEGRAM_MESSAGE_LIMIT
+        ):
+            batch.append(message)
+            continue
+        batch = [message]
+        open_batches[key] = batch
+        batches.append(batch)
+    return batches
+
+
+def merged_text(batch: list) -> str:
+    return MESSAGE_SEPARATOR.join(message.payload["text"] for message in batch)
+
+
+async def send_telegram(client: httpx.AsyncClient, batch: list):
+    payload = {**batch[0].payload, "text": merged_text(batch)}
+    try:
+        response = await client.post(f"/bot{TELEGRAM_BOT_TOKEN}/sendMessage", json=payload)
+    except httpx.HTTPError as e:
+        raise OutboxSendError(f"{type(e).__name__}: {e}")
+
+    if response.status_code == 200:
+        return
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    description = f"{response.status_code}: {body.get('description') or response.text[:200]}"
+    if response.status_code == 429:
+        retry_after = (body.get("parameters") or {}).get("retry_after", OUTBOX_BACKOFF_BASE)
+        raise OutboxSendError(description, retry_after=retry_after)
+    raise OutboxSendError(description, permanent=response.status_code == 400)
+
+
+def schedule_retry(batch: list, error: OutboxSendError):
+    global _paused_until
+    if error.retry_after is not None:
+        _paused_until = time.monotonic() + error.retry_after
+    if error.permanent and len(batch) > 1:
+        # Виновато одно из объединённых сообщений — в следующем круге каждое пойдёт отдельно
+        _send_separately.update(message.id for message in batch)
+        return
+
+    for message in batch:
+        message.last_error = str(error)[:1000]
+        if error.retry_after is not None:
+            message.available_at = func.now() + timedelta(seconds=error.retry_after)
+        elif error.permanent:
+            message.attempts = OUTBOX_MAX_ATTEMPTS
+        else:
+            message.attempts += 1
+            backoff = min(OUTBOX_BACKOFF_BASE * 2 ** (message.attempts - 1), OUTBOX_BACKOFF_MAX)
+            message.available_at = func.now() + timedelta(seconds=backoff)
+        if message.attempts >= OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Уведомление {message.id} не отправлено: {error}")
+
+
+async def dispatch_pending(client: httpx.AsyncClient) -> float:
+    """
+    Один круг отправки: в каждый чат — не больше одного (объединённого) сообщения.
+    Вызывается только из диспетчера, держащего блокировку OUTBOX_ADVISORY_LOCK_ID.
+    Выборка и отметка об отправке — отдельные короткие транзакции: пока ждём Telegram
+    (до TELEGRAM_TIMEOUT), соединение с БД не занято.
+    Возвращает, через сколько секунд стоит запустить следующий круг.
+    """
+    async with AsyncSessionLocal() as db:
+        messages = (await db.scalars(
+            select(OutboxMessage)
+            .where(
+                OutboxMessage.kind == TELEGRAM_KIND,
+                OutboxMessage.sent_at.is_(None),
+                OutboxMessage.attempts < OUTBOX_MAX_ATTEMPTS,
+                OutboxMessage.available_at <= func.now(),
+            )
+            .order_by(OutboxMessage.available_at, OutboxMessage.id)
+            .limit(OUTBOX_BATCH_SIZE)
+        )).all()
+
+    delay = OUTBOX_POLL_INTERVAL if len(messages) < OUTBOX_BATCH_SIZE else TELEGRAM_CHAT_INTERVAL
+    sent_chats = set()
+    for batch in merge_messages(messages):
+        chat_id = batch[0].payload["chat_id"]
+        if chat_id in sent_chats:
+            delay = min(delay, TELEGRAM_CHAT_INTERVAL)
+            continue
+        wait = max(_paused_until, _next_send_at.get(chat_id, 0)) - time.monotonic()
+        if wait > 0:
+            delay = min(delay, wait)
+            continue
+
+        sent_chats.add(chat_id)
+        _next_send_at[chat_id] = time.monotonic() + TELEGRAM_CHAT_INTERVAL
+        try:
+            await send_telegram(client, batch)
+            error = None
+        except OutboxSendError as e:
+            logger.warning(f"Telegram не принял уведомления {[m.id for m in batch]}: {e}")
+            error = e
+
+        # Сообщение, отправленное до падения воркера, но не отмеченное, уйдёт повторно
+        async with AsyncSessionLocal() as db:
+            db.add_all(batch)
+            if error is not None:
+                schedule_retry(batch, error)
+            else:
+                for message in batch:
+                    message.sent_at = func.now()
+                    message.last_error = None
+                    _send_separately.discard(message.id)
+            await db.commit()
+    return delay
+
+
+async def _dispatch_while_locked(client: httpx.AsyncClient, conn):
+    """Круги отправки, пока жива сессия conn с блокировкой диспетчера."""
+    while True:
+        _wakeup.clear()
+        # Соединение оборвалось — блокировку мог взять другой воркер, отправку прекращаем
+        await conn.scalar(text("SELECT 1"))
+        try:
+            delay = await dispatch_pending(client)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Отправка уведомлений прервана: {e}")
+            delay = OUTBOX_POLL_INTERVAL
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+
+
+async def _run_dispatcher():
+    async with httpx.AsyncClient(base_url=TELEGRAM_API_URL, timeout=TELEGRAM_TIMEOUT) as client:
+        while True:
+            try:
+                # AUTOCOMMIT: блокировка уровня сессии держится без открытой транзакции
+                async with async_engine.connect() as conn:
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    locked = await conn.scalar(
+                        text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": OUTBOX_ADVISORY_LOCK_ID}
+                    )
+                    if locked:
+                        try:
+                            await _dispatch_while_locked(client, conn)
+                        finally:
+                            # Соединение вернётся в пул — блокировку снимаем явно
+                            with suppress(Exception):
+                                await conn.scalar(
+                                    text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": OUTBOX_ADVISORY_LOCK_ID}
+                                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Диспетчер уведомлений потерял соединение с БД: {e}")
+            # Отправляет другой воркер: пробуем перехватить, если он остановится
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+async def start_outbox_dispatcher():
+    """Запускает фоновую отправку outbox_messages в Telegram. Без токена сообщения копятся в таблице."""
+    global _dispatcher_task
+    if not ENABLE_OUTBOX_DISPATCHER:
+        return
+    if not TELEGRAM_BOT_TOKEN:
+        logger.warning("TELEGRAM_BOT_TOKEN не задан: уведомления о заказах копятся в outbox_messages")
+        return
+    _dispatcher_task = asyncio.create_task(_run_dispatcher())
+
+
+async def stop_outbox_dispatcher():
+    # Дожидаемся отмены, чтобы сессия закрылась до dispose движка; неотмеченное уйдёт при следующем запуске
+    if _dispatcher_task is not None:
+        _dispatcher_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _dispatcher_task
@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# Стоимость bcrypt (2^rounds итераций). Хеши с другой стоимостью пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Процессы под bcrypt на воркер uvicorn; 0 — считать в пуле потоков, как раньше
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Сколько операций может ждать или выполняться одновременно; сверх — сразу 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+PASSWORD_HASH_RETRY_AFTER = 1
+
+# Границы бакетов гистограммы длительности операций, в секундах
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@lru_cache
+def crypt_context(rounds: int = BCRYPT_ROUNDS) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+# Функции ниже выполняются в процессах пула: модуль импортируется там заново (spawn),
+# поэтому здесь нет импортов приложения — только passlib
+
+def _hash(password: str, rounds: int) -> Tuple[str, float]:
+    start = time.perf_counter()
+    hashed = crypt_context(rounds).hash(password)
+    return hashed, time.perf_counter() - start
+
+
+def _warm_up(rounds: int):
+    crypt_context(rounds)
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int) -> Tuple[Tuple[bool, Optional[str]], float]:
+    start = time.perf_counter()
+    result = crypt_context(rounds).verify_and_update(password, hashed)
+    return result, time.perf_counter() - start
+
+
+class PasswordHashStats:
+    """Счётчики операций с паролями воркера: полная длительность (очередь + bcrypt) и время самого bcrypt."""
+
+    OPERATIONS = ("hash", "verify")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.operations = {
+            name: {"count": 0, "sum": 0.0, "max": 0.0, "compute_sum": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+            for name in self.OPERATIONS
+        }
+
+    def observe(self, operation: str, seconds: float, compute_seconds: float):
+        with self._lock:
+            stats = self.operations[operation]
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["compute_sum"] += compute_seconds
+            stats["buckets"][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def _incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            operations = {}
+            for name, stats in self.operations.items():
+                cumulative, histogram = 0, {}
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), stats["buckets"]):
+                    cumulative += count
+                    histogram["+Inf" if bound == float("inf") else str(bound)] = cumulative
+                count = stats["count"]
+                operations[name] = {
+                    "count": count,
+                    "sum": round(stats["sum"], 6),
+                    "max": round(stats["max"], 6),
+                    "avg": round(stats["sum"] / count, 6) if count else 0.0,
+                    # Разница с avg — ожидание в очереди пула
+                    "compute_avg": round(stats["compute_sum"] / count, 6) if count else 0.0,
+                    "buckets": histogram,
+                }
+
+            return {
+                "workers": PASSWORD_HASH_WORKERS,
+                "max_pending": PASSWORD_HASH_MAX_PENDING,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "rehashed": self.rehashed,
+                "seconds": operations,
+            }
+
+
+password_stats = PasswordHashStats()
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def start_password_pool():
+    global _executor
+    if PASSWORD_HASH_WORKERS > 0 and _executor is None:
+        # spawn, а не fork: форк процесса с event loop и открытыми соединениями небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        # Процессы стартуют по требованию и импортируют passlib — поднимаем их сразу, а не на первом входе
+        for _ in range(PASSWORD_HASH_WORKERS):
+            _executor.submit(_warm_up, BCRYPT_ROUNDS)
+
+
+def stop_password_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(operation: str, func, *args):
+    # Очередь ограничена: при всплеске входов лучше быстро отказать, чем копить запросы на секунды
+    if password_stats.in_flight >= PASSWORD_HASH_MAX_PENDING:
+        password_stats._incr("rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Сервер перегружен, повторите попытку",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+        )
+
+    password_stats.in_flight += 1
+    start = time.perf_counter()
+    try:
+        if _executor is None:
+            # Пул не запущен (PASSWORD_HASH_WORKERS=0, скрипты): считаем в потоке
+            result, compute_seconds = await run_in_threadpool(func, *args)
+        else:
+            result, compute_seconds = await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    except BrokenProcessPool:
+        # Процесс пула умер (OOM и т.п.) — пересоздаём пул, запрос повторит клиент
+        logger.exception("Пул хеширования паролей сломан, пересоздаём")
+        stop_password_pool()
+        start_password_pool()
+        raise HTTPException(status_code=503, detail="Сервер перегружен, повторите попытку")
+    finally:
+        password_stats.in_flight -= 1
+
+    password_stats.observe(operation, time.perf_counter() - start, compute_seconds)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    (совпал ли пароль, новый хеш или None). Новый хеш возвращается, если стоимость в хеше
+    отличается от BCRYPT_ROUNDS — его нужно сохранить вместо старого.
+    """
+    verified, new_hash = await _run("verify", _verify_and_update, password, hashed_password, BCRYPT_ROUNDS)
+    if new_hash is not None:
+        password_stats._incr("rehashed")
+    return verified, new_hash
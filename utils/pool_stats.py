@@ -0,0 +1,93 @@
+import time
+import threading
+
+from bisect import bisect_left
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+# Границы бакетов гистограммы ожидания соединения, в секундах
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolStats:
+    """Счётчики пула соединений одного движка. Обновляются из событий пула и _do_get."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)  # последний — +Inf
+
+    def observe_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_sum += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+            if timed_out:
+                self.timeouts += 1
+
+    def _incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def attach(self, engine):
+        # Для AsyncEngine события вешаются на его sync_engine
+        event.listen(engine, "checkout", lambda *args: self._incr("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._incr("checkins"))
+        event.listen(engine, "connect", lambda *args: self._incr("connects"))
+        event.listen(engine, "invalidate", lambda *args: self._incr("invalidations"))
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            observed = sum(self.wait_buckets)
+            cumulative, histogram = 0, {}
+            for bound, count in zip(WAIT_BUCKETS + (float("inf"),), self.wait_buckets):
+                cumulative += count
+                histogram["+Inf" if bound == float("inf") else str(bound)] = cumulative
+
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout(),
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_seconds": {
+                    "count": observed,
+                    "sum": round(self.wait_sum, 6),
+                    "max": round(self.wait_max, 6),
+                    "avg": round(self.wait_sum / observed, 6) if observed else 0.0,
+                    "buckets": histogram,
+                },
+            }
+
+
+class _TimedGetMixin:
+    """Замеряет, сколько запрос ждал свободное соединение из пула."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.observe_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.observe_wait(time.perf_counter() - start)
+        return connection
+
+
+def instrumented_pool_class(base, stats: PoolStats):
+    """Подкласс пула с привязанной статистикой — передаётся в create_engine(poolclass=...)."""
+    return type(f"Instrumented{base.__name__}", (_TimedGetMixin, base), {"stats": stats})
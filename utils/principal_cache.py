@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict
+from typing import Optional
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import User
+from utils.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Пользователь по subject токена без запроса в БД. TTL ограничивает устаревание,
+# если пользователя поменяли в обход приложения (SQL, другой сервис)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Второй уровень в Redis, общий для воркеров; инвалидация рассылается им через pub/sub
+ENABLE_PRINCIPAL_REDIS_CACHE = os.getenv("ENABLE_PRINCIPAL_REDIS_CACHE", "false").lower() == "true"
+PRINCIPAL_KEY_PREFIX = "principal:"
+PRINCIPAL_INVALIDATE_CHANNEL = "principal:invalidate"
+PRINCIPAL_RETRY_DELAY = 5
+
+# Изменение этих полей сбрасывает закешированного пользователя: права, профиль.
+# Refresh-сессии живут вне users (utils/refresh_sessions.py) и на снимок не влияют
+INVALIDATING_FIELDS = ("is_admin", "name", "email")
+
+
+class Principal:
+    """Пользователь запроса: неизменяемый снимок полей User, которые нужны роутам."""
+
+    __slots__ = ("id", "email", "name", "is_admin")
+
+    def __init__(self, id: int, email: str, name: str, is_admin: bool):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.is_admin = bool(is_admin)
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.email, user.name, user.is_admin)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "email": self.email, "name": self.name, "is_admin": self.is_admin}
+
+
+class PrincipalCache:
+    """LRU с TTL в памяти воркера, опционально поверх Redis."""
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # email -> (expires_at, Principal)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _get_local(self, email: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return principal
+
+    def _put_local(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.email] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def drop_local(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    async def get(self, email: str) -> Optional[Principal]:
+        principal = self._get_local(email)
+        if principal is not None:
+            self._count("hits")
+            return principal
+
+        if ENABLE_PRINCIPAL_REDIS_CACHE:
+            try:
+                raw = await redis_client.get(f"{PRINCIPAL_KEY_PREFIX}{email}")
+            except RedisError as e:
+                logger.warning(f"Кеш пользователей в Redis недоступен: {e}")
+                raw = None
+            if raw:
+                principal = Principal(**json.loads(raw))
+                self._put_local(principal)
+                self._count("redis_hits")
+                return principal
+
+        self._count("misses")
+        return None
+
+    async def put(self, user: User) -> Principal:
+        principal = Principal.from_user(user)
+        self._put_local(principal)
+        if ENABLE_PRINCIPAL_REDIS_CACHE:
+            try:
+                await redis_client.set(
+                    f"{PRINCIPAL_KEY_PREFIX}{principal.email}", json.dumps(principal.to_dict()), ex=max(int(self.ttl), 1)
+                )
+            except RedisError as e:
+                logger.warning(f"Кеш пользователей в Redis недоступен: {e}")
+        return principal
+
+    async def invalidate(self, *emails: str):
+        """Сбрасывает пользователей в этом воркере, в Redis и (через pub/sub) в остальных воркерах."""
+        for email in emails:
+            self.drop_local(email)
+            self._count("invalidations")
+        if ENABLE_PRINCIPAL_REDIS_CACHE and emails:
+            try:
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.delete(*(f"{PRINCIPAL_KEY_PREFIX}{email}" for email in emails))
+                    for email in emails:
+                        pipe.publish(PRINCIPAL_INVALIDATE_CHANNEL, email)
+                    await pipe.execute()
+            except RedisError as e:
+                logger.warning(f"Не удалось сбросить пользователей в Redis: {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "redis": ENABLE_PRINCIPAL_REDIS_CACHE,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache()
+# Ссылки на задачи инвалидации, чтобы их не собрал GC
+_pending_invalidations = set()
+
+
+# Инвалидация по коммиту: ловит любые изменения User через ORM (роуты auth, скрипты), без явных вызовов
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context):
+    emails = session.info.setdefault("principal_invalidations", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User):
+            continue
+        state = inspect(obj)
+        for field in INVALIDATING_FIELDS:
+            history = state.attrs[field].history
+            if history.has_changes():
+                emails.add(obj.email)
+                # Сменился email — сбрасываем и старый ключ
+                if field == "email":
+                    emails.update(value for value in history.deleted if value)
+                break
+        else:
+            if obj in session.deleted:
+                emails.add(obj.email)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session: Session):
+    emails = session.info.pop("principal_invalidations", None)
+    if not emails:
+        return
+    for email in emails:
+        principal_cache.drop_local(email)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Синхронный код без event loop (скрипты): в Redis ключ доживёт до TTL
+        return
+    task = loop.create_task(principal_cache.invalidate(*emails))
+    _pending_invalidations.add(task)
+    task.add_done_callback(_pending_invalidations.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_users(session: Session):
+    session.info.pop("principal_invalidations", None)
+
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+async def _listen_for_invalidations():
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(PRINCIPAL_INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        principal_cache.drop_local(message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Подписка на сброс кеша пользователей прервана: {e}")
+            await asyncio.sleep(PRINCIPAL_RETRY_DELAY)
+
+
+async def start_principal_cache():
+    global _listener_task
+    if ENABLE_PRINCIPAL_REDIS_CACHE:
+        _listener_task = asyncio.create_task(_listen_for_invalidations())
+
+
+async def stop_principal_cache():
+    if _listener_task is not None:
+        _listener_task.cancel()
@@ -1,42 +1,501 @@
 import os
+import json
+import base64
+import binascii
 
-from typing import Tuple
-from sqlalchemy.orm import Query
-from fastapi import Query
+from typing import Tuple, Optional, List, Iterable
+from sqlalchemy import Select, Integer, select, func, tuple_, delete, insert, literal, union_all, or_, true, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, contains_eager, load_only
+from fastapi import Query, HTTPException
+from fastapi.responses import ORJSONResponse
 from math import ceil
-from models import Product
+from slugify import slugify
+from models import Product, ProductLine, Producer, Category, CatalogCount, CatalogFacet
+from utils.image_variants import ImageManifest, MANIFEST_PATH, MINI_PREFIX
 
 ENV = os.getenv("ENV", "development")
 
+# Характеристики со свободным текстом: фасетов по ним не строим
+FACET_EXCLUDED_ATTRIBUTES = ("Описание",)
+# Атрибут с большим числом значений в фасетах бесполезен — не отдаём его
+FACET_MAX_VALUES = int(os.getenv("FACET_MAX_VALUES", "50"))
+# Сколько товаров можно запросить одним /products/lookup (и положить в один заказ)
+PRODUCT_LOOKUP_MAX_IDS = int(os.getenv("PRODUCT_LOOKUP_MAX_IDS", "100"))
+
 if ENV == "production":
     SITE_URL = os.getenv("SITE_URL", "https://zampol.ru")
 else:
     SITE_URL = "http://localhost:8000" 
 
+# AVIF/WebP производные под srcset, см. scripts/build_image_variants.py
+image_manifest = ImageManifest(MANIFEST_PATH, f"{SITE_URL}/static/uploads/v/")
+
+def img_mini_urls(img_mini: Optional[list]) -> Optional[list]:
+    if not img_mini:
+        return img_mini
+    return [f"{SITE_URL}/static/uploads/minify/{img}" for img in img_mini]
+
+def img_mini_variants(img_mini: Optional[list]) -> Optional[list]:
+    """Производные по порядку img_mini (None для ещё не обработанных); None, если нет ни одной."""
+    if not img_mini:
+        return None
+    variants = [image_manifest.get(f"{MINI_PREFIX}{img}") for img in img_mini]
+    return variants if any(variants) else None
+
+def image_entry(image_id: int, image_url: str) -> dict:
+    """Элемент schemas.ProductImageResponse по имени файла картинки."""
+    return {
+        "id": image_id,
+        "image_url": f"{SITE_URL}/static/uploads/{image_url}",
+        "variants": image_manifest.get(image_url),
+    }
+
 def add_absolute_img_urls(products: list, field: str = "img_mini"):
     for product in products:
-        if field == "img_mini" and product.img_mini:
-            product.img_mini = [
-                f"{SITE_URL}/static/uploads/minify/{img}" for img in product.img_mini
-            ]
+        # img_mini_variants ставится и без картинок: /related отдаёт атрибуты объекта как есть,
+        # и ключ должен быть всегда, как в снимке каталога
+        if field == "img_mini":
+            product.img_mini_variants = img_mini_variants(product.img_mini)
+            product.img_mini = img_mini_urls(product.img_mini)
         elif field == "images" and hasattr(product, "images") and product.images:
             for image in product.images:
+                image.variants = image_manifest.get(image.image_url)
                 image.image_url = f"{SITE_URL}/static/uploads/{image.image_url}"
 
-def paginate_and_sort_products(
-    query: Query,
+def with_catalog_path(query: Select) -> Select:
+    """
+    Заполняет product_line -> producer -> category из уже сделанных JOIN-ов,
+    чтобы сборка product.self не делала ленивых SELECT-ов на каждый товар.
+    Запрос должен содержать join(ProductLine).join(Producer).join(Category).
+    """
+    return query.options(
+        contains_eager(Product.product_line)
+        .contains_eager(ProductLine.producer)
+        .contains_eager(Producer.category)
+    )
+
+def select_product_previews() -> Select:
+    """
+    Колонки schemas.ProductPreview + slug-и категории и производителя для self.
+    Листинги собираются из этих строк без ORM-объектов и валидации pydantic.
+    """
+    return (
+        select(
+            Product.id, Product.name, Product.slug, Product.price, Product.favorite,
+            Product.product_line_id, Product.img_mini,
+            Category.slug.label("category_slug"), Producer.slug.label("producer_slug"),
+        )
+        .select_from(Product)
+        .join(ProductLine, Product.product_line_id == ProductLine.id)
+        .join(Producer, ProductLine.producer_id == Producer.id)
+        .join(Category, Producer.category_id == Category.id)
+    )
+
+def select_search_products(query: str, limit: int) -> Select:
+    """Поиск по search_text: товары с заполненным каталожным путём, лучшие совпадения первыми."""
+    q = query.strip()
+    # Латинская транслитерация запроса: «кронотекс» -> «kronoteks»
+    q_lat = slugify(q, separator=" ") or q
+    terms = [q] if q_lat == q.lower() else [q, q_lat]
+
+    # Все условия обслуживаются GIN-индексами: trigram (%> и ILIKE) и tsvector (@@)
+    conditions = []
+    for term in terms:
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions += [
+            Product.search_text.op("%>")(term),  # word_similarity >= порога, терпит опечатки
+            Product.search_vector.op("@@")(func.plainto_tsquery("simple", term)),
+            Product.search_text.ilike(f"%{escaped}%"),
+        ]
+
+    similarity = func.greatest(*[func.word_similarity(term, Product.search_text) for term in terms])
+    rank = func.ts_rank(Product.search_vector, func.plainto_tsquery("simple", terms[-1]))
+
+    return (
+        with_catalog_path(
+            select(Product)
+            .join(ProductLine)
+            .join(Producer)
+            .join(Category)
+        )
+        .options(load_only(Product.id, Product.name, Product.full_name, Product.slug))
+        .where(or_(*conditions))
+        .order_by(similarity.desc(), rank.desc(), Product.id)
+        .limit(limit)
+    )
+
+def product_preview(row) -> dict:
+    # Ключи в порядке полей ProductPreview — JSON совпадает с тем, что отдавал response_model
+    return {
+        "id": row.id,
+        "name": row.name,
+        "slug": row.slug,
+        "price": float(row.price),
+        "favorite": row.favorite,
+        "product_line_id": row.product_line_id,
+        "img_mini": img_mini_urls(row.img_mini),
+        "img_mini_variants": img_mini_variants(row.img_mini),
+        "self": f"/{row.category_slug}/{row.producer_slug}/{row.slug}",
+    }
+
+def select_products_by_ids(ids: List[int]) -> Select:
+    """
+    Товары по списку id одним запросом по первичному ключу.
+    id = ANY(:product_ids) с массивом в одном параметре — один подготовленный запрос для любого числа id,
+    в отличие от IN, который разворачивается в параметр на каждый id.
+    """
+    return (
+        select(
+            Product.id, Product.name, Product.full_name, Product.slug, Product.price, Product.img_mini,
+            Category.slug.label("category_slug"), Producer.slug.label("producer_slug"),
+        )
+        .select_from(Product)
+        .join(ProductLine, Product.product_line_id == ProductLine.id)
+        .join(Producer, ProductLine.producer_id == Producer.id)
+        .join(Category, Producer.category_id == Category.id)
+        .where(Product.id == any_(bindparam("product_ids", list(ids), type_=ARRAY(Integer))))
+    )
+
+async def lookup_products(db: AsyncSession, ids: List[int]) -> dict:
+    """{id: строка select_products_by_ids}; id, которых нет в каталоге, в словарь не попадают."""
+    if not ids:
+        return {}
+    rows = (await db.execute(select_products_by_ids(ids))).all()
+    return {row.id: row for row in rows}
+
+def product_lookup_item(product_id: int, product) -> dict:
+    """Элемент schemas.ProductLookupItem из строки lookup_products или товара снимка каталога."""
+    if product is None:
+        return {"id": product_id, "available": False}
+    return {
+        "id": product.id,
+        "available": True,
+        "name": product.name,
+        "full_name": product.full_name,
+        "price": float(product.price),
+        "img_mini": img_mini_urls(product.img_mini),
+        "img_mini_variants": img_mini_variants(product.img_mini),
+        "self": f"/{product.category_slug}/{product.producer_slug}/{product.slug}",
+    }
+
+def paginated_products_response(
+    rows: list, total: Optional[int], page: int, limit: int, pages: Optional[int], next_cursor: Optional[str]
+) -> ORJSONResponse:
+    """Ответ в форме schemas.PaginatedProducts, сериализованный orjson напрямую."""
+    return ORJSONResponse({
+        "items": [product_preview(row) for row in rows],
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "pages": pages,
+        "next_cursor": next_cursor,
+    })
+
+def build_search_text(*parts: Optional[str]) -> str:
+    """
+    Текст для поиска: исходные названия + их латинская транслитерация,
+    чтобы «дуб» находился по «dub», а «Kronotex» — по «кронотекс».
+    """
+    original = " ".join(p.strip() for p in parts if p and p.strip())
+    transliterated = slugify(original, separator=" ")
+    if transliterated == original.lower():
+        return original
+    return f"{original} {transliterated}"
+
+def refresh_search_text(db: Session, only_missing: bool = False, product_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересчитывает Product.search_text одним SELECT-ом и bulk UPDATE-ом. Возвращает число обновлённых строк.
+    product_ids — только эти продукты (импорт передаёт добавленные и изменённые), по умолчанию весь каталог.
+    """
+    query = (
+        db.query(Product.id, Product.full_name, Product.search_text, ProductLine.name, Producer.name)
+        .join(ProductLine, Product.product_line_id == ProductLine.id)
+        .join(Producer, ProductLine.producer_id == Producer.id)
+    )
+    if only_missing:
+        query = query.filter(Product.search_text.is_(None))
+    if product_ids is not None:
+        query = query.filter(Product.id.in_(list(product_ids)))
+
+    updates = []
+    for product_id, full_name, search_text, line_name, producer_name in query:
+        new_search_text = build_search_text(full_name, line_name, producer_name)
+        if new_search_text != search_text:
+            updates.append({"id": product_id, "search_text": new_search_text})
+
+    if updates:
+        db.bulk_update_mappings(Product, updates)
+    return len(updates)
+
+def refresh_catalog_counts(db: Session) -> None:
+    """
+    Пересчитывает агрегаты листингов: catalog_counts (число товаров и диапазон цен)
+    и catalog_facets (значения характеристик из details). По одному INSERT ... SELECT с GROUP BY,
+    вызывается в транзакции импорта.
+    """
+    def counts(scope, *group_by, where=None):
+        query = (
+            select(
+                literal(scope).label("scope"),
+                (group_by[0] if group_by else literal("")).label("category_slug"),
+                (group_by[1] if len(group_by) > 1 else literal("")).label("producer_slug"),
+                func.count(Product.id).label("total"),
+                func.min(Product.price).label("price_min"),
+                func.max(Product.price).label("price_max"),
+            )
+            .select_from(Product)
+            .join(ProductLine, Product.product_line_id == ProductLine.id)
+            .join(Producer, ProductLine.producer_id == Producer.id)
+            .join(Category, Producer.category_id == Category.id)
+        )
+        if where is not None:
+            query = query.where(where)
+        return query.group_by(*group_by) if group_by else query
+
+    db.execute(delete(CatalogCount))
+    db.execute(
+        insert(CatalogCount).from_select(
+            ["scope", "category_slug", "producer_slug", "total", "price_min", "price_max"],
+            union_all(
+                counts("category", Category.slug),
+                counts("producer", Category.slug, Producer.slug),
+                counts("favorite", where=Product.favorite == True),
+            ),
+        )
+    )
+
+    def facets(*group_by):
+        detail = func.jsonb_each_text(Product.details).table_valued("key", "value").render_derived("detail")
+        return (
+            select(
+                Category.slug.label("category_slug"),
+                (group_by[1] if len(group_by) > 1 else literal("")).label("producer_slug"),
+                detail.c.key.label("attribute"),
+                detail.c.value.label("value"),
+                func.count().label("total"),
+            )
+            .select_from(Product)
+            .join(ProductLine, Product.product_line_id == ProductLine.id)
+            .join(Producer, ProductLine.producer_id == Producer.id)
+            .join(Category, Producer.category_id == Category.id)
+            .join(detail, true())
+            .where(detail.c.key.notin_(FACET_EXCLUDED_ATTRIBUTES))
+            .group_by(*group_by, detail.c.key, detail.c.value)
+        )
+
+    db.execute(delete(CatalogFacet))
+    db.execute(
+        insert(CatalogFacet).from_select(
+            ["category_slug", "producer_slug", "attribute", "value", "total"],
+            union_all(facets(Category.slug), facets(Category.slug, Producer.slug)),
+        )
+    )
+
+def has_catalog_counts(db: Session) -> bool:
+    return db.scalar(select(CatalogCount.scope).limit(1)) is not None
+
+def has_catalog_facets(db: Session) -> bool:
+    return db.scalar(select(CatalogFacet.attribute).limit(1)) is not None
+
+def build_facets(total: int, price_min: Optional[float], price_max: Optional[float], values: list) -> dict:
+    """
+    Ответ в форме schemas.FacetsResponse. values — (attribute, value, count),
+    отсортированные по атрибуту и убыванию count.
+    """
+    attributes = {}
+    for attribute, value, count in values:
+        attributes.setdefault(attribute, []).append({"value": value, "count": count})
+    return {
+        "total": total,
+        "price_min": price_min,
+        "price_max": price_max,
+        "attributes": [
+            {"name": name, "values": items}
+            for name, items in attributes.items()
+            if len(items) <= FACET_MAX_VALUES
+        ],
+    }
+
+async def get_catalog_facets(db: AsyncSession, category_slug: str, producer_slug: str = "") -> dict:
+    scope = "producer" if producer_slug else "category"
+    counts = (await db.execute(
+        select(CatalogCount.total, CatalogCount.price_min, CatalogCount.price_max).where(
+            CatalogCount.scope == scope,
+            CatalogCount.category_slug == category_slug,
+            CatalogCount.producer_slug == producer_slug,
+        )
+    )).first()
+    values = (await db.execute(
+        select(CatalogFacet.attribute, CatalogFacet.value, CatalogFacet.total)
+        .where(CatalogFacet.category_slug == category_slug, CatalogFacet.producer_slug == producer_slug)
+        .order_by(CatalogFacet.attribute, CatalogFacet.total.desc(), CatalogFacet.value)
+    )).all()
+    total, price_min, price_max = counts or (0, None, None)
+    return build_facets(total, price_min, price_max, values)
+
+class ProductFilters:
+    """
+    Фильтры листинга: диапазон цены и значения характеристик из details.
+    Разные атрибуты — И, несколько значений одного атрибута — ИЛИ.
+    """
+
+    __slots__ = ("price_min", "price_max", "attributes")
+
+    def __init__(self, price_min: Optional[float] = None, price_max: Optional[float] = None, attributes: dict = None):
+        self.price_min = price_min
+        self.price_max = price_max
+        self.attributes = attributes or {}
+
+    def __bool__(self):
+        return self.price_min is not None or self.price_max is not None or bool(self.attributes)
+
+    def apply(self, query: Select) -> Select:
+        if self.price_min is not None:
+            query = query.where(Product.price >= self.price_min)
+        if self.price_max is not None:
+            query = query.where(Product.price <= self.price_max)
+        for name, values in self.attributes.items():
+            # details @> {...} идёт по GIN-индексу ix_products_details
+            query = query.where(or_(*(Product.details.contains({name: value}) for value in sorted(values))))
+        return query
+
+    def matches(self, product) -> bool:
+        """То же условие для товара из снимка каталога."""
+        if self.price_min is not None and product.price < self.price_min:
+            return False
+        if self.price_max is not None and product.price > self.price_max:
+            return False
+        details = product.details or {}
+        return all(details.get(name) in values for name, values in self.attributes.items())
+
+async def product_filters(
+    price_min: Optional[float] = Query(None, ge=0),
+    price_max: Optional[float] = Query(None, ge=0),
+    attr: List[str] = Query([], description="Характеристика в виде «Название:значение», например attr=Цвет:Дуб"),
+) -> ProductFilters:
+    # async — чтобы FastAPI не отправлял разбор параметров в threadpool
+    attributes = {}
+    for item in attr:
+        name, sep, value = item.partition(":")
+        if not sep or not name.strip():
+            raise HTTPException(status_code=400, detail=f"Некорректный фильтр: {item}")
+        attributes.setdefault(name.strip(), set()).add(value.strip())
+    return ProductFilters(price_min, price_max, attributes)
+
+async def get_catalog_count(db: AsyncSession, scope: str, category_slug: str = "", producer_slug: str = "") -> int:
+    # Нет строки — в листинге нет товаров
+    total = await db.scalar(
+        select(CatalogCount.total).where(
+            CatalogCount.scope == scope,
+            CatalogCount.category_slug == category_slug,
+            CatalogCount.producer_slug == producer_slug,
+        )
+    )
+    return total or 0
+
+def encode_cursor(sort_by: str, order: str, product) -> str:
+    payload = [sort_by, order, getattr(product, sort_by), product.id]
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: str, order: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort_by, cursor_order, value, last_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    # Курсор привязан к сортировке, с которой он был выдан
+    if cursor_sort_by != sort_by or cursor_order != order:
+        raise HTTPException(status_code=400, detail="Курсор не соответствует сортировке")
+
+    # Значение уходит в запрос как есть: строка вместо цены дошла бы до asyncpg и дала 500
+    value_types = (int, float) if sort_by == "price" else (str,)
+    if (
+        not isinstance(last_id, int) or isinstance(last_id, bool)
+        or not isinstance(value, value_types) or isinstance(value, bool)
+    ):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    return value, last_id
+
+async def count_rows(db: AsyncSession, query: Select) -> int:
+    return await db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+async def paginate_and_sort_products(
+    db: AsyncSession,
+    query: Select,
     page: int = 1,
     limit: int = 12,
     sort_by: str = "name",
-    order: str = "asc"
-) -> Tuple[list, int, int]:
+    order: str = "asc",
+    cursor: Optional[str] = None,
+    with_total: bool = False,
+    count_key: Optional[tuple] = None,
+    snapshot=None,
+    filters: Optional[ProductFilters] = None,
+) -> Tuple[list, Optional[int], Optional[int], Optional[str]]:
+    """
+    query — выборка колонок (select_product_previews), возвращаются строки Row.
+    count_key — (scope, category_slug, producer_slug) в catalog_counts, откуда берётся total;
+    без него (запрос с фильтрами, которых нет в счётчиках) выполняется COUNT(*).
+    snapshot — CatalogSnapshot: листинг с count_key отдаётся из памяти, без запросов.
+    filters — ProductFilters; с ними total считается COUNT(*) по отфильтрованному запросу.
+    Два режима:
+    - offset (cursor=None): OFFSET по номеру страницы, total считается всегда;
+    - keyset (cursor передан, пустая строка — первая страница): поиск по (sort_key, id),
+      COUNT выполняется только при with_total=True.
+    """
+    if snapshot and count_key:
+        predicate = filters.matches if filters else None
+        result = snapshot.paginate(count_key, page, limit, sort_by, order, cursor, with_total, predicate)
+        if result is not None:
+            return result
+
+    if filters:
+        query = filters.apply(query)
+        # В catalog_counts нет разбивки по фильтрам
+        count_key = None
+
     order_field = getattr(Product, sort_by)
+    # id — тай-брейкер, чтобы порядок был детерминированным для обоих режимов
     if order == "desc":
-        query = query.order_by(order_field.desc())
+        query = query.order_by(order_field.desc(), Product.id.desc())
     else:
-        query = query.order_by(order_field.asc())
+        query = query.order_by(order_field.asc(), Product.id.asc())
+
+    async def get_total() -> int:
+        if count_key:
+            return await get_catalog_count(db, *count_key)
+        return await count_rows(db, query)
+
+    if cursor is None:
+        total = await get_total()
+        products = (await db.execute(query.offset((page - 1) * limit).limit(limit))).all()
+        pages = ceil(total / limit)
+        next_cursor = (
+            encode_cursor(sort_by, order, products[-1])
+            if products and page < pages else None
+        )
+        return products, total, pages, next_cursor
+
+    total = pages = None
+    if with_total:
+        total = await get_total()
+        pages = ceil(total / limit)
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_by, order)
+        key = tuple_(order_field, Product.id)
+        query = query.where(key < (value, last_id) if order == "desc" else key > (value, last_id))
+
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    products = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_cursor(sort_by, order, products[-1])
 
-    total = query.count()
-    products = query.offset((page - 1) * limit).limit(limit).all()
-    pages = ceil(total / limit)
-    return products, total, pages
\ No newline at end of file
+    return products, total, pages, next_cursor
@@ -0,0 +1,69 @@
+import os
+import logging
+
+from contextvars import ContextVar
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import event
+from database import engine, async_engine
+
+logger = logging.getLogger(__name__)
+
+# В строгом режиме (dev/CI) превышение бюджета роняет запрос с 500,
+# в остальных окружениях только пишем предупреждение в лог
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() == "true"
+
+
+class QueryCounter:
+    __slots__ = ("count", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+# Счётчик текущего запроса. Хранится изменяемый объект, чтобы инкременты
+# из потока threadpool или greenlet-а SQLAlchemy были видны зависимости, которая его создала
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+# События асинхронного движка вешаются на его sync_engine
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _count_query)
+
+
+def get_query_count() -> int:
+    counter = _current_counter.get()
+    return counter.count if counter else 0
+
+
+def query_budget(max_queries: int):
+    """
+    Зависимость для роутов: считает SELECT/INSERT/... за время обработки запроса
+    и проверяет, что их не больше заявленного бюджета.
+    Пример: @router.get("/", dependencies=[Depends(query_budget(2))])
+    """
+    async def dependency():
+        counter = QueryCounter()
+        _current_counter.set(counter)
+        try:
+            yield counter
+        finally:
+            _current_counter.set(None)
+
+        if counter.count > max_queries:
+            message = f"Превышен бюджет запросов к БД: {counter.count} > {max_queries}"
+            logger.warning("%s\n%s", message, "\n---\n".join(counter.statements))
+            if QUERY_BUDGET_STRICT:
+                raise HTTPException(status_code=500, detail=message)
+
+    # По нему tests/test_query_budget.py находит роуты с бюджетом и проверяет каждый
+    dependency.max_queries = max_queries
+    return dependency
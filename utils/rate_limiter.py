@@ -0,0 +1,386 @@
+import os
+import math
+import time
+import asyncio
+import logging
+
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Optional
+from fastapi import HTTPException, Request
+from redis.exceptions import RedisError
+from utils.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+ENABLE_RATE_LIMITER = os.getenv("ENABLE_RATE_LIMITER", "false").lower() == "true"
+# Redis недоступен: true — пропускаем, ограничивая только локальными бакетами воркера; false — 503
+RATE_LIMIT_FAIL_OPEN = os.getenv("RATE_LIMIT_FAIL_OPEN", "true").lower() == "true"
+# Раз в сколько секунд локальные счётчики сбрасываются в Redis одним pipeline
+RATE_LIMIT_SYNC_INTERVAL = float(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "1"))
+# Столько несинхронизированных запросов клиента будят синхронизацию досрочно
+RATE_LIMIT_SYNC_BATCH = int(os.getenv("RATE_LIMIT_SYNC_BATCH", "10"))
+# С какой доли лимита каждый запрос проверяется в Redis синхронно
+RATE_LIMIT_SYNC_THRESHOLD = float(os.getenv("RATE_LIMIT_SYNC_THRESHOLD", "0.8"))
+# Политики с лимитом не больше этого проверяются в Redis на каждом запросе: у них доля «локальных»
+# запросов на каждом из N воркеров дала бы клиенту почти N лимитов
+RATE_LIMIT_EXACT_MAX = int(os.getenv("RATE_LIMIT_EXACT_MAX", "20"))
+# Сколько клиентов помнит воркер; самые давние вытесняются
+RATE_LIMIT_LOCAL_SIZE = int(os.getenv("RATE_LIMIT_LOCAL_SIZE", "100000"))
+# Пауза перед новой попыткой после ошибки Redis: пока она идёт, запросы не ждут таймаутов
+RATE_LIMIT_REDIS_RETRY = float(os.getenv("RATE_LIMIT_REDIS_RETRY", "5"))
+RATE_LIMIT_KEY_PREFIX = "ratelimit:"
+
+# Границы бакетов гистограммы задержки Redis, в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class RateLimitPolicy:
+    """times запросов за seconds секунд с одного клиента, общие для всех роутов политики."""
+
+    __slots__ = ("name", "times", "seconds", "exact")
+
+    def __init__(self, name: str, times: int, seconds: int):
+        # Переопределение из окружения: RATE_LIMIT_SEARCH=60/60
+        override = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        if override:
+            times, seconds = (int(value) for value in override.split("/"))
+        self.name = name
+        self.times = times
+        self.seconds = seconds
+        self.exact = times <= RATE_LIMIT_EXACT_MAX
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+
+# Все политики — здесь. Каталог читается часто и почти целиком из кеша, вход и заказ — дорогие операции
+RATE_LIMIT_POLICIES = {
+    policy.name: policy for policy in (
+        RateLimitPolicy("catalog", 120, 60),
+        RateLimitPolicy("search", 60, 60),
+        RateLimitPolicy("auth", 10, 60),
+        RateLimitPolicy("order", 3, 60),
+        RateLimitPolicy("default", 30, 60),
+    )
+}
+
+# Шаблон пути роута -> политика; первое совпадение по префиксу, остальное — default
+ROUTE_POLICIES = (
+    ("/api/products/search", "search"),
+    ("/api/products/lookup", "catalog"),
+    ("/api/products/upload_", "default"),
+    ("/api/products/import_jobs", "default"),
+    ("/api/products", "catalog"),
+    # Строгий лимит — только на подбор пароля и регистрацию: /me и /refresh SPA дёргает на каждом переходе
+    ("/api/auth/login", "auth"),
+    ("/api/auth/register", "auth"),
+    ("/api/order", "order"),
+)
+
+# Скользящее окно из двух фиксированных: предыдущее окно учитывается с убывающим весом.
+# ARGV[3] — уже пропущенные локально запросы (учитываются всегда),
+# ARGV[4] — запросы, которые нужно проверить (учитываются, только если влезают в лимит).
+# Время берётся из Redis, чтобы часы воркеров не расходились
+_SLIDING_WINDOW_SCRIPT = redis_client.register_script("""
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local recorded = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local index = math.floor(now / window)
+local elapsed = now - index * window
+local current_key = KEYS[1] .. ':' .. index
+local previous = tonumber(redis.call('GET', KEYS[1] .. ':' .. (index - 1)) or '0')
+local current = tonumber(redis.call('GET', current_key) or '0') + recorded
+local weight = (window - elapsed) / window
+local estimate = previous * weight + current
+
+local allowed = 0
+local retry_after = 0
+if requested > 0 then
+    if estimate + requested <= limit then
+        allowed = 1
+        current = current + requested
+        estimate = estimate + requested
+        recorded = recorded + requested
+    elseif current + requested > limit or previous == 0 then
+        retry_after = window - elapsed
+    else
+        retry_after = math.ceil(window * (1 - (limit - requested - current) / previous)) - elapsed
+    end
+end
+if recorded > 0 then
+    redis.call('INCRBY', current_key, recorded)
+    redis.call('PEXPIRE', current_key, window * 2)
+end
+return {allowed, math.ceil(estimate), math.max(retry_after, 1)}
+""")
+
+
+class _ClientState:
+    """Локальный бакет клиента в политике и то, что о нём известно из Redis."""
+
+    __slots__ = ("tokens", "updated_at", "pending", "remote", "synced")
+
+    def __init__(self, policy: RateLimitPolicy, now: float):
+        self.tokens = float(policy.times)
+        self.updated_at = now
+        # Пропущено локально и ещё не записано в Redis
+        self.pending = 0
+        # Оценка окна в Redis на момент последней синхронизации (все воркеры)
+        self.remote = 0
+        # remote получен из Redis: до этого воркер не знает, сколько клиент уже потратил на других воркерах
+        self.synced = False
+
+    def refill(self, policy: RateLimitPolicy, now: float):
+        self.tokens = min(policy.times, self.tokens + (now - self.updated_at) * policy.rate)
+        self.updated_at = now
+
+
+class RateLimiterStats:
+    """Счётчики лимитера воркера: решения по политикам и задержка Redis."""
+
+    def __init__(self):
+        self.policies = {
+            name: {"allowed": 0, "rejected_local": 0, "rejected_redis": 0, "fail_open": 0, "sync_checks": 0}
+            for name in RATE_LIMIT_POLICIES
+        }
+        self.redis_calls = 0
+        self.redis_errors = 0
+        self.redis_seconds = 0.0
+        self.redis_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.flushed = 0
+
+    def count(self, policy: RateLimitPolicy, name: str):
+        self.policies[policy.name][name] += 1
+
+    def observe_redis(self, seconds: float):
+        self.redis_calls += 1
+        self.redis_seconds += seconds
+        self.redis_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def snapshot(self) -> dict:
+        cumulative, histogram = 0, {}
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.redis_buckets):
+            cumulative += count
+            histogram["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {
+            "enabled": ENABLE_RATE_LIMITER,
+            "fail_open": RATE_LIMIT_FAIL_OPEN,
+            "redis_available": _redis_available(),
+            "clients": len(_states),
+            "policies": {
+                name: {"times": RATE_LIMIT_POLICIES[name].times, "seconds": RATE_LIMIT_POLICIES[name].seconds, **counters}
+                for name, counters in self.policies.items()
+            },
+            "redis": {
+                "calls": self.redis_calls,
+                "errors": self.redis_errors,
+                "avg": round(self.redis_seconds / self.redis_calls, 6) if self.redis_calls else 0.0,
+                "buckets": histogram,
+            },
+            "flushed": self.flushed,
+        }
+
+
+rate_limiter_stats = RateLimiterStats()
+# (политика, клиент) -> _ClientState, в порядке последнего обращения
+_states = OrderedDict()
+_redis_down_until = 0.0
+_flush_wakeup = asyncio.Event()
+_flusher_task: Optional[asyncio.Task] = None
+
+
+def _redis_available() -> bool:
+    return time.monotonic() >= _redis_down_until
+
+
+def _redis_failed(error: Exception):
+    global _redis_down_until
+    rate_limiter_stats.redis_errors += 1
+    _redis_down_until = time.monotonic() + RATE_LIMIT_REDIS_RETRY
+    logger.warning(f"Лимитер: Redis недоступен, {'пропускаем' if RATE_LIMIT_FAIL_OPEN else 'отказываем'} "
+                   f"{RATE_LIMIT_REDIS_RETRY:g} с: {error}")
+
+
+def client_identifier(request: Request) -> str:
+    # За nginx адрес клиента — первый в X-Forwarded-For
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def route_policy(request: Request) -> RateLimitPolicy:
+    route = request.scope.get("route")
+    path = route.path if route is not None else request.url.path
+    for prefix, name in ROUTE_POLICIES:
+        if path.startswith(prefix):
+            return RATE_LIMIT_POLICIES[name]
+    return RATE_LIMIT_POLICIES["default"]
+
+
+def _get_state(key: tuple, policy: RateLimitPolicy, now: float) -> _ClientState:
+    state = _states.get(key)
+    if state is None:
+        state = _states[key] = _ClientState(policy, now)
+        while len(_states) > RATE_LIMIT_LOCAL_SIZE:
+            _states.popitem(last=False)
+    else:
+        _states.move_to_end(key)
+    return state
+
+
+def _reject(retry_after: float):
+    raise HTTPException(
+        status_code=429, detail="Too Many Requests", headers={"Retry-After": str(max(math.ceil(retry_after), 1))}
+    )
+
+
+async def _check_redis(key: tuple, policy: RateLimitPolicy, recorded: int, requested: int) -> tuple:
+    start = time.perf_counter()
+    allowed, estimate, retry_ms = await _SLIDING_WINDOW_SCRIPT(
+        keys=[f"{RATE_LIMIT_KEY_PREFIX}{key[0]}:{key[1]}"],
+        args=[policy.times, policy.seconds * 1000, recorded, requested],
+    )
+    rate_limiter_stats.observe_redis(time.perf_counter() - start)
+    return bool(allowed), estimate, retry_ms / 1000
+
+
+async def rate_limit(request: Request):
+    """
+    Зависимость приложения: лимит по политике роута (ROUTE_POLICIES) на клиента.
+
+    Первый уровень — токен-бакет в памяти воркера: обычный запрос решается без сети,
+    а пропущенные запросы уходят в Redis пачками из фоновой задачи. Когда клиент
+    подбирается к лимиту (RATE_LIMIT_SYNC_THRESHOLD), каждый запрос проверяется
+    скриптом скользящего окна в Redis — он решает окончательно, с учётом всех воркеров.
+    Первый запрос нового для воркера клиента и все запросы строгих политик (policy.exact)
+    тоже идут в Redis: локальный запас считается от окна всех воркеров, а не от нуля.
+    """
+    policy = route_policy(request)
+    key = (policy.name, client_identifier(request))
+    now = time.monotonic()
+    state = _get_state(key, policy, now)
+
+    state.refill(policy, now)
+    if state.tokens < 1:
+        rate_limiter_stats.count(policy, "rejected_local")
+        _reject((1 - state.tokens) / policy.rate)
+    state.tokens -= 1
+
+    if (
+        not policy.exact and state.synced
+        and state.remote + state.pending + 1 < policy.times * RATE_LIMIT_SYNC_THRESHOLD
+    ):
+        state.pending += 1
+        if state.pending >= RATE_LIMIT_SYNC_BATCH:
+            _flush_wakeup.set()
+        rate_limiter_stats.count(policy, "allowed")
+        return
+
+    if not _redis_available():
+        _allow_without_redis(state, policy)
+        return
+
+    # Близко к лимиту, новый клиент или строгая политика: решает Redis. Несинхронизированные запросы передаются тем же вызовом
+    recorded, state.pending = state.pending, 0
+    rate_limiter_stats.count(policy, "sync_checks")
+    try:
+        allowed, state.remote, retry_after = await _check_redis(key, policy, recorded, 1)
+        state.synced = True
+    except RedisError as e:
+        state.pending += recorded
+        _redis_failed(e)
+        _allow_without_redis(state, policy)
+        return
+
+    if not allowed:
+        # Запрос не засчитан — возвращаем токен
+        state.tokens += 1
+        rate_limiter_stats.count(policy, "rejected_redis")
+        _reject(retry_after)
+    rate_limiter_stats.count(policy, "allowed")
+
+
+def _allow_without_redis(state: _ClientState, policy: RateLimitPolicy):
+    if not RATE_LIMIT_FAIL_OPEN:
+        state.tokens += 1
+        raise HTTPException(status_code=503, detail="Сервис временно недоступен", headers={"Retry-After": "1"})
+    # Запоминаем, чтобы записать в Redis, когда он вернётся; больше лимита копить незачем
+    state.pending = min(state.pending + 1, policy.times)
+    rate_limiter_stats.count(policy, "fail_open")
+    rate_limiter_stats.count(policy, "allowed")
+
+
+async def flush_pending():
+    """Записывает локально пропущенные запросы в Redis одним pipeline и обновляет оценки окон."""
+    now = time.monotonic()
+    batch = []
+    for key, state in list(_states.items()):
+        policy = RATE_LIMIT_POLICIES[key[0]]
+        if state.pending:
+            batch.append((key, state, policy, state.pending))
+            state.pending = 0
+        elif now - state.updated_at >= 2 * policy.seconds:
+            # Клиент не заходил дольше двух окон: его счётчики в Redis уже истекли
+            del _states[key]
+    if not batch or not _redis_available():
+        for _, state, _, recorded in batch:
+            state.pending += recorded
+        return
+
+    start = time.perf_counter()
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key, _, policy, recorded in batch:
+                await _SLIDING_WINDOW_SCRIPT(
+                    keys=[f"{RATE_LIMIT_KEY_PREFIX}{key[0]}:{key[1]}"],
+                    args=[policy.times, policy.seconds * 1000, recorded, 0],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+    except RedisError as e:
+        for _, state, _, recorded in batch:
+            state.pending += recorded
+        _redis_failed(e)
+        return
+
+    rate_limiter_stats.observe_redis(time.perf_counter() - start)
+    rate_limiter_stats.flushed += len(batch)
+    for (_, state, _, _), (_, estimate, _) in zip(batch, results):
+        state.remote = estimate
+        state.synced = True
+
+
+async def _run_flusher():
+    while True:
+        _flush_wakeup.clear()
+        try:
+            await flush_pending()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Синхронизация лимитера прервана: {e}")
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(_flush_wakeup.wait(), timeout=RATE_LIMIT_SYNC_INTERVAL)
+
+
+async def start_rate_limiter():
+    global _flusher_task
+    if ENABLE_RATE_LIMITER:
+        _flusher_task = asyncio.create_task(_run_flusher())
+
+
+async def stop_rate_limiter():
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _flusher_task
+        # Последние пропущенные запросы — в Redis, чтобы перезапуск не обнулял окна
+        with suppress(Exception):
+            await flush_pending()
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import logging
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from redis.exceptions import RedisError
+from sqlalchemy import delete, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import RefreshSession
+from security import REFRESH_TOKEN_EXPIRE_DAYS
+from utils.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Где хранятся refresh-сессии: redis (по умолчанию) или postgres. При недоступном Redis
+# сессии пишутся в refresh_sessions, а поиск всегда доходит до таблицы, если в Redis токена нет
+REFRESH_SESSION_STORE = os.getenv("REFRESH_SESSION_STORE", "redis").lower()
+REFRESH_SESSION_TTL = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+REFRESH_SESSION_KEY_PREFIX = "refresh:"
+
+
+def token_digest(token: str) -> str:
+    """Ключ сессии — sha256 токена: по утечке хранилища токен не восстановить."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def create_session(db: AsyncSession, user_id: int, token: str):
+    """
+    Сохраняет refresh-сессию; у пользователя их может быть сколько угодно (по одной на устройство).
+    В Postgres пишет через db — коммитит вызывающий.
+    """
+    digest = token_digest(token)
+    if REFRESH_SESSION_STORE == "redis":
+        key = f"{REFRESH_SESSION_KEY_PREFIX}{digest}"
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={"user_id": user_id, "created_at": datetime.now(timezone.utc).isoformat()})
+                pipe.expire(key, REFRESH_SESSION_TTL)
+                await pipe.execute()
+            return
+        except RedisError as e:
+            logger.warning(f"Redis недоступен, refresh-сессия сохраняется в Postgres: {e}")
+
+    # Истёкшие сессии пользователя чистим здесь же — по индексу user_id, без фоновых задач
+    await db.execute(
+        delete(RefreshSession).where(RefreshSession.user_id == user_id, RefreshSession.expires_at <= func.now())
+    )
+    await db.execute(insert(RefreshSession).values(
+        digest=digest,
+        user_id=user_id,
+        expires_at=func.now() + timedelta(seconds=REFRESH_SESSION_TTL),
+    ))
+
+
+async def take_session(db: AsyncSession, token: str) -> Optional[int]:
+    """
+    Забирает сессию (чтение и удаление одной операцией) и возвращает user_id или None.
+    Повторно предъявленный токен сессии уже не найдёт — ротация и выход без гонок между воркерами.
+    """
+    digest = token_digest(token)
+    if REFRESH_SESSION_STORE == "redis":
+        key = f"{REFRESH_SESSION_KEY_PREFIX}{digest}"
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.hget(key, "user_id")
+                pipe.delete(key)
+                user_id, _ = await pipe.execute()
+            if user_id is not None:
+                return int(user_id)
+        except RedisError as e:
+            logger.warning(f"Redis недоступен, refresh-сессия ищется в Postgres: {e}")
+
+    return await db.scalar(
+        delete(RefreshSession)
+        .where(RefreshSession.digest == digest, RefreshSession.expires_at > func.now())
+        .returning(RefreshSession.user_id)
+    )